@@ -2,7 +2,10 @@
 
 import argparse
 import logging
+import sys
 from .mirror_processor import MirrorProcessor
+from .mirror_daemon import MirrorDaemon
+from .repofile import RepoFile
 
 _ap = argparse.ArgumentParser(description="Create partail local debian mirror")
 _ap.add_argument("--log-level", dest="log_level", type=int, default=50, help="Logging level")
@@ -13,6 +16,22 @@ _ap.add_argument("--resign-key", dest="resign_key", default=None,
         help="Path to private GPG key for resigning Release and InRelease files")
 _ap.add_argument("--key-passphrase", dest="key_passphrase", default=None, 
         help="Passphrase for GPG key for resigning Release and InRelease files")
+_ap.add_argument("--profile", dest="profile", default=False, action='store_true',
+        help="Print wall and CPU time spent in every phase per mirror and distributive")
+_ap.add_argument("--profile-dir", dest="profile_dir", default=None,
+        help="Dump cProfile statistics and top tracemalloc allocation sites per phase to this folder")
+_ap.add_argument("--metrics-textfile", dest="metrics_textfile", default=None,
+        help="Write run metrics to this file in Prometheus node-exporter textfile format")
+_ap.add_argument("--metrics-json", dest="metrics_json", default=None,
+        help="Write run metrics to this file as JSON report")
+_ap.add_argument("--daemon", dest="daemon", default=False, action='store_true',
+        help="Run forever, synchronize distributives changed upstream only")
+_ap.add_argument("--poll-interval", dest="poll_interval", type=int, default=3600,
+        help="Default interval of polling upstream in daemon mode, in seconds")
+_ap.add_argument("--max-connections", dest="max_connections", type=int, default=4,
+        help="Upper limit of parallel downloads from every upstream host, adjusted by upstream health")
+_ap.add_argument("--download-buffer", dest="download_buffer", type=int, default=None,
+        help="Size of buffer downloaded data is written by, in bytes, 1M by default")
 _ag = _ap.parse_args()
 logging.basicConfig(
     format="%(asctime)s: %(levelname)s: %(filename)s: %(funcName)s: %(lineno)d: %(message)s", 
@@ -29,4 +48,16 @@ if _ag.resign_key:
     logging.info("Trying to imoprt python interface for gpgme")
     import gpg
 
-MirrorProcessor(args=_ag).process()
+_mp = MirrorProcessor(args=_ag)
+
+if _ag.daemon:
+    MirrorDaemon(processor=_mp, poll_interval=_ag.poll_interval).run()
+else:
+    try:
+        _mp.process()
+    finally:
+        RepoFile.close_sessions()
+
+if _ag.profile or _ag.profile_dir:
+    sys.stderr.write(_mp.get_profiler().format_report())
+    sys.stderr.write('\n')
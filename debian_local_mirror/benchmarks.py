@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+
+from .repofile_packages import RepoFilePackages, DebianizedVersion
+from .repofile_checksum import RepoFileWithCheckSum
+from .repofile import RepoFile
+from .packages_index import PackagesIndexCache
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from .trash_remover import TrashRemover
+from tempfile import TemporaryDirectory, NamedTemporaryFile
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+import threading
+import tracemalloc
+
+class MicroBenchmark(object):
+    """
+    Base class for single component benchmark.
+    Every run is: setup (not measured), run (measured), teardown (not measured)
+    """
+    name = None
+    unit = "entries"
+
+    def __init__(self, workdir):
+        """
+        Initialization
+        :param workdir: directory for generated inputs
+        :type workdir: str
+        """
+        self._workdir = workdir
+        self._scale = None
+
+    def setup(self, scale):
+        """
+        Generate inputs for scale given
+        :param scale: number of entries to generate
+        :type scale: int
+        """
+        self._scale = scale
+
+    def run(self):
+        """
+        Measured part, to be overriden in derived classes
+        """
+        raise NotImplementedError("Benchmark '%s' has no 'run' implemented" % self.name)
+
+    def teardown(self):
+        """
+        Cleanup after run, to be overriden in derived classes if needed
+        """
+        return
+
+    def _write_packages(self, path, count):
+        """
+        Generate 'Packages' index with 'count' records: three versions for each package name
+        :param path: path to write to
+        :type path: str
+        :param count: number of records
+        :type count: int
+        """
+        with open(path, mode='wt') as _fl_out:
+            for _i in range(count):
+                _name = "pkg%d" % (_i // 3)
+                _version = "%d:%d.%d-%d~deb12u%d" % (_i % 2, _i // 3 % 17, _i % 3, _i % 5, _i % 3)
+                _digest = hashlib.sha256(("%s_%s" % (_name, _version)).encode()).hexdigest()
+
+                if _i:
+                    _fl_out.write('\n')
+
+                _fl_out.write("Package: %s\n" % _name)
+                _fl_out.write("Version: %s\n" % _version)
+                _fl_out.write("Architecture: amd64\n")
+                _fl_out.write("Depends: libc6 (>= 2.36), pkg%d\n" % (_i // 7))
+                _fl_out.write("Filename: pool/main/p/%s/%s_%d_amd64.deb\n" % (_name, _name, _i))
+                _fl_out.write("Size: %d\n" % (1024 + _i))
+                _fl_out.write("MD5sum: %s\n" % _digest[:32])
+                _fl_out.write("SHA256: %s\n" % _digest)
+                _fl_out.write("Description: generated package number %d\n" % _i)
+
+    def _packages_file(self, name):
+        """
+        Return RepoFilePackages instance for uncompressed local file
+        """
+        return RepoFilePackages(
+                remote="http://benchmark.invalid",
+                local=self._workdir,
+                sub=[name],
+                extensions=[""])
+
+class ParseBenchmark(MicroBenchmark):
+    """
+    DebianMetaParser.parse over 'Packages' index
+    """
+    name = "parse"
+
+    def setup(self, scale):
+        super().setup(scale)
+        self._write_packages(os.path.join(self._workdir, "Packages"), scale)
+        self._pkgs = self._packages_file("Packages")
+
+    def run(self):
+        self._pkgs.open()
+        self._pkgs.close()
+
+class UnparseBenchmark(MicroBenchmark):
+    """
+    DebianMetaParser.unparse_and_write of parsed 'Packages' index
+    """
+    name = "unparse"
+
+    def setup(self, scale):
+        super().setup(scale)
+        self._write_packages(os.path.join(self._workdir, "Packages"), scale)
+        self._pkgs = self._packages_file("Packages")
+        self._pkgs.open()
+        self._pkgs.close()
+        self._out = NamedTemporaryFile(mode='w+t', dir=self._workdir)
+
+    def run(self):
+        self._pkgs.unparse_and_write(self._pkgs._data, self._out)
+        self._out.flush()
+
+    def teardown(self):
+        self._out.close()
+
+class StripVersionsBenchmark(MicroBenchmark):
+    """
+    RepoFilePackages.strip_versions: parse, prune and write back
+    """
+    name = "strip_versions"
+
+    def setup(self, scale):
+        super().setup(scale)
+        self._write_packages(os.path.join(self._workdir, "Packages"), scale)
+        self._pkgs = self._packages_file("Packages")
+
+    def run(self):
+        self._pkgs.strip_versions(versions=1)
+
+class DebianizedVersionBenchmark(MicroBenchmark):
+    """
+    DebianizedVersion construction and sorting
+    """
+    name = "debianized_version"
+
+    def setup(self, scale):
+        super().setup(scale)
+        _rnd = random.Random(scale)
+        self._versions = list(map(
+            lambda x: "%d:%d.%d.%d-%d~debian.12~bookworm" % (
+                _rnd.randint(0, 2), _rnd.randint(0, 30), _rnd.randint(0, 99), x, _rnd.randint(1, 9)),
+            range(scale)))
+
+    def run(self):
+        _versions = list(map(lambda x: DebianizedVersion(x), self._versions))
+        _versions.sort(reverse=True)
+
+class ChecksumBenchmark(MicroBenchmark):
+    """
+    RepoFileWithCheckSum._compare_checksums with all hash types listed
+    Scale is the file size in KiB
+    """
+    name = "compare_checksums"
+    unit = "KiB"
+
+    def setup(self, scale):
+        super().setup(scale)
+        _path = os.path.join(self._workdir, "pool.deb")
+        _hashes = {
+                "MD5Sum": hashlib.md5(),
+                "SHA1": hashlib.sha1(),
+                "SHA256": hashlib.sha256(),
+                "SHA512": hashlib.sha512()}
+        _chunk = os.urandom(1024)
+
+        with open(_path, mode='wb') as _fl_out:
+            for _i in range(scale):
+                _fl_out.write(_chunk)
+
+                for _hashobj in _hashes.values():
+                    _hashobj.update(_chunk)
+
+        _fdict = {"sub": ["pool.deb"], "Size": scale * 1024}
+
+        for _field, _hashobj in _hashes.items():
+            _fdict[_field] = _hashobj.hexdigest()
+
+        self._fl = RepoFileWithCheckSum(
+                remote="http://benchmark.invalid",
+                local=self._workdir,
+                fdict=_fdict)
+
+    def run(self):
+        if not self._fl._compare_checksums():
+            raise ValueError("Checksums of generated file do not match")
+
+class TrashRemoverBenchmark(MicroBenchmark):
+    """
+    TrashRemover.remove_trash over a tree, every tenth file is trash
+    Scale is the number of paths in the tree
+    """
+    name = "remove_trash"
+    unit = "paths"
+
+    def setup(self, scale):
+        super().setup(scale)
+        self._tree = TemporaryDirectory(dir=self._workdir)
+        self._legal = NamedTemporaryFile(mode='w+', dir=self._workdir)
+        _paths = list()
+
+        for _i in range(scale):
+            _dir = os.path.join(self._tree.name, "pool", "%02x" % (_i % 256), "%03x" % (_i // 256 % 4096))
+
+            if not os.path.isdir(_dir):
+                os.makedirs(_dir)
+
+            _path = os.path.join(_dir, "file_%d.deb" % _i)
+            open(_path, mode='wb').close()
+
+            if _i % 10:
+                _paths.append(_path)
+
+        # the order files are registered in while mirroring is not sorted
+        random.Random(scale).shuffle(_paths)
+        self._legal.write('\n'.join(_paths))
+        self._legal.flush()
+
+    def run(self):
+        self._remover = TrashRemover(self._legal, self._tree.name)
+        self._remover.remove_trash()
+
+    def teardown(self):
+        self._remover.get_temp().close()
+        self._tree.cleanup()
+
+class PackagesIndexBenchmark(MicroBenchmark):
+    """
+    RepoFilePackages.load_pool_records from binary index cached, all records accessed
+    """
+    name = "packages_index"
+
+    def setup(self, scale):
+        super().setup(scale)
+        _path = os.path.join(self._workdir, "Packages")
+        self._write_packages(_path, scale)
+        _hashobj = hashlib.sha256()
+
+        with open(_path, mode='rb') as _fl_in:
+            _hashobj.update(_fl_in.read())
+
+        self._pkgs = RepoFilePackages(
+                remote="http://benchmark.invalid",
+                local=self._workdir,
+                sub=["Packages"],
+                checksums={"": {"SHA256": _hashobj.hexdigest(), "Size": os.path.getsize(_path)}},
+                extensions=[""])
+        self._cache = PackagesIndexCache(os.path.join(self._workdir, "indices"))
+        self._pkgs.load_pool_records(self._cache)
+
+    def run(self):
+        for _record in self._pkgs.load_pool_records(self._cache):
+            _record.get("Filename")
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        return
+
+class DownloadBenchmark(MicroBenchmark):
+    """
+    RepoFile.download from local HTTP server: receiving and writing path
+    Scale is the file size in KiB
+    """
+    name = "download"
+    unit = "KiB"
+
+    def setup(self, scale):
+        super().setup(scale)
+        self._served = TemporaryDirectory(dir=self._workdir)
+
+        with open(os.path.join(self._served.name, "file.deb"), 'wb') as _fl_out:
+            for _i in range(scale):
+                _fl_out.write(os.urandom(1024))
+
+        self._server = HTTPServer(("127.0.0.1", 0), partial(_QuietHandler, directory=self._served.name))
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.start()
+        self._local = TemporaryDirectory(dir=self._workdir)
+
+    def run(self):
+        RepoFile(
+            remote="http://127.0.0.1:%d" % self._server.server_address[1],
+            local=self._local.name,
+            sub=["file.deb"],
+            extensions=[""]).download()
+
+    def teardown(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        RepoFile.close_sessions()
+        self._local.cleanup()
+        self._served.cleanup()
+
+class BenchmarkRunner(object):
+    """
+    Run benchmarks over several scales, record wall time and peak memory
+    """
+    benchmarks = [
+            ParseBenchmark,
+            UnparseBenchmark,
+            StripVersionsBenchmark,
+            DebianizedVersionBenchmark,
+            ChecksumBenchmark,
+            TrashRemoverBenchmark,
+            DownloadBenchmark,
+            PackagesIndexBenchmark]
+
+    def __init__(self, scales, components=None, max_seconds=None, memory=True):
+        """
+        Initialization
+        :param scales: list of scales to run every benchmark with
+        :type scales: list(int)
+        :param components: names of benchmarks to run, all if not given
+        :type components: list(str)
+        :param max_seconds: skip larger scales for a component once previous scale took longer
+        :type max_seconds: float
+        :param memory: do a second run with tracemalloc to record peak memory
+        :type memory: bool
+        """
+        self._scales = sorted(scales)
+        self._components = components
+        self._max_seconds = max_seconds
+        self._memory = memory
+
+        if self._components:
+            _unknown = list(filter(lambda x: x not in map(lambda y: y.name, self.benchmarks), self._components))
+
+            if _unknown:
+                raise ValueError("Unknown benchmarks: '%s'" % ', '.join(_unknown))
+
+    def _measure(self, benchmark, scale, trace):
+        """
+        Single measured run
+        :return: tuple (wall time in seconds, peak memory in bytes or None)
+        """
+        benchmark.setup(scale)
+
+        try:
+            if trace:
+                tracemalloc.start()
+
+            _start = time.perf_counter()
+            benchmark.run()
+            _wall = time.perf_counter() - _start
+            _peak = None
+
+            if trace:
+                _peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        finally:
+            benchmark.teardown()
+
+        return _wall, _peak
+
+    def run(self):
+        """
+        Run all benchmarks requested
+        :return: list of result dictionaries
+        """
+        _results = list()
+
+        for _bench_class in self.benchmarks:
+            if self._components and _bench_class.name not in self._components:
+                continue
+
+            _skip_reason = None
+
+            for _scale in self._scales:
+                _result = {"component": _bench_class.name, "scale": _scale, "unit": _bench_class.unit}
+                _results.append(_result)
+
+                if _skip_reason:
+                    _result["skipped"] = _skip_reason
+                    continue
+
+                logging.info("Running '%s' with scale %d" % (_bench_class.name, _scale))
+
+                with TemporaryDirectory(prefix="debian_local_mirror_bench_") as _workdir:
+                    _bench = _bench_class(_workdir)
+                    _result["wall"], _ = self._measure(_bench, _scale, trace=False)
+
+                    if self._memory:
+                        _, _result["peak_memory"] = self._measure(_bench, _scale, trace=True)
+
+                if self._max_seconds and _result["wall"] > self._max_seconds:
+                    _skip_reason = "scale %d took %.3f s" % (_scale, _result["wall"])
+
+        return _results
+
+def _format_table(results):
+    """
+    Make human-readable table of results
+    :param results: list of result dictionaries
+    :return: str
+    """
+    _lines = ["%-20s %12s %-8s %12s %14s" % ("component", "scale", "unit", "wall, s", "peak mem, KiB")]
+
+    for _result in results:
+        if "skipped" in _result:
+            _lines.append("%-20s %12d %-8s skipped: %s" % (
+                _result["component"], _result["scale"], _result["unit"], _result["skipped"]))
+            continue
+
+        _peak = _result.get("peak_memory")
+        _lines.append("%-20s %12d %-8s %12.4f %14s" % (
+            _result["component"], _result["scale"], _result["unit"], _result["wall"],
+            "-" if _peak is None else "%d" % (_peak // 1024)))
+
+    return '\n'.join(_lines)
+
+def main():
+    """
+    Run micro-benchmarks and print results
+    """
+    _ap = argparse.ArgumentParser(description="Micro-benchmarks for hot components of debian local mirror")
+    _ap.add_argument("--log-level", dest="log_level", type=int, default=50)
+    _ap.add_argument("--scales", dest="scales", default="1000,100000,1000000",
+            help="Comma-separated list of input sizes")
+    _ap.add_argument("--components", dest="components", default=None,
+            help="Comma-separated list of benchmarks to run: %s" %
+                ', '.join(map(lambda x: x.name, BenchmarkRunner.benchmarks)))
+    _ap.add_argument("--max-seconds", dest="max_seconds", type=float, default=None,
+            help="Skip larger scales of a component once one scale took longer than this")
+    _ap.add_argument("--no-memory", dest="memory", default=True, action="store_false",
+            help="Do not make the second tracemalloc run to record peak memory")
+    _ap.add_argument("-o", "--output", dest="out_fl", default=None, help="Write results as JSON to this file")
+    _ag = _ap.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s: %(levelname)s: %(filename)s: %(funcName)s: %(lineno)d: %(message)s",
+        level=_ag.log_level)
+
+    _runner = BenchmarkRunner(
+            scales=list(map(int, _ag.scales.split(','))),
+            components=_ag.components.split(',') if _ag.components else None,
+            max_seconds=_ag.max_seconds,
+            memory=_ag.memory)
+    _results = _runner.run()
+    print(_format_table(_results))
+
+    if _ag.out_fl:
+        with open(os.path.abspath(_ag.out_fl), 'w') as _fl_out:
+            json.dump(_results, _fl_out, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+from .mirror_bundle import BundleExporter, BundleImporter
+import argparse
+import logging
+import sys
+
+def main():
+    """
+    Replication of a mirror to disconnected networks by bundles of changes
+    """
+    _ap = argparse.ArgumentParser(description="Export and import changes of local debian mirror as tar bundles")
+    _ap.add_argument("--log-level", dest="log_level", type=int, default=50, help="Logging level")
+    _ap.add_argument("-d", "--destination", dest="destination", required=True, help="Mirror root")
+    _sp = _ap.add_subparsers(dest="command")
+    _sp.required = True
+    _export = _sp.add_parser("export", help="Write files changed since the last export and list of removed ones")
+    _export.add_argument("-o", "--output", dest="out_fl", required=True,
+            help="Bundle path, compression extension is appended")
+    _export.add_argument("-z", "--compression", dest="compression", default=None,
+            help="Comma-separated list of compressions to write bundles with at once: .gz, .xz, .bz2")
+    _export.add_argument("--full", dest="full", default=False, action='store_true',
+            help="Export whole mirror regardless of previous exports")
+    _import = _sp.add_parser("import", help="Apply bundle to mirror copy")
+    _import.add_argument("-i", "--input", dest="in_fl", required=True, help="Bundle path")
+    _import.add_argument("--force", dest="force", default=False, action='store_true',
+            help="Apply even if previous bundle has not been applied")
+    _ag = _ap.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s: %(levelname)s: %(filename)s: %(funcName)s: %(lineno)d: %(message)s",
+        level=_ag.log_level)
+
+    logging.info("Log level is set to %d" % _ag.log_level)
+
+    if _ag.command == "export":
+        _header = BundleExporter(_ag.destination).export(
+                _ag.out_fl,
+                compression=_ag.compression.split(',') if _ag.compression else None,
+                full=_ag.full)
+    else:
+        _header = BundleImporter(_ag.destination).import_bundle(_ag.in_fl, force=_ag.force)
+
+    print("%s: bundle %s, %d files, %d removed" % (
+        _ag.destination, _header.get("id"), _header.get("files"), len(_header.get("removed"))))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
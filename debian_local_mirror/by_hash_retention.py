@@ -0,0 +1,96 @@
+import logging
+import os
+import posixpath
+from .mirror_state import MirrorState
+
+class ByHashRetention(object):
+    """
+    'by-hash' objects of indices superseded upstream, kept for a number of generations,
+    so clients having fetched previous Release are able to finish their update.
+    Every index is tracked by its path with its 'by-hash' objects, the newest generation first.
+    Objects not retained any longer are not listed as legal, they are removed with other trash at once.
+    """
+    _state_name = "by-hash.json"
+
+    def __init__(self, destination, generations=2):
+        """
+        Initialization
+        :param destination: mirror root
+        :type destination: str
+        :param generations: number of superseded generations to keep
+        :type generations: int
+        """
+        self._destination = os.path.abspath(destination)
+        self._state = MirrorState(self._destination)
+        self._generations = generations
+        self._data = self._state.load(self._state_name, dict())
+        self._touched = set()
+
+    def _get_relpath(self, path):
+        return posixpath.sep.join(os.path.relpath(path, self._destination).split(os.path.sep))
+
+    def _get_path(self, relpath):
+        return os.path.join(self._destination, *relpath.split(posixpath.sep))
+
+    def _get_distributive(self, relpath):
+        """
+        Distributive an index belongs to: 'dists/<distributive>/...'
+        """
+        return relpath.split(posixpath.sep)[1]
+
+    def update(self, local, links):
+        """
+        Register 'by-hash' objects of an index synchronized
+        :param local: local path of the index
+        :type local: str
+        :param links: local paths of its current 'by-hash' objects
+        :type links: list(str)
+        :return: local paths of superseded 'by-hash' objects still retained
+        """
+        _key = self._get_relpath(local)
+        _current = sorted(map(self._get_relpath, links))
+        _history = self._data.get(_key) or list()
+        self._touched.add(_key)
+
+        if not _history or _history[0] != _current:
+            logging.debug("New generation of 'by-hash' objects for '%s'" % local)
+            _history.insert(0, _current)
+
+        _history = _history[:self._generations + 1]
+        self._data[_key] = _history
+        return self._get_retained(_history)
+
+    def _get_retained(self, history):
+        """
+        Paths of superseded objects existing
+        :param history: generations of an index, the newest first
+        :type history: list(list(str))
+        """
+        _current = set(history[0]) if history else set()
+        _result = set()
+
+        for _generation in history[1:]:
+            _result.update(filter(lambda x: x not in _current, _generation))
+
+        # symbolic links point to the current index, they keep nothing
+        return list(filter(lambda x: os.path.isfile(x) and not os.path.islink(x), map(self._get_path, sorted(_result))))
+
+    def get_retained(self):
+        """
+        Return local paths of all superseded 'by-hash' objects retained
+        """
+        _result = list()
+
+        for _history in self._data.values():
+            _result += self._get_retained(_history)
+
+        return _result
+
+    def save(self):
+        """
+        Store generations. Indices no longer listed by distributives updated are forgotten.
+        """
+        _distrs = set(map(self._get_distributive, self._touched))
+        self._data = dict(filter(lambda x: x[0] in self._touched or self._get_distributive(x[0]) not in _distrs,
+            self._data.items()))
+        self._state.save(self._state_name, self._data)
@@ -0,0 +1,27 @@
+from .release_cache import ReleaseCache
+
+class ChecksumCache(ReleaseCache):
+    """
+    Verified checksums cache for long-living processes.
+    Local path => checksums verified, invalidated when file stat signature changes,
+    so unchanged files are not read again on every synchronization cycle.
+    """
+    def is_verified(self, path, signature, hashes):
+        """
+        Check if all checksums given have been verified for the file
+        :param path: local path
+        :type path: str
+        :param signature: stat signature taken by 'signature' method
+        :type signature: tuple
+        :param hashes: checksum type (lowercase) => checksum
+        :type hashes: dict
+        """
+        if not hashes:
+            return False
+
+        _verified = self.get(path, signature)
+
+        if not _verified:
+            return False
+
+        return all(map(lambda x: _verified.get(x[0]) == x[1], hashes.items()))
@@ -0,0 +1,191 @@
+import email.utils
+import logging
+import threading
+import time
+
+class HostController(object):
+    """
+    Upstream host health tracking.
+    Requests in flight are limited AIMD-style: the limit grows by one per limit successful requests
+    and is halved on server errors, throttling and timeouts.
+    Timeouts are derived from observed latency and throughput, 'Retry-After' is respected
+    by blocking new requests to the host, not by sleeping in the failed one.
+    """
+    _controllers = dict()
+    _controllers_lock = threading.Lock()
+    _max_concurrency = 4
+
+    # status codes meaning the host is overloaded or broken, request is to be retried
+    retry_statuses = [429, 500, 501, 502, 503, 504, 505, 506, 507, 509, 510]
+
+    @classmethod
+    def get(cls, host):
+        """
+        Return controller for a host, shared by all threads
+        :param host: host name
+        :type host: str
+        """
+        with HostController._controllers_lock:
+            _controller = HostController._controllers.get(host)
+
+            if not _controller:
+                _controller = HostController(host, max_concurrency=HostController._max_concurrency)
+                HostController._controllers[host] = _controller
+
+            return _controller
+
+    @classmethod
+    def set_max_concurrency(cls, value):
+        """
+        Set upper limit of requests in flight for every host
+        :param value: limit
+        :type value: int
+        """
+        if value < 1:
+            raise ValueError("Concurrency should be positive, not %d" % value)
+
+        with HostController._controllers_lock:
+            HostController._max_concurrency = value
+
+            for _controller in HostController._controllers.values():
+                _controller._max = value
+
+    def __init__(self, host, max_concurrency=4, initial=2):
+        """
+        Initialization
+        :param host: host name
+        :type host: str
+        :param max_concurrency: upper limit of requests in flight
+        :type max_concurrency: int
+        :param initial: initial limit of requests in flight
+        :type initial: int
+        """
+        self._host = host
+        self._max = max_concurrency
+        self._limit = float(min(initial, max_concurrency))
+        self._in_flight = 0
+        self._blocked_until = 0.0
+        self._failures = 0
+        self._latency = None
+        self._throughput = None
+        self._cond = threading.Condition()
+
+    def get_limit(self):
+        return int(self._limit)
+
+    def acquire(self):
+        """
+        Wait for a slot to send request to the host
+        """
+        with self._cond:
+            while True:
+                _wait = self._blocked_until - time.monotonic()
+
+                if _wait <= 0 and self._in_flight < int(self._limit):
+                    break
+
+                self._cond.wait(_wait if _wait > 0 else None)
+
+            self._in_flight += 1
+
+    def release(self):
+        """
+        Return a slot taken by 'acquire'
+        """
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _average(self, current, value):
+        return value if current is None else 0.8 * current + 0.2 * value
+
+    def on_success(self, latency, size=0, duration=0.0):
+        """
+        Account successful request
+        :param latency: time to response headers, in seconds
+        :type latency: float
+        :param size: bytes received
+        :type size: int
+        :param duration: time of receiving body, in seconds
+        :type duration: float
+        """
+        with self._cond:
+            self._latency = self._average(self._latency, latency)
+
+            # small files tell nothing about throughput
+            if size >= 64 * 1024 and duration > 0:
+                self._throughput = self._average(self._throughput, size / duration)
+
+            self._failures = 0
+            self._limit = min(float(self._max), self._limit + 1.0 / self._limit)
+            self._cond.notify_all()
+
+    def on_failure(self, retry_after=None):
+        """
+        Account failed request: server error, throttling or timeout
+        :param retry_after: value of 'Retry-After' header if given
+        :type retry_after: str
+        :return: seconds the host is blocked for
+        """
+        _delay = self._parse_retry_after(retry_after)
+
+        with self._cond:
+            self._failures += 1
+            self._limit = max(1.0, self._limit / 2)
+
+            if _delay is None:
+                _delay = min(60.0, 2.0 ** (self._failures - 1))
+
+            self._blocked_until = max(self._blocked_until, time.monotonic() + _delay)
+
+        logging.warning("Upstream '%s' failure %d: concurrency limit %d, blocked for %.1f seconds" %
+                (self._host, self._failures, int(self._limit), _delay))
+        return _delay
+
+    def _parse_retry_after(self, value):
+        """
+        Convert 'Retry-After' header to seconds
+        :param value: number of seconds or HTTP date
+        :type value: str
+        """
+        if not value:
+            return None
+
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            logging.debug("Unable to parse 'Retry-After': '%s'" % value)
+            return None
+
+    def get_timeouts(self):
+        """
+        Return (connect, read) timeouts for a request, read timeout is the longest pause between data
+        """
+        with self._cond:
+            _latency = self._latency
+
+        if _latency is None:
+            return (30.0, 30.0)
+
+        return (min(30.0, max(5.0, 4 * _latency)), min(60.0, max(10.0, 8 * _latency)))
+
+    def get_deadline(self, size):
+        """
+        Return the longest acceptable duration of receiving a file of size given
+        :param size: expected size, in bytes
+        :type size: int
+        :return: seconds or None if nothing known yet
+        """
+        with self._cond:
+            _throughput = self._throughput
+
+        if not size or not _throughput:
+            return None
+
+        # throughput may drop much for a while because of other downloads in parallel
+        return 60.0 + 10 * size / _throughput
@@ -0,0 +1,91 @@
+import logging
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl request to share extents of one file with another, Linux only
+_FICLONE = 0x40049409
+
+methods = ["hardlink", "reflink", "copy"]
+
+def _hardlink(src, dst):
+    os.link(src, dst)
+
+def _reflink(src, dst):
+    if not fcntl:
+        raise OSError("Reflinks are not supported on this platform")
+
+    with open(src, "rb") as _fl_in, open(dst, "wb") as _fl_out:
+        fcntl.ioctl(_fl_out.fileno(), _FICLONE, _fl_in.fileno())
+
+def _copy_range(fd_in, fd_out, offset, count):
+    """
+    Copy data in kernel: copy_file_range (server-side copy on NFS 4.2, reflink on some filesystems),
+    then sendfile
+    :return: bytes copied, less than requested if both are not supported
+    """
+    _done = 0
+
+    for _call in [getattr(os, "copy_file_range", None), getattr(os, "sendfile", None)]:
+        if not _call:
+            continue
+
+        try:
+            # sendfile writes at current position, copy_file_range does not move it
+            os.lseek(fd_out, offset + _done, os.SEEK_SET)
+
+            while _done < count:
+                if _call is os.sendfile:
+                    _copied = os.sendfile(fd_out, fd_in, offset + _done, count - _done)
+                else:
+                    _copied = _call(fd_in, fd_out, count - _done, offset + _done, offset + _done)
+
+                if not _copied:
+                    break
+
+                _done += _copied
+
+            return _done
+        except OSError as _e:
+            logging.debug("'%s' is not usable: %s" % (_call.__name__, _e))
+
+    return _done
+
+def _copy(src, dst):
+    with open(src, "rb") as _fl_in, open(dst, "wb") as _fl_out:
+        _size = os.fstat(_fl_in.fileno()).st_size
+        _done = _copy_range(_fl_in.fileno(), _fl_out.fileno(), 0, _size)
+
+        if _done < _size:
+            _fl_in.seek(_done)
+            _fl_out.seek(_done)
+            shutil.copyfileobj(_fl_in, _fl_out, 1024 * 1024)
+
+def transfer(src, dst, allowed=None):
+    """
+    Put a local file to another place without network, the cheapest way possible:
+    hardlink (same filesystem), reflink (copy-on-write filesystems), copy
+    :param src: existing file
+    :type src: str
+    :param dst: destination path, should not exist
+    :type dst: str
+    :param allowed: methods allowed, in order of preference, all by default
+    :type allowed: list(str)
+    :return: method used or None if all failed
+    """
+    for _method in allowed or methods:
+        try:
+            {"hardlink": _hardlink, "reflink": _reflink, "copy": _copy}[_method](src, dst)
+            logging.debug("'%s' ==> '%s': %s" % (src, dst, _method))
+            return _method
+        except OSError as _e:
+            logging.debug("Unable to %s '%s' to '%s': %s" % (_method, src, dst, _e))
+
+            if os.path.lexists(dst):
+                os.remove(dst)
+
+    return None
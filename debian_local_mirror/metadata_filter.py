@@ -0,0 +1,90 @@
+import fnmatch
+import logging
+import posixpath
+import re
+
+class MetadataFilter(object):
+    """
+    Select metadata files listed in Release to drop by include / exclude rules.
+    'Packages' and per-component 'Release' files are never dropped since pool synchronization needs them.
+    """
+    _rule_keys = ["patterns", "types"]
+    _protected_kinds = ["Packages", "Release"]
+
+    def __init__(self, cfg):
+        """
+        Initialization
+        :param cfg: filter configuration:
+            {"include": rules, "exclude": rules, "languages": [languages]},
+            rules: {"patterns": [globs over path relative to Release], "types": [kinds]},
+            kinds are: 'Contents', 'Translation', 'dep11', 'debian-installer', 'cnf' etc.
+        :type cfg: dict
+        """
+        self._include = cfg.get("include") or dict()
+        self._exclude = cfg.get("exclude") or dict()
+        self._languages = cfg.get("languages")
+        self._patterns_re = dict()
+
+        for _key, _rules in [("include", self._include), ("exclude", self._exclude)]:
+            if _rules.get("patterns"):
+                self._patterns_re[_key] = re.compile(
+                        '|'.join(map(lambda x: "(?:%s)" % fnmatch.translate(x), _rules.get("patterns"))))
+
+    def _select(self, key, index):
+        """
+        Return files matching rules
+        :param key: 'include' or 'exclude'
+        :type key: str
+        :param index: files listed in Release
+        :type index: ReleaseIndex
+        :return: set of file names
+        """
+        _rules = self._include if key == "include" else self._exclude
+        _result = set()
+
+        for _kind in _rules.get("types") or list():
+            _result.update(index.select(kind=_kind))
+
+        _patterns_re = self._patterns_re.get(key)
+
+        if _patterns_re:
+            _result.update(filter(lambda x: _patterns_re.match(x), index.filenames()))
+
+        return _result
+
+    def _get_language(self, filename):
+        """
+        Return language of 'Translation' file: 'main/i18n/Translation-pt_BR.bz2' => 'pt_BR'
+        """
+        return posixpath.basename(filename).split('.')[0].split('-', 1)[-1]
+
+    def _is_language_dropped(self, filename):
+        """
+        Check if language of 'Translation' file is not wanted,
+        language without territory ('pt') keeps all its variants ('pt_BR', 'pt_PT')
+        """
+        _language = self._get_language(filename)
+        return _language not in self._languages and _language.split('_')[0] not in self._languages
+
+    def get_dropped(self, index):
+        """
+        Return files to drop
+        :param index: files listed in Release
+        :type index: ReleaseIndex
+        :return: set of file names
+        """
+        _result = set()
+
+        if self._include.get("types") or self._include.get("patterns"):
+            _result.update(set(index.filenames()) - self._select("include", index))
+
+        _result.update(self._select("exclude", index))
+
+        if self._languages is not None:
+            _result.update(filter(self._is_language_dropped, index.select(kind="Translation")))
+
+        for _kind in self._protected_kinds:
+            _result.difference_update(index.select(kind=_kind))
+
+        logging.debug("Metadata files to drop: %d of %d" % (len(_result), len(index)))
+        return _result
@@ -57,9 +57,12 @@ class DebianMetaParser(object):
         
         raise TypeError("Result is not a list and not a dict, this is unexpected")
 
-    def parse(self):
+    def parse(self, stop_keys=None):
         """
         Try to parse debian metadata file to dictionary
+        :param stop_keys: stop parsing when any of these keys is found in the first paragraph,
+            the key itself is not included in result
+        :type stop_keys: list(str)
         """
 
         if not (self._fd):
@@ -137,6 +140,10 @@ class DebianMetaParser(object):
             _key, _value = _ln.split(":", 1)
             _key = _key.strip()
             _value = _value.strip()
+
+            if stop_keys and _key in stop_keys and isinstance(_result, dict):
+                logging.debug("Stop key '%s' found, parsing finished" % _key)
+                break
             logging.debug("Got pair: '%s' = '%s'" % (_key, _value))
 
         return _result
@@ -176,26 +183,39 @@ class DebianMetaParser(object):
             logging.debug("Unparsing key value for '%s'" % _key)
             _value = data_dict.get(_key)
 
+            if _key in self._checksums_fields and not isinstance(_value, str):
+                # any iterable of checksum records
+                self._unparse_and_write_checksums(_key, _value, fl_out)
+                continue
+
             if not isinstance(_value, list):
                 # check if value is multiline
                 fl_out.write("%s: %s\n" % (_key, _value))
                 continue
 
-            if _key not in self._checksums_fields:
-                _list_sep = self._list_sep
+            _list_sep = self._list_sep
 
-                if _key in self._empty_keys:
-                    _list_sep = "\n%s" % self._list_sep
+            if _key in self._empty_keys:
+                _list_sep = "\n%s" % self._list_sep
 
-                fl_out.write("%s: %s\n" %(_key, _list_sep.join(_value)))
-                continue
+            fl_out.write("%s: %s\n" %(_key, _list_sep.join(_value)))
 
-            fl_out.write("%s:\n" % _key)
+    def _unparse_and_write_checksums(self, key, value, fl_out):
+        """
+        do unparse a checksums field
+        :param key: field name
+        :type key: str
+        :param value: checksum records: {'hash', 'Size', 'Filename'}
+        :type value: iterable of dict
+        :param fl_out: file to write to
+        :type fl_out: file-like opbect
+        """
+        fl_out.write("%s:\n" % key)
 
-            for _vl in _value:
-                _size = "%d" % _vl.get("Size")
-                
-                while len(_size) < 10:
-                    _size = " %s" % _size
+        for _vl in value:
+            _size = "%d" % _vl.get("Size")
+            
+            while len(_size) < 10:
+                _size = " %s" % _size
 
-                fl_out.write(" %s %s %s\n" % (_vl.get("hash"), _size, _vl.get("Filename")))
+            fl_out.write(" %s %s %s\n" % (_vl.get("hash"), _size, _vl.get("Filename")))
@@ -0,0 +1,358 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import posixpath
+import shutil
+import tarfile
+from tempfile import NamedTemporaryFile
+from .mirror_state import MirrorState
+from .mirror_shards import publish_distributives
+from .parallel_compressor import ParallelCompressor
+from .trash_remover import TrashRemover
+
+class BundleError(Exception):
+    pass
+
+def is_metadata(relpath):
+    """
+    Check if a path belongs to distributive metadata, published by distributive at once
+    :param relpath: path relative to mirror root
+    :type relpath: str
+    """
+    _parts = relpath.split(posixpath.sep)
+    return _parts[0] == "dists" and len(_parts) > 2
+
+def get_manifest(destination):
+    """
+    Make manifest of a mirror tree, state folder excluded
+    :param destination: mirror root
+    :type destination: str
+    :return: relative path => [size, mtime in ns] for files, ["link", target] for symbolic links
+    """
+    _result = dict()
+    _state = MirrorState(destination).get_path()
+
+    for _root, _dirs, _names in os.walk(destination):
+        if _root == os.path.abspath(destination):
+            _dirs[:] = list(filter(lambda x: os.path.join(_root, x) != _state, _dirs))
+
+        for _name in _dirs + _names:
+            _path = os.path.join(_root, _name)
+            _relpath = posixpath.sep.join(os.path.relpath(_path, destination).split(os.path.sep))
+
+            if os.path.islink(_path):
+                _result[_relpath] = ["link", os.readlink(_path)]
+            elif os.path.isfile(_path):
+                _stat = os.stat(_path)
+                _result[_relpath] = [_stat.st_size, _stat.st_mtime_ns]
+
+    return _result
+
+def get_release_hashes(destination, paths=None):
+    """
+    SHA256 of all Release and InRelease files of a mirror
+    :param destination: mirror root
+    :type destination: str
+    :param paths: relative paths of files to take into account, all files of the tree if not given
+    :type paths: list(str)
+    :return: relative path => SHA256
+    """
+    _result = dict()
+
+    if paths is None:
+        paths = get_manifest(destination).keys()
+
+    for _relpath in paths:
+        _parts = _relpath.split(posixpath.sep)
+
+        if len(_parts) != 3 or _parts[0] != "dists" or _parts[2] not in ["Release", "InRelease"]:
+            continue
+
+        _hashobj = hashlib.sha256()
+
+        with open(os.path.join(destination, *_parts), "rb") as _fl_in:
+            for _chunk in iter(lambda: _fl_in.read(1024 * 1024), b''):
+                _hashobj.update(_chunk)
+
+        _result[_relpath] = _hashobj.hexdigest()
+
+    return _result
+
+class BundleExporter(object):
+    """
+    Export of mirror changes since the last export as tar archive:
+    bundle header, pool and other files added or changed, then metadata.
+    Manifest of the tree exported is kept as watermark in mirror state folder.
+    """
+    watermark = "export.json"
+
+    def __init__(self, destination):
+        """
+        Initialization
+        :param destination: mirror root
+        :type destination: str
+        """
+        self._destination = os.path.abspath(destination)
+        self._state = MirrorState(self._destination)
+
+    def export(self, path, compression=None, full=False):
+        """
+        Write bundle
+        :param path: bundle path, without compression extension
+        :type path: str
+        :param compression: extensions of compressed bundles to write at once: '.gz', '.xz', '.bz2',
+            uncompressed if not given
+        :type compression: list(str)
+        :param full: export whole tree regardless of watermark
+        :type full: bool
+        :return: bundle header
+        """
+        _previous = dict() if full else self._state.load(self.watermark, dict())
+        _previous_manifest = _previous.get("manifest") or dict()
+        _manifest = get_manifest(self._destination)
+        _changed = sorted(filter(lambda x: _previous_manifest.get(x) != _manifest.get(x), _manifest.keys()),
+                # metadata goes last, so pool files are in place when metadata is applied
+                key=lambda x: (is_metadata(x), x))
+        _header = {
+                "id": hashlib.sha256(json.dumps(_manifest, sort_keys=True).encode("utf-8")).hexdigest(),
+                "base": _previous.get("id"),
+                "full": not bool(_previous),
+                "removed": sorted(filter(lambda x: x not in _manifest, _previous_manifest.keys())),
+                "releases": get_release_hashes(self._destination, _manifest.keys()),
+                "files": len(_changed)}
+        logging.info("Exporting %d files changed, %d removed since '%s'" %
+                (len(_changed), len(_header.get("removed")), _header.get("base")))
+
+        _compressor = ParallelCompressor(
+                outputs=dict(map(lambda x: (x, path + x), compression or [""])),
+                cs_types=list(),
+                encoding=None)
+
+        try:
+            with tarfile.open(fileobj=_compressor, mode="w|", format=tarfile.PAX_FORMAT) as _tar:
+                _data = json.dumps(_header).encode("utf-8")
+                _info = tarfile.TarInfo(BundleImporter.header)
+                _info.size = len(_data)
+                _tar.addfile(_info, io.BytesIO(_data))
+
+                for _relpath in _changed:
+                    _tar.add(os.path.join(self._destination, *_relpath.split(posixpath.sep)),
+                            arcname=_relpath, recursive=False)
+        except:
+            _compressor.abort()
+            raise
+
+        _compressor.close()
+        self._state.save(self.watermark, {"id": _header.get("id"), "manifest": _manifest})
+        return _header
+
+class BundleImporter(object):
+    """
+    Apply bundle made by BundleExporter to a mirror copy.
+    Pool files are put in place first, then every distributive metadata is replaced at once,
+    removed files are deleted last, so clients always see indices consistent with the pool.
+    Identifier of bundle applied is kept in mirror state folder, bundles are to be applied in order.
+    """
+    header = "bundle.json"
+    watermark = "import.json"
+
+    def __init__(self, destination):
+        """
+        Initialization
+        :param destination: mirror root
+        :type destination: str
+        """
+        self._destination = os.path.abspath(destination)
+        self._state = MirrorState(self._destination)
+
+    def _get_target(self, relpath):
+        """
+        Local path for a path in bundle, paths outside mirror are refused
+        :param relpath: path in bundle
+        :type relpath: str
+        """
+        _target = os.path.normpath(os.path.join(self._destination, *relpath.split(posixpath.sep)))
+
+        if posixpath.isabs(relpath) or not _target.startswith(self._destination + os.path.sep) \
+                or (_target + os.path.sep).startswith(self._state.get_path() + os.path.sep):
+            raise BundleError("Path '%s' is not allowed in bundle" % relpath)
+
+        return _target
+
+    def _extract(self, tar, staging):
+        """
+        Extract bundle members to staging folder
+        :param tar: bundle opened, header read
+        :type tar: tarfile.TarFile
+        :param staging: staging folder
+        :type staging: str
+        :return: relative paths extracted
+        """
+        _result = list()
+
+        for _member in tar:
+            # members read already are iterated again
+            if _member.name == self.header:
+                continue
+
+            _target = self._get_target(_member.name)
+
+            if _member.issym():
+                self._get_target(posixpath.normpath(posixpath.join(posixpath.dirname(_member.name),
+                    _member.linkname)))
+            elif _member.islnk():
+                # 'by-hash' objects are hard links to indices, the member linked is extracted already
+                _linked = os.path.join(staging, os.path.relpath(self._get_target(_member.linkname), self._destination))
+            elif not _member.isfile():
+                raise BundleError("Member '%s' of unsupported type in bundle" % _member.name)
+
+            _relpath = os.path.relpath(_target, self._destination)
+            _staged = os.path.join(staging, _relpath)
+            os.makedirs(os.path.dirname(_staged), exist_ok=True)
+
+            if _member.issym():
+                os.symlink(_member.linkname, _staged)
+            elif _member.islnk():
+                os.link(_linked, _staged)
+            else:
+                with tar.extractfile(_member) as _fl_in, open(_staged, "wb") as _fl_out:
+                    shutil.copyfileobj(_fl_in, _fl_out, 1024 * 1024)
+
+                os.utime(_staged, (_member.mtime, _member.mtime))
+
+            _result.append(posixpath.sep.join(_relpath.split(os.path.sep)))
+
+        return _result
+
+    def _stage_distributives(self, staging, paths, removed):
+        """
+        Make full copies of distributives changed with bundle applied
+        :param staging: staging folder with files extracted
+        :type staging: str
+        :param paths: relative paths extracted
+        :type paths: list(str)
+        :param removed: relative paths removed
+        :type removed: list(str)
+        :return: staging folder with 'dists' to publish
+        """
+        _published = os.path.join(staging, ".dists")
+        _distrs = set(map(lambda x: x.split(posixpath.sep)[1], filter(is_metadata, paths + removed)))
+
+        for _distr in _distrs:
+            _current = os.path.join(self._destination, "dists", _distr)
+            _target = os.path.join(_published, "dists", _distr)
+
+            if os.path.isdir(_current):
+                shutil.copytree(_current, _target, symlinks=True)
+            else:
+                os.makedirs(_target)
+
+        for _relpath in filter(is_metadata, paths):
+            _parts = _relpath.split(posixpath.sep)
+            _target = os.path.join(_published, *_parts)
+            os.makedirs(os.path.dirname(_target), exist_ok=True)
+
+            if os.path.lexists(_target):
+                os.remove(_target)
+
+            os.replace(os.path.join(staging, *_parts), _target)
+
+        for _relpath in filter(is_metadata, removed):
+            _target = os.path.join(_published, *_relpath.split(posixpath.sep))
+
+            if os.path.lexists(_target):
+                os.remove(_target)
+
+        return _published
+
+    def _check_releases(self, releases, published):
+        """
+        Check Release files to publish are the ones exported
+        :param releases: relative path => SHA256 from bundle header
+        :type releases: dict
+        :param published: staging folder with 'dists' to publish
+        :type published: str
+        """
+        for _relpath, _hash in releases.items():
+            _staged = os.path.join(published, *_relpath.split(posixpath.sep))
+            _root = published if os.path.exists(_staged) else self._destination
+
+            if get_release_hashes(_root, [_relpath]).get(_relpath) != _hash:
+                raise BundleError("'%s' does not match bundle, mirror copy is not the one bundle is made for" %
+                        _relpath)
+
+    def import_bundle(self, path, force=False):
+        """
+        Apply bundle
+        :param path: bundle path, compressed or not
+        :type path: str
+        :param force: apply regardless of bundles applied before
+        :type force: bool
+        :return: bundle header
+        """
+        _staging = self._state.get_path("import")
+        shutil.rmtree(_staging, ignore_errors=True)
+        os.makedirs(_staging)
+
+        try:
+            with tarfile.open(path, mode="r|*") as _tar:
+                _member = _tar.next()
+
+                if not _member or _member.name != self.header:
+                    raise BundleError("'%s' is not a mirror bundle" % path)
+
+                _header = json.loads(_tar.extractfile(_member).read().decode("utf-8"))
+                _applied = self._state.load(self.watermark, dict()).get("id")
+
+                if not force and not _header.get("full") and _header.get("base") != _applied:
+                    raise BundleError("Bundle is made since '%s', but '%s' has been applied last" %
+                            (_header.get("base"), _applied))
+
+                _paths = self._extract(_tar, _staging)
+
+            _removed = _header.get("removed")
+            _published = self._stage_distributives(_staging, _paths, _removed)
+            self._check_releases(_header.get("releases"), _published)
+
+            for _relpath in filter(lambda x: not is_metadata(x), _paths):
+                _target = self._get_target(_relpath)
+                os.makedirs(os.path.dirname(_target), exist_ok=True)
+
+                if os.path.isdir(_target) and not os.path.islink(_target):
+                    shutil.rmtree(_target)
+
+                os.replace(os.path.join(_staging, *_relpath.split(posixpath.sep)), _target)
+
+            publish_distributives(_published, self._destination)
+
+            for _relpath in filter(lambda x: not is_metadata(x), _removed):
+                _target = self._get_target(_relpath)
+
+                if os.path.islink(_target) or os.path.isfile(_target):
+                    os.remove(_target)
+
+            if _header.get("full"):
+                self._remove_trash(_paths)
+        finally:
+            shutil.rmtree(_staging, ignore_errors=True)
+
+        self._state.save(self.watermark, {"id": _header.get("id")})
+        logging.info("Bundle '%s' applied: %d files changed, %d removed" %
+                (_header.get("id"), len(_paths), len(_header.get("removed"))))
+        return _header
+
+    def _remove_trash(self, paths):
+        """
+        Remove files not listed in full bundle
+        :param paths: relative paths of the bundle
+        :type paths: list(str)
+        """
+        _files = NamedTemporaryFile(mode='w+')
+        _files.write('\n'.join(map(lambda x: os.path.join(self._destination, *x.split(posixpath.sep)), paths)))
+        _files.flush()
+        _tr = TrashRemover(_files, self._destination, exclude=[self._state.get_path()])
+        _tr.remove_trash()
+        _tr.get_temp().close()
+        logging.info("%d files not listed in full bundle removed" % _tr.get_removed_count())
@@ -4,6 +4,12 @@ import os
 import posixpath
 from copy import deepcopy
 from .repofile_release import RepoFileRelease, RepoFileInRelease
+from .release_cache import ReleaseCache
+from .package_filter import PackageFilter
+from .metadata_filter import MetadataFilter
+from .verification_policy import VerificationPolicy
+from .repofile import get_local_source
+from . import local_transfer
 
 class KeyAbsenceError(Exception):
     def __init__(self, key):
@@ -21,6 +27,7 @@ class MirrorsConfig(object):
         """
 
         self._path = path
+        self._release_cache = ReleaseCache()
 
         with open(self._path) as _fl_in:
             self._cfg = json.load(_fl_in)
@@ -58,6 +65,12 @@ class MirrorsConfig(object):
                 os.path.dirname(os.path.abspath(self._path)), 
                 cfg["destination"].replace(posixpath.sep, os.path.sep))
 
+        # local upstream may be given as a plain path, relative to config as destination
+        if get_local_source(cfg["source"]) == cfg["source"] and not os.path.isabs(cfg["source"]):
+            cfg["source"] = os.path.join(
+                os.path.dirname(os.path.abspath(self._path)),
+                cfg["source"].replace(posixpath.sep, os.path.sep))
+
         # these too, but value have to be list
         for _key in ["distributives", "sections"]:
             self._validate_value_type(cfg, _key, list)
@@ -65,6 +78,118 @@ class MirrorsConfig(object):
         # and this one is optional, will copy all by default
         self._validate_value_type(cfg, "architectures", list, required=False)
 
+        # for daemon mode only, seconds
+        self._validate_value_type(cfg, "poll_interval", int, required=False)
+
+        # superseded 'by-hash' objects kept, generations
+        self._validate_value_type(cfg, "by_hash_generations", int, required=False)
+
+        if cfg.get("by_hash_generations", 0) < 0:
+            raise ValueError("'by_hash_generations' is to be non-negative, but %d found" %
+                    cfg.get("by_hash_generations"))
+
+        # pool files are downloaded by serving mode only, when requested by clients
+        self._validate_value_type(cfg, "on_demand", bool, required=False)
+
+        # packages and metadata filters are optional too
+        self._validate_packages(cfg)
+        self._validate_metadata(cfg)
+        self._validate_verification(cfg)
+        self._validate_seeds(cfg)
+
+    def _validate_packages(self, cfg):
+        """
+        Validate packages filter configuration
+        :param cfg: single mirror configuration
+        :type cfg: dict
+        """
+        self._validate_value_type(cfg, "packages", dict, required=False)
+        _packages = cfg.get("packages")
+
+        if _packages is None:
+            return
+
+        for _key in ["include", "exclude"]:
+            self._validate_value_type(_packages, _key, dict, required=False)
+
+            for _rules_key in PackageFilter._rule_keys:
+                self._validate_value_type(_packages.get(_key, dict()), _rules_key, list, required=False)
+
+        if not _packages.get("include"):
+            raise KeyAbsenceError("packages.include")
+
+        self._validate_value_type(_packages, "recommends", bool, required=False)
+
+    def _validate_metadata(self, cfg):
+        """
+        Validate metadata filter configuration
+        :param cfg: single mirror configuration
+        :type cfg: dict
+        """
+        self._validate_value_type(cfg, "metadata", dict, required=False)
+        _metadata = cfg.get("metadata")
+
+        if _metadata is None:
+            return
+
+        for _key in ["include", "exclude"]:
+            self._validate_value_type(_metadata, _key, dict, required=False)
+
+            for _rules_key in MetadataFilter._rule_keys:
+                self._validate_value_type(_metadata.get(_key, dict()), _rules_key, list, required=False)
+
+        self._validate_value_type(_metadata, "languages", list, required=False)
+
+    def _validate_verification(self, cfg):
+        """
+        Validate verification policy configuration
+        :param cfg: single mirror configuration
+        :type cfg: dict
+        """
+        self._validate_value_type(cfg, "verification", dict, required=False)
+        _verification = cfg.get("verification")
+
+        if _verification is None:
+            return
+
+        for _kind in VerificationPolicy.kinds:
+            self._validate_value_type(_verification, _kind, str, required=False)
+
+            if _verification.get(_kind, "full") not in VerificationPolicy.modes:
+                raise ValueError("Verification mode for '%s' is to be one of %s, but '%s' found" %
+                        (_kind, VerificationPolicy.modes, _verification.get(_kind)))
+
+        # indices change keeping their names, size alone tells nothing about them
+        if _verification.get("indices") == "size":
+            raise ValueError("Verification mode 'size' is not allowed for 'indices'")
+
+        self._validate_value_type(_verification, "full_every", int, required=False)
+        self._validate_value_type(_verification, "sample", (int, float), required=False)
+
+    def _validate_seeds(self, cfg):
+        """
+        Validate seed directories configuration
+        :param cfg: single mirror configuration
+        :type cfg: dict
+        """
+        self._validate_value_type(cfg, "seeds", dict, required=False)
+        _seeds = cfg.get("seeds")
+
+        if _seeds is None:
+            return
+
+        self._validate_value_type(_seeds, "directories", list)
+        self._validate_value_type(_seeds, "methods", list, required=False)
+        _unknown = list(filter(lambda x: x not in local_transfer.methods, _seeds.get("methods", list())))
+
+        if _unknown:
+            raise ValueError("Seed methods are to be of %s, but %s found" % (local_transfer.methods, _unknown))
+
+        # relative to config, as destination
+        _seeds["directories"] = list(map(lambda x: x if os.path.isabs(x) else os.path.join(
+            os.path.dirname(os.path.abspath(self._path)), x.replace(posixpath.sep, os.path.sep)),
+            _seeds.get("directories")))
+
     def _validate_value_type(self, cfg, key, value_type, required=True):
         """
         Validate key value for a cfg
@@ -104,30 +229,50 @@ class MirrorsConfig(object):
         """
         return self._cfg
 
-    def _get_release_file(self, mirror, distr):
+    def get_release_cache(self):
         """
-        Get instance of Release / InRelease file
-        Perhaps both, but at least one
-        Can not be used in mirror since we have to 
-        use existant file only, without downloading
+        Return parsed Release files cache shared by all users of this configuration
+        """
+        return self._release_cache
+
+    def get_local_release_files(self, mirror, distr):
+        """
+        Get instances of local Release / InRelease files existing, without downloading
         :param mirror: mirror configuration
         :type mirror: dict
         :param distr: distributive name
         :type distr: str
+        :return: list, may be empty
         """
         _candidates = [
             RepoFileRelease(
                 local=mirror.get("destination"),
                 remote=mirror.get("source"),
-                sub=["dists", distr, "Release"]),
+                sub=["dists", distr, "Release"],
+                cache=self._release_cache),
             RepoFileInRelease(
                 local=mirror.get("destination"),
                 remote=mirror.get("source"),
-                sub=["dists", distr, "InRelease"]) ]
+                sub=["dists", distr, "InRelease"],
+                cache=self._release_cache) ]
+
+        return list(filter(lambda x: x.check_after(), _candidates))
+
+    def _get_release_file(self, mirror, distr):
+        """
+        Get instance of Release / InRelease file
+        Perhaps both, but at least one
+        Can not be used in mirror since we have to 
+        use existant file only, without downloading
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :param distr: distributive name
+        :type distr: str
+        """
+        _candidates = self.get_local_release_files(mirror, distr)
 
-        for _rlfl in _candidates:
-            if _rlfl.check_after():
-                return _rlfl
+        if _candidates:
+            return _candidates[0]
 
         return None
 
@@ -155,7 +300,7 @@ class MirrorsConfig(object):
 
             _rlfl = self._get_release_file(mirror, _d)
             if _rlfl:
-                _rlfl.open()
+                _rlfl.open(lazy=True)
                 _tmps = _rlfl.get_sections()
 
                 if _tmps and len(_tmps):
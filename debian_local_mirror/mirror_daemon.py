@@ -0,0 +1,274 @@
+import hashlib
+import logging
+import os
+import posixpath
+import signal
+import threading
+import time
+import requests
+from .repofile import RepoFile, get_local_source
+from .repofile_checksum import RepoFileWithCheckSum
+from .checksum_cache import ChecksumCache
+
+class ReleaseWatcher(object):
+    """
+    Cheap upstream change detection for single distributive:
+    conditional request for InRelease (Release if absent) with validators of the last synchronization
+    """
+    _names = ["InRelease", "Release"]
+
+    def __init__(self, mirror, distr, state=None):
+        """
+        Initialization
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :param distr: distributive name
+        :type distr: str
+        :param state: validators of the last synchronization, as returned by 'get_state'
+        :type state: dict
+        """
+        self._mirror = mirror
+        self._distr = distr
+        self._state = state
+        self._pending = None
+
+    def get_file_state(self, name, path):
+        """
+        Return validators of an upstream file synchronized, with no request made
+        :param name: 'InRelease' or 'Release'
+        :type name: str
+        :param path: local path of the file synchronized, not modified yet
+        :type path: str
+        """
+        _source = get_local_source(self._mirror.get("source"))
+
+        if _source is not None:
+            _stat = os.stat(os.path.join(_source, "dists", self._distr, name))
+            return {"name": name, "stat": [_stat.st_ino, _stat.st_size, _stat.st_mtime_ns]}
+
+        _hashobj = hashlib.sha256()
+
+        with open(path, "rb") as _fl_in:
+            for _chunk in iter(lambda: _fl_in.read(1024 * 1024), b''):
+                _hashobj.update(_chunk)
+
+        return {"name": name, "etag": None, "last_modified": None, "digest": _hashobj.hexdigest()}
+
+    def _get_url(self, name):
+        return posixpath.join(self._mirror.get("source"), "dists", self._distr, name)
+
+    def _get_headers(self, name):
+        """
+        Conditional request headers for a file
+        """
+        _headers = dict()
+
+        if not self._state or self._state.get("name") != name:
+            return _headers
+
+        if self._state.get("etag"):
+            _headers["If-None-Match"] = self._state.get("etag")
+
+        if self._state.get("last_modified"):
+            _headers["If-Modified-Since"] = self._state.get("last_modified")
+
+        return _headers
+
+    def _check_local(self, source):
+        """
+        Check upstream on local or network filesystem by files status, nothing is read
+        :param source: upstream path
+        :type source: str
+        :return: True if changed or unknown
+        """
+        for _name in self._names:
+            _path = os.path.join(source, "dists", self._distr, _name)
+
+            try:
+                _stat = os.stat(_path)
+            except FileNotFoundError:
+                logging.debug("'%s' not found" % _path)
+                continue
+
+            self._pending = {"name": _name, "stat": [_stat.st_ino, _stat.st_size, _stat.st_mtime_ns]}
+            return not self._state or self._state.get("stat") != self._pending.get("stat")
+
+        return True
+
+    def check(self):
+        """
+        Check if upstream has changed since last synchronization committed
+        :return: True if changed or unknown
+        """
+        self._pending = None
+        _source = get_local_source(self._mirror.get("source"))
+
+        if _source is not None:
+            return self._check_local(_source)
+
+        for _name in self._names:
+            _url = self._get_url(_name)
+            _rsp = RepoFile.get_session(_url).get(_url, timeout=(30.0, 30.0), allow_redirects=True,
+                    headers=self._get_headers(_name))
+
+            try:
+                if _rsp.status_code == requests.codes.not_modified:
+                    logging.debug("'%s' is not modified" % _url)
+                    return False
+
+                if _rsp.status_code == requests.codes.not_found:
+                    logging.debug("'%s' not found" % _url)
+                    continue
+
+                _rsp.raise_for_status()
+                self._pending = {
+                        "name": _name,
+                        "etag": _rsp.headers.get("ETag"),
+                        "last_modified": _rsp.headers.get("Last-Modified"),
+                        "digest": hashlib.sha256(_rsp.content).hexdigest()}
+            finally:
+                _rsp.close()
+
+            # validators may be absent or ignored by server, content decides then
+            return not self._state or self._state.get("digest") != self._pending.get("digest")
+
+        # neither found, let synchronization decide what to do
+        return True
+
+    def commit(self):
+        """
+        Remember validators of the last check after successful synchronization
+        """
+        if self._pending:
+            self._state = self._pending
+
+        self._pending = None
+
+class MirrorDaemon(object):
+    """
+    Long-running mirroring: poll upstream of every distributive with its mirror interval
+    and synchronize changed distributives only.
+    Configuration, parsed Release files, verified checksums and HTTP connections are kept between cycles.
+    """
+    def __init__(self, processor, poll_interval=3600):
+        """
+        Initialization
+        :param processor: mirror processor to synchronize with
+        :type processor: MirrorProcessor
+        :param poll_interval: default poll interval, in seconds, for mirrors without 'poll_interval'
+        :type poll_interval: int
+        """
+        self._processor = processor
+        self._poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._watchers = dict()
+        self._next_poll = dict()
+
+        for _index, _mirror in enumerate(self._processor.get_config().get_mirrors()):
+            if not _mirror.get("enabled", True):
+                logging.info("Mirroring '%s' is disabled" % _mirror.get("source"))
+                continue
+
+            self._next_poll[_index] = 0
+
+            for _distr in _mirror.get("distributives"):
+                self._watchers[(_index, _distr)] = ReleaseWatcher(_mirror, _distr)
+
+    def stop(self, *args):
+        """
+        Stop after current cycle, suitable as a signal handler
+        """
+        logging.info("Stop requested")
+        self._stop.set()
+
+    def _get_interval(self, mirror):
+        return mirror.get("poll_interval", self._poll_interval)
+
+    def _get_changed(self, index, mirror):
+        """
+        Poll all distributives of a mirror
+        :return: list of watchers for distributives changed
+        """
+        _result = list()
+        _metrics = self._processor.get_metrics()
+
+        for _distr in mirror.get("distributives"):
+            _watcher = self._watchers.get((index, _distr))
+
+            try:
+                _changed = _watcher.check()
+            except (requests.exceptions.RequestException, OSError) as _e:
+                logging.error("Polling '%s' distributive '%s' failed: %s" % (mirror.get("source"), _distr, _e))
+                _metrics.inc("upstream_polls", result="error")
+                continue
+
+            _metrics.inc("upstream_polls", result="changed" if _changed else "unchanged")
+
+            if _changed:
+                logging.info("'%s' distributive '%s' has changed" % (mirror.get("source"), _distr))
+                _result.append((_distr, _watcher))
+
+        return _result
+
+    def run_cycle(self, now=None):
+        """
+        Poll and synchronize mirrors due
+        :param now: current monotonic time
+        :type now: float
+        :return: monotonic time of next poll due
+        """
+        if now is None:
+            now = time.monotonic()
+
+        _mirrors = self._processor.get_config().get_mirrors()
+
+        for _index in sorted(self._next_poll.keys()):
+            if self._stop.is_set():
+                break
+
+            if self._next_poll.get(_index) > now:
+                continue
+
+            _mirror = _mirrors[_index]
+            self._next_poll[_index] = now + self._get_interval(_mirror)
+            _changed = self._get_changed(_index, _mirror)
+
+            if not _changed:
+                continue
+
+            try:
+                self._processor.process(selection=[(_mirror, list(map(lambda x: x[0], _changed)))])
+            except Exception as _e:
+                # will be retried on next poll since watchers are not committed
+                logging.exception("Synchronization of '%s' failed: %s" % (_mirror.get("source"), _e))
+                continue
+
+            for _distr, _watcher in _changed:
+                _watcher.commit()
+
+        return min(self._next_poll.values()) if self._next_poll else None
+
+    def run(self):
+        """
+        Run until stopped
+        """
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        RepoFileWithCheckSum.set_checksum_cache(ChecksumCache())
+
+        try:
+            while not self._stop.is_set():
+                _next = self.run_cycle()
+
+                if _next is None:
+                    logging.warning("No enabled mirrors, nothing to do")
+                    break
+
+                _wait = max(0.0, _next - time.monotonic())
+                logging.info("Next poll in %d seconds" % _wait)
+                self._stop.wait(_wait)
+        finally:
+            RepoFileWithCheckSum.set_checksum_cache(None)
+            RepoFile.close_sessions()
@@ -2,10 +2,28 @@ import logging
 from .mirror_config import MirrorsConfig
 from .repofile_release import RepoFileRelease, RepoFileInRelease
 from .repofile_checksum import RepoFileWithCheckSum
-from .repofile_packages import RepoFilePackages
+from .repofile_packages import RepoFilePackages, rewrite_packages
+from .package_filter import PackageFilter
+from .metadata_filter import MetadataFilter
+from .mirror_state import MirrorState
+from .verification_policy import VerificationPolicy
+from .seed_index import SeedIndex
+from .packages_index import PackagesIndexCache
+from .run_journal import RunJournal
+from .by_hash_retention import ByHashRetention
+from .mirror_daemon import ReleaseWatcher
 from .trash_remover import TrashRemover
+from .phase_profiler import PhaseProfiler
+from .run_metrics import RunMetrics
+from .repofile import RepoFile
+from .host_controller import HostController
+from concurrent.futures import ThreadPoolExecutor
 from tempfile import NamedTemporaryFile, TemporaryDirectory
 import os
+import posixpath
+import shutil
+import threading
+import requests
 
 class MirrorError(Exception):
     def __init__(self, remote, local, message):
@@ -26,20 +44,116 @@ class MirrorProcessor(object):
         logging.info("Config path provided: '%s'" % _cfg)
         self._config = MirrorsConfig(_cfg)
         self._files = None
+        self._distr_files = dict()
+        self._pool_records = dict()
+        self._pool_state = None
+        self._pool_state_previous = None
+        self._policy = None
+        self._seeds = None
+        self._index_cache = None
+        self._pool_files = dict()
+        self._distr_pool_files = set()
+        self._journal = None
+        self._release_state = None
+        self._by_hash = None
         self.__gpg_signer = None
+        self._profiler = PhaseProfiler(out_dir=getattr(self._args, "profile_dir", None))
+        self._metrics = RunMetrics()
+        self._connections = getattr(self._args, "max_connections", None) or 1
+        self._executor = None
+        self._executor_threads = set()
+        HostController.set_max_concurrency(self._connections)
 
-    def process(self):
+        if getattr(self._args, "download_buffer", None):
+            RepoFile.set_download_buffer(self._args.download_buffer)
+
+    def process(self, selection=None):
         """
         The main mirroring process
+        :param selection: list of tuples (mirror configuration, list of distributives) to process,
+            all distributives of all mirrors by default
+        :type selection: list
+        """
+        RepoFile.set_metrics(self._metrics)
+        self._metrics.start()
+        _success = False
+
+        if selection is None:
+            selection = list(map(lambda x: (x, None), self._config.get_mirrors()))
+
+        # download threads live for the whole run, so do their HTTP sessions
+        if self._connections > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self._connections,
+                    initializer=lambda: self._executor_threads.add(threading.get_ident()))
+
+        try:
+            for _mirror, _distributives in selection:
+                self._process_single_mirror(_mirror, _distributives)
+
+            _success = True
+        finally:
+            if self._executor:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+                RepoFile.close_sessions(self._executor_threads)
+                self._executor_threads = set()
+
+            RepoFile.set_metrics(None)
+            self._profiler.dump()
+            self._write_metrics(_success)
+
+    def _write_metrics(self, success):
+        """
+        Write run metrics to files requested
+        :param success: run result
+        :type success: bool
+        """
+        self._metrics.set_phases(self._profiler.get_report())
+        self._metrics.finish(success)
+
+        if getattr(self._args, "metrics_textfile", None):
+            self._metrics.write_textfile(self._args.metrics_textfile)
+
+        if getattr(self._args, "metrics_json", None):
+            self._metrics.write_json(self._args.metrics_json)
+
+    def get_config(self):
+        """
+        Return mirrors configuration
+        """
+        return self._config
+
+    def get_metrics(self):
+        """
+        Return run metrics
+        """
+        return self._metrics
+
+    def get_profiler(self):
+        """
+        Return phases profiler
         """
-        for _mirror in self._config.get_mirrors():
-            self._process_single_mirror(_mirror)
+        return self._profiler
 
-    def _process_single_mirror(self, mirror):
+    def _phase(self, name, mirror, distr=None):
+        """
+        Context manager for profiling a phase of mirroring
+        :param name: phase name
+        :type name: str
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :param distr: distributive name
+        :type distr: str
+        """
+        return self._profiler.phase(name, mirror=mirror.get("source"), distr=distr)
+
+    def _process_single_mirror(self, mirror, distributives=None):
         """
         Process single mirror record
         :param mirror: mirror configuration
         :type mirror: dict
+        :param distributives: distributives to process, all by default
+        :type distributives: list(str)
         """
 
         if not mirror.get("enabled", True):
@@ -49,14 +163,93 @@ class MirrorProcessor(object):
         logging.info("Processing mirror for '%s'" % mirror.get("source"))
 
         # loop by distributives and architectures
-        self._files = NamedTemporaryFile(mode = 'w+')
+        self._pool_records = dict()
+        self._pool_files = dict()
+        self._policy = self._get_verification_policy(mirror)
+        self._seeds = self._get_seed_index(mirror)
+        self._index_cache = self._get_index_cache(mirror)
+        self._journal = self._get_journal(mirror)
+        self._by_hash = self._get_by_hash_retention(mirror)
+
         for _dist in mirror.get("distributives"):
+            if distributives is not None and _dist not in distributives:
+                logging.debug("Distributive '%s' is skipped" % _dist)
+                continue
+
+            # files lists are kept per distributive, so unchanged ones need not to be processed again
+            self._files = NamedTemporaryFile(mode = 'w+')
+            self._distr_pool_files = set()
             self._process_single_distributive(mirror, _dist)
+            self._set_distributive_files(mirror, _dist, self._files)
+
+        # the run is finished, nothing to resume
+        if self._journal:
+            self._journal.remove()
+            self._journal = None
+
+        if self._policy:
+            self._policy.save()
+            self._policy = None
+
+        self._seeds = None
+        self._by_hash = None
+        self._pool_files = dict()
+        self._index_cache.prune()
+        self._files = self._get_mirror_files(mirror)
+
+        if not self._files:
+            logging.warning("Not all distributives of '%s' have been processed, trash removal skipped" %
+                    mirror.get("source"))
+            return
+
+        with self._phase("trash", mirror):
+            self._remove_trash(mirror.get("destination"), exclude=[MirrorState(mirror.get("destination")).get_path()])
 
-        self._remove_trash(mirror.get("destination"))
         self._files.close()
         self._files = None
 
+    def _set_distributive_files(self, mirror, distr, files):
+        """
+        Keep legal files list of a distributive processed
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :param distr: distributive name
+        :type distr: str
+        :param files: files list
+        :type files: file-like object
+        """
+        _key = (mirror.get("destination"), distr)
+        _previous = self._distr_files.get(_key)
+
+        if _previous:
+            _previous.close()
+
+        files.flush()
+        self._distr_files[_key] = files
+
+    def _get_mirror_files(self, mirror):
+        """
+        Join legal files lists of all distributives of a mirror
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :return: temporary file or None if some distributive has not been processed
+        """
+        _result = NamedTemporaryFile(mode = 'w+')
+
+        for _dist in mirror.get("distributives"):
+            _files = self._distr_files.get((mirror.get("destination"), _dist))
+
+            if not _files:
+                _result.close()
+                return None
+
+            _files.seek(0, 0)
+            shutil.copyfileobj(_files, _result)
+            _result.write('\n')
+
+        _result.flush()
+        return _result
+
 
     def _process_single_distributive(self, mirror, distr):
         """
@@ -70,8 +263,41 @@ class MirrorProcessor(object):
         # To download packages from a repository apt would download a InRelease or Release 
         # file from the $ARCHIVE_ROOT/dists/$DISTRIBUTION directory.
         # InRelease files are signed in-line while Release files should have an accompanying Release.gpg file
-        _rlfl = self._get_release_file(mirror, distr)
-        self._process_release(mirror, _rlfl);
+        _journaled = self._check_journal(mirror, distr)
+        _rlfl = None
+
+        with self._phase("release", mirror, distr):
+            if _journaled:
+                _rlfl = self._resume_distributive(mirror, distr, _journaled)
+
+            if not _rlfl:
+                _journaled = list()
+                _start = self._files.tell()
+                self._release_state = None
+                _rlfl = self._get_release_file(mirror, distr)
+                self._journal_task(distr, "release", _start, state=self._release_state)
+
+        _tasks = list(map(lambda x: x.get("task"), _journaled))
+
+        if "done" in _tasks:
+            logging.info("Distributive '%s' has been done by the run interrupted" % distr)
+            return
+
+        if "indices" not in _tasks:
+            with self._phase("indices", mirror, distr):
+                _start = self._files.tell()
+                self._process_release(mirror, _rlfl)
+
+                if self._by_hash:
+                    self._by_hash.save()
+
+                self._journal_task(distr, "indices", _start)
+
+        _start = self._files.tell()
+
+        self._pool_state_previous = self._load_pool_state(mirror, distr)
+        self._pool_state = dict()
+
         _archs = mirror.get("architectures")
 
         if "all" not in _archs and not _rlfl.skip_all_architecture():
@@ -81,7 +307,183 @@ class MirrorProcessor(object):
         for _section in mirror.get("sections"):
             for _arch in _archs:
                 logging.info("Processing distr '%s', section '%s', architecture '%s'" % (distr, _section, _arch))
-                self._process_section_architecture(mirror, _section, _arch, _rlfl)
+                self._process_section_architecture(mirror, distr, _section, _arch, _rlfl)
+
+        if self._pool_state_previous is not None:
+            MirrorState(mirror.get("destination")).save(self._get_pool_state_name(distr), self._pool_state)
+
+        # pool passes skipped as unchanged write their files outside of pool records
+        self._journal_task(distr, "done", _start)
+
+        self._pool_state = None
+        self._pool_state_previous = None
+
+    def _get_journal(self, mirror):
+        """
+        Create journal of the run for a mirror, kept in its state folder
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :return: RunJournal or None if runs are not to be resumed
+        """
+        return RunJournal(MirrorState(mirror.get("destination")).get_path("journal.jsonl"))
+
+    def _check_journal(self, mirror, distr):
+        """
+        Find tasks of a distributive done by the run interrupted, if upstream has not been changed since
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :param distr: distributive name
+        :type distr: str
+        :return: records of tasks done, possibly empty
+        """
+        if not self._journal:
+            return list()
+
+        _records = self._journal.get_distributive(distr)
+
+        if not _records or not _records[0].get("state"):
+            return list()
+
+        try:
+            _changed = ReleaseWatcher(mirror, distr, state=_records[0].get("state")).check()
+        except (requests.exceptions.RequestException, OSError) as _e:
+            logging.warning("Unable to check upstream of distributive '%s': %s" % (distr, _e))
+            return list()
+
+        return list() if _changed else _records
+
+    def _resume_distributive(self, mirror, distr, records):
+        """
+        Take tasks done by the run interrupted: legal files and pool files synchronized
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :param distr: distributive name
+        :type distr: str
+        :param records: journal records of the distributive
+        :type records: list(dict)
+        :return: local Release file or None if it is absent
+        """
+        _rlfls = self._config.get_local_release_files(mirror, distr)
+
+        if not _rlfls:
+            return None
+
+        logging.info("Resuming distributive '%s': %d tasks have been done" % (distr, len(records)))
+        self._metrics.inc("resumed_tasks", len(records))
+        _done = "done" in map(lambda x: x.get("task"), records)
+
+        for _record in records:
+            # record of distributive done lists pool files as well
+            if _done and _record.get("task") == "pool":
+                continue
+
+            if _record.get("paths"):
+                self._files.write('\n' + '\n'.join(_record.get("paths")))
+
+            if _record.get("task") == "pool":
+                self._pool_files[tuple(_record.get("key"))] = _record.get("paths")
+                self._distr_pool_files.add(tuple(_record.get("key")))
+
+        self._files.flush()
+
+        # parsed data is used by pool passes
+        _rlfls[0].open()
+        _rlfls[0].close()
+        return _rlfls[0]
+
+    def _journal_task(self, distr, task, start, **data):
+        """
+        Record task done with legal files written since position given
+        :param distr: distributive name
+        :type distr: str
+        :param task: task name
+        :type task: str
+        :param start: position in legal files list the task has been started at
+        :type start: int
+        """
+        if not self._journal:
+            return
+
+        self._files.flush()
+        self._files.seek(start, 0)
+        _record = dict(data)
+        _record.update({"distr": distr, "task": task,
+            "paths": list(filter(lambda x: x, map(lambda x: x.strip(), self._files.read().split('\n'))))})
+        self._journal.append(_record)
+
+    def _get_pool_state_name(self, distr):
+        """
+        Name of state file with pool passes of a distributive
+        :param distr: distributive name
+        :type distr: str
+        """
+        return "pool-%s.json" % distr.replace(posixpath.sep, "_")
+
+    def _load_pool_state(self, mirror, distr):
+        """
+        Load pool passes completed by previous run:
+        {"section/architecture": {"index": Packages signature, "files": {legal path: size}}}
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :param distr: distributive name
+        :type distr: str
+        :return: dictionary or None if passes are not to be skipped
+        """
+        if self._policy and self._policy.is_full_run():
+            logging.info("Full verification forced, no pool pass is skipped")
+            return dict()
+
+        return MirrorState(mirror.get("destination")).load(self._get_pool_state_name(distr), dict())
+
+    def _skip_pool_pass(self, key, pkgs):
+        """
+        Take legal paths of a pool pass from state if its index has not been changed since completed
+        :param key: 'section/architecture'
+        :type key: str
+        :param pkgs: Packages index
+        :type pkgs: RepoFilePackages
+        :return: True if the pass is skipped
+        """
+        _previous = (self._pool_state_previous or dict()).get(key)
+        _signature = pkgs.get_index_signature()
+
+        # rewritten index has been parsed already, it is cheaper to process it
+        if not _previous or not _signature or pkgs.get_index_path() in self._pool_records:
+            return False
+
+        if _previous.get("index") != _signature:
+            return False
+
+        # files lists of previous versions have no sizes
+        if not isinstance(_previous.get("files"), dict) or not self._check_pool_files(_previous.get("files")):
+            logging.info("Files of '%s' have been changed locally, pool pass is not skipped" % key)
+            return False
+
+        if self._policy and self._policy.is_sampled():
+            logging.info("Pool pass for '%s' is chosen to be verified" % key)
+            return False
+
+        logging.info("Index for '%s' has not been changed, pool pass skipped" % key)
+        self._metrics.inc("skipped_pool_passes")
+        self._files.write('\n' + '\n'.join(_previous.get("files").keys()))
+        self._files.flush()
+        self._pool_state[key] = _previous
+        return True
+
+    def _check_pool_files(self, files):
+        """
+        Check files of a pool pass are in place with sizes they have been synchronized with
+        :param files: local path => size
+        :type files: dict
+        """
+        for _path, _size in files.items():
+            try:
+                if os.lstat(_path).st_size != _size:
+                    return False
+            except OSError:
+                return False
+
+        return True
 
     @property
     def _gpg(self):
@@ -96,7 +498,86 @@ class MirrorProcessor(object):
         self.__gpg_signer = GPGSigner(keyfile=self._args.resign_key, passphrase=self._args.key_passphrase)
 
         return self.__gpg_signer
-        
+
+    def _sign(self, mirror, distr, rlfl):
+        """
+        Sign Release file with our key
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :param distr: distributive name
+        :type distr: str
+        :param rlfl: Release file
+        :type rlfl: RepoFileRelease
+        """
+        with self._phase("signing", mirror, distr):
+            rlfl.sign(self._gpg)
+
+    def _get_package_filter(self, mirror):
+        """
+        Create packages filter for a mirror
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :return: PackageFilter or None if not configured
+        """
+        if not mirror.get("packages"):
+            return None
+
+        return PackageFilter(mirror.get("packages"))
+
+    def _get_verification_policy(self, mirror):
+        """
+        Create verification policy for a mirror
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :return: VerificationPolicy or None if not configured
+        """
+        if not mirror.get("verification"):
+            return None
+
+        return VerificationPolicy(mirror.get("verification"), MirrorState(mirror.get("destination")))
+
+    def _get_index_cache(self, mirror):
+        """
+        Create cache of binary 'Packages' indices for a mirror, kept in its state folder
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :return: PackagesIndexCache
+        """
+        return PackagesIndexCache(MirrorState(mirror.get("destination")).get_path("indices"))
+
+    def _get_by_hash_retention(self, mirror):
+        """
+        Create retention of superseded 'by-hash' objects for a mirror, kept in its state folder
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :return: ByHashRetention
+        """
+        return ByHashRetention(mirror.get("destination"), mirror.get("by_hash_generations", 2))
+
+    def _get_seed_index(self, mirror):
+        """
+        Create index of seed directories for a mirror
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :return: SeedIndex or None if not configured
+        """
+        if not mirror.get("seeds"):
+            return None
+
+        return SeedIndex(mirror.get("seeds").get("directories"), mirror.get("seeds").get("methods"))
+
+    def _get_metadata_filter(self, mirror):
+        """
+        Create metadata filter for a mirror
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :return: MetadataFilter or None if not configured
+        """
+        if not mirror.get("metadata"):
+            return None
+
+        return MetadataFilter(mirror.get("metadata"))
+
     def _get_release_file(self, mirror, distr):
         """
         Download Release / InRelease files from remote to local
@@ -106,25 +587,33 @@ class MirrorProcessor(object):
         :param distr: distributive name
         :type distr: str
         """
-        if mirror.get("versions") and not self._args.resign_key:
-            raise MirrorError(mirror.get("source"), mirror.get("destination"), 
-                    "'versions' parameter specified, but no --resign-key given")
+        for _key in ["versions", "packages"]:
+            if mirror.get(_key) and not self._args.resign_key:
+                raise MirrorError(mirror.get("source"), mirror.get("destination"), 
+                        "'%s' parameter specified, but no --resign-key given" % _key)
 
         _rlfl = None
         _candidates = [
             RepoFileRelease(
                 local=mirror.get("destination"),
                 remote=mirror.get("source"),
-                sub=["dists", distr, "Release"]),
+                sub=["dists", distr, "Release"],
+                cache=self._config.get_release_cache()),
             RepoFileInRelease(
                 local=mirror.get("destination"),
                 remote=mirror.get("source"),
-                sub=["dists", distr, "InRelease"]) ]
+                sub=["dists", distr, "InRelease"],
+                cache=self._config.get_release_cache()) ]
 
         for _tmprlfl in _candidates:
             if not _tmprlfl.synchronize():
                 continue
 
+            # validators of upstream file for the journal, taken before it is modified; InRelease is checked first
+            if self._journal and (not self._release_state or _tmprlfl.get_local_path().endswith("InRelease")):
+                self._release_state = ReleaseWatcher(mirror, distr).get_file_state(
+                        os.path.basename(_tmprlfl.get_local_path()), _tmprlfl.get_local_path())
+
             if self._args.resign_key:
                 if _rlfl:
                     _tmprlfl.create_from(_rlfl)
@@ -133,13 +622,18 @@ class MirrorProcessor(object):
                     _tmprlfl.strip_sections(mirror.get("sections"))
                     _tmprlfl.strip_diff_directories()
 
-                    if mirror.get("versions"):
-                        _tmprlfl.strip_packages_versions(versions=mirror.get("versions"))
+                    if mirror.get("metadata"):
+                        _tmprlfl.strip_metadata(self._get_metadata_filter(mirror))
+
+                    if mirror.get("versions") or mirror.get("packages"):
+                        self._pool_records.update(_tmprlfl.rewrite_packages(
+                                versions=mirror.get("versions"),
+                                package_filter=self._get_package_filter(mirror)))
 
                     if self._args.remove_valid_until:
                         _tmprlfl.remove_valid_until()
 
-                    _tmprlfl.sign(self._gpg)
+                    self._sign(mirror, distr, _tmprlfl)
 
             if not _rlfl:
                 _rlfl = _tmprlfl
@@ -150,6 +644,7 @@ class MirrorProcessor(object):
             return _rlfl
 
         _all_packages = list()
+        _packages_files = list()
 
         for _sect in mirror.get("sections"):
             for _arch in mirror.get("architectures"):
@@ -166,10 +661,16 @@ class MirrorProcessor(object):
 
                 logging.info("Packages synchronization OK for '%s'-'%s'-'%s'" % (distr, _sect, _arch))
 
-                if mirror.get("versions"):
-                    _packages.strip_versions(versions=mirror.get("versions"))
+                _packages_files.append(_packages)
+
+        if mirror.get("versions") or mirror.get("packages"):
+            self._pool_records.update(rewrite_packages(
+                    _packages_files,
+                    versions=mirror.get("versions"),
+                    package_filter=self._get_package_filter(mirror)))
 
-                _all_packages += _packages.get_local_paths()
+        for _packages in _packages_files:
+            _all_packages += _packages.get_local_paths()
 
         if not len(_all_packages):
             raise MirrorError(mirror.get("source"), mirror.get("destination"), 
@@ -185,7 +686,7 @@ class MirrorProcessor(object):
             _tmprlfl.create(distr, mirror, _all_packages)
 
             if self._args.resign_key:
-                _tmprlfl.sign(self._gpg)
+                self._sign(mirror, distr, _tmprlfl)
 
             if not _rlfl:
                 _rlfl = _tmprlfl
@@ -206,7 +707,7 @@ class MirrorProcessor(object):
         rlfl.open()
 
         # loop by-files from Release one
-        _subfiles = rlfl.get_subfiles()
+        _subfiles = rlfl.get_subfiles(metadata_filter=self._get_metadata_filter(mirror))
 
         if not _subfiles:
             # no files listed in this exact Release
@@ -218,30 +719,45 @@ class MirrorProcessor(object):
             _subfl = RepoFileWithCheckSum(
                 local=mirror.get("destination"),
                 remote=mirror.get("source"),
-                fdict=_subfiles.get(_fl))
+                fdict=_subfiles.get(_fl),
+                policy=self._policy,
+                kind="indices")
 
             if(_subfl.synchronize()):
                 self._files.write('\n' + '\n'.join(_subfl.get_local_paths()))
+
+                # superseded ones are legal while retained, removed with other trash then
+                if self._by_hash and "by-hash" in _subfiles.get(_fl):
+                    _retained = self._by_hash.update(_subfl.get_local_path(), _subfl.get_link_paths())
+
+                    if _retained:
+                        self._files.write('\n' + '\n'.join(_retained))
+
                 self._files.flush()
 
         rlfl.close()
 
-    def _remove_trash(self, root):
+    def _remove_trash(self, root, exclude=None):
         """
         Housekeeping for single mirror
         :param root: path to root folder to process
         :type root: str
+        :param exclude: directories never considered as trash
+        :type exclude: list(str)
         """
         logging.debug("Removing obsolete files preparation...")
-        _tr = TrashRemover(self._files, root)
+        _tr = TrashRemover(self._files, root, exclude=exclude)
         _tr.remove_trash()
+        self._metrics.inc("deleted_files", _tr.get_removed_count())
         self._files = _tr.get_temp()
 
-    def _process_section_architecture(self, mirror, section, arch, rlfl):
+    def _process_section_architecture(self, mirror, distr, section, arch, rlfl):
         """
         Get parse packages index and synchronize all packages
         :param mirror: full mirror configuration
         :type mirror: dict
+        :param distr: distributive name
+        :type distr: str
         :param section: secton
         :type section: str
         :param arch: architecture
@@ -256,19 +772,143 @@ class MirrorProcessor(object):
             logging.warning("Not found 'Packages' file for section '%s', architecture '%s'" % (section, arch))
             return
 
-        _pkgs.open()
-        
-        for _fl in _pkgs.get_subfiles():
-            logging.info("Processing file: %s, size: %s" % (_fl.get("Filename"), _fl.get("Size", "0") or "0"))
-            _subfl = RepoFileWithCheckSum(
-                local=mirror.get("destination"),
-                remote=mirror.get("source"),
-                fdict=_fl,
-                size=int(_fl.get("Size", "0") or "0") or None)
+        _key = posixpath.join(section, arch)
 
-            if(_subfl.synchronize()):
-                self._files.write('\n' + '\n'.join(_subfl.get_local_paths()))
+        if self._skip_pool_pass(_key, _pkgs):
+            return
+
+        # verify everything first, then download what is missing or broken
+        _to_download = list()
+        _pool_keys = dict()
+        _pending = set()
+        _legal = list()
+        _failed = 0
+
+        with self._phase("pool_verify", mirror, distr):
+            # index rewritten in this run has been parsed already
+            _records = self._pool_records.pop(_pkgs.get_index_path(), None)
+
+            if _records is None:
+                _records = _pkgs.load_pool_records(self._index_cache)
+            else:
+                _records = _pkgs.cache_pool_records(self._index_cache, _records)
+
+            for _fl in _records:
+                logging.info("Processing file: %s, size: %s" % (_fl.get("Filename"), _fl.get("Size", "0") or "0"))
+                _pool_key = self._get_pool_key(_fl)
+
+                if _pool_key in self._pool_files:
+                    logging.debug("'%s' has been processed already" % _fl.get("Filename"))
+                    self._metrics.inc("duplicate_pool_files")
+
+                    if not self._add_pool_file(distr, _pool_key, self._pool_files.get(_pool_key)):
+                        _failed += 1
+                        continue
+
+                    _legal += self._pool_files.get(_pool_key)
+                    continue
+
+                # listed twice in this index, the file is registered once its download is finished
+                if _pool_key in _pending:
+                    logging.debug("'%s' is being downloaded already" % _fl.get("Filename"))
+                    self._metrics.inc("duplicate_pool_files")
+                    continue
+
+                _subfl = RepoFileWithCheckSum(
+                    local=mirror.get("destination"),
+                    remote=mirror.get("source"),
+                    fdict=_fl,
+                    size=int(_fl.get("Size", "0") or "0") or None,
+                    policy=self._policy,
+                    seeds=self._seeds)
+                _subfl.check_create_local_path()
+
+                if not _subfl.check_before():
+                    _to_download.append(_subfl)
+                    _pool_keys[_subfl.get_local_path()] = _pool_key
+                    _pending.add(_pool_key)
+                    continue
+
+                self._metrics.inc("skipped_files")
+                _legal += _subfl.get_local_paths()
+                self._add_pool_file(distr, _pool_key, _subfl.get_local_paths())
+
+            self._files.flush()
+            _pkgs.close()
+
+        if mirror.get("on_demand") and _to_download:
+            logging.info("%d pool files are left to be fetched on demand" % len(_to_download))
+            return
+
+        _downloaded = 0
+
+        with self._phase("pool_download", mirror, distr):
+            for _subfl in self._download_files(_to_download):
+                _downloaded += 1
+                _legal += _subfl.get_local_paths()
+                self._add_pool_file(distr, _pool_keys.pop(_subfl.get_local_path()), _subfl.get_local_paths())
                 self._files.flush()
 
-        _pkgs.close()
+        # failed ones are not tried again by other passes
+        for _pool_key in _pool_keys.values():
+            self._pool_files[_pool_key] = None
+
+        # pass is remembered as completed if every file is in place
+        if not _failed and _downloaded == len(_to_download) and self._pool_state is not None:
+            self._pool_state[_key] = {"index": _pkgs.get_index_signature(),
+                    "files": dict(map(lambda x: (x, os.lstat(x).st_size), _legal))}
+
+    def _get_pool_key(self, fdict):
+        """
+        Key of a pool file in registry of files processed in this run
+        :param fdict: file data dictionary
+        :type fdict: dict
+        :return: tuple (Filename, the strongest checksum)
+        """
+        _fields = list(filter(lambda x: fdict.get(x), RepoFileWithCheckSum._strength_order))
+        return (fdict.get("Filename"), fdict.get(_fields[0]) if _fields else fdict.get("Size"))
+
+    def _add_pool_file(self, distr, key, paths):
+        """
+        Register pool file processed and write its paths to legal files list of the distributive once
+        :param distr: distributive name
+        :type distr: str
+        :param key: pool file key
+        :type key: tuple
+        :param paths: local paths of the file and its links, None if it has not been synchronized
+        :type paths: list(str)
+        :return: False if the file has not been synchronized
+        """
+        self._pool_files[key] = paths
+
+        if paths is None:
+            return False
+
+        if key not in self._distr_pool_files:
+            self._distr_pool_files.add(key)
+            self._files.write('\n' + '\n'.join(paths))
+
+            if self._journal:
+                self._journal.append({"distr": distr, "task": "pool", "key": list(key), "paths": paths})
+
+        return True
+
+    def _download_files(self, files):
+        """
+        Download files, in parallel if more than one connection allowed.
+        Requests in flight to every upstream host are limited by its HostController
+        :param files: files to download
+        :type files: list(RepoFile)
+        :return: generator of files downloaded successfully
+        """
+        if not self._executor:
+            for _subfl in files:
+                if _subfl.download():
+                    yield _subfl
+
+            return
+
+        for _subfl, _result in zip(files, self._executor.map(lambda x: x.download(), files)):
+            if _result:
+                yield _subfl
 
@@ -0,0 +1,431 @@
+import logging
+import os
+import posixpath
+import shutil
+import threading
+import urllib3
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import unquote
+from .repofile_checksum import RepoFileWithCheckSum
+from .repofile_release import RepoFileRelease, RepoFileInRelease
+from .packages_index import PackagesIndexCache
+from .mirror_state import MirrorState
+
+class _Fetch(object):
+    """
+    Single upstream fetch shared by all requests for the same file
+    """
+    def __init__(self, path, size=None):
+        """
+        Initialization
+        :param path: local path the file is written to
+        :type path: str
+        :param size: expected size, file is streamed while written if given
+        :type size: int
+        """
+        self.path = path
+        self.size = size
+        self.ok = False
+        self.done = threading.Event()
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP requests are passed to MirrorServer given to HTTP server
+    """
+    def do_GET(self):
+        self.server.mirror_server.handle(self, head=False)
+
+    def do_HEAD(self):
+        self.server.mirror_server.handle(self, head=True)
+
+    def log_message(self, format, *args):
+        logging.info("%s: %s" % (self.address_string(), format % args))
+
+class MirrorServer(object):
+    """
+    Serves local mirrors over HTTP, files missing are fetched from upstream on demand.
+    Mirror is selected by the path of its source URL: 'http://deb.debian.org/debian' is served as '/debian'.
+    Only files listed in Release and Packages are fetched, they are verified while synchronizing as usual.
+    """
+    _chunk = 64 * 1024
+    _release_files = ["Release", "Release.gpg", "InRelease"]
+
+    def __init__(self, config, workers=4):
+        """
+        Initialization
+        :param config: mirrors configuration
+        :type config: MirrorsConfig
+        :param workers: number of parallel upstream fetches
+        :type workers: int
+        """
+        self._config = config
+        self._mirrors = list()
+        self._fetches = dict()
+        self._lock = threading.Lock()
+        self._indices = dict()
+        self._indices_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+        for _mirror in config.get_mirrors():
+            if not _mirror.get("enabled", True):
+                continue
+
+            _prefix = (urllib3.util.parse_url(_mirror.get("source")).path or "").rstrip(posixpath.sep)
+            logging.info("Serving '%s' as '%s/'" % (_mirror.get("destination"), _prefix))
+            self._mirrors.append((_prefix, _mirror))
+
+        # the longest prefix wins
+        self._mirrors.sort(key=lambda x: len(x[0]), reverse=True)
+
+    def resolve(self, path):
+        """
+        Find mirror for URL path
+        :param path: URL path
+        :type path: str
+        :return: tuple (mirror configuration, path relative to its root) or (None, None)
+        """
+        _path = posixpath.normpath(unquote(path.split('?', 1)[0]))
+
+        for _prefix, _mirror in self._mirrors:
+            if not _path.startswith(_prefix + posixpath.sep):
+                continue
+
+            _relpath = _path[len(_prefix):].lstrip(posixpath.sep)
+
+            if not _relpath or _relpath.split(posixpath.sep)[0] == "..":
+                return None, None
+
+            return _mirror, _relpath
+
+        return None, None
+
+    def _get_distributive(self, mirror, relpath):
+        """
+        Find distributive a path belongs to
+        :return: tuple (distributive name, path relative to distributive folder) or (None, None)
+        """
+        for _distr in sorted(mirror.get("distributives"), key=len, reverse=True):
+            _distr_path = posixpath.join("dists", _distr) + posixpath.sep
+
+            if relpath.startswith(_distr_path):
+                return _distr, relpath[len(_distr_path):]
+
+        return None, None
+
+    def _get_release_index(self, mirror, distr):
+        """
+        Map of files listed in local Release of a distributive, 'by-hash' links included.
+        Release is fetched if absent. Map is rebuilt when Release changes.
+        :return: dictionary path relative to mirror root => file data dictionary
+        """
+        _rlfls = self._config.get_local_release_files(mirror, distr)
+
+        if not _rlfls:
+            for _name in ["InRelease", "Release"]:
+                _local, _fetch = self._get_file(mirror, posixpath.join("dists", distr, _name))
+
+                if _fetch:
+                    _fetch.done.wait()
+
+            _rlfls = self._config.get_local_release_files(mirror, distr)
+
+        if not _rlfls:
+            return dict()
+
+        _rlfl = _rlfls[0]
+        _key = _rlfl.get_local_path()
+        _signature = os.stat(_key).st_mtime_ns
+
+        with self._indices_lock:
+            _cached = self._indices.get(_key)
+
+            if _cached and _cached[0] == _signature:
+                return _cached[1]
+
+            _result = dict()
+            _rlfl.open()
+
+            for _fdict in _rlfl.get_subfiles().values():
+                _result[posixpath.sep.join(_fdict.get("sub"))] = _fdict
+
+                for _link in _fdict.get("by-hash") or list():
+                    _result[posixpath.sep.join(_link)] = _fdict
+
+            _rlfl.close()
+            self._indices[_key] = (_signature, _result)
+            return _result
+
+    def _get_pool_index(self, mirror):
+        """
+        Map of pool files listed in all local Packages of a mirror.
+        Packages not fetched yet are skipped, map is rebuilt when any Packages changes.
+        :return: dictionary 'Filename' => file data dictionary
+        """
+        _packages = list()
+
+        for _distr in mirror.get("distributives"):
+            _rlfls = self._config.get_local_release_files(mirror, _distr)
+
+            if not _rlfls:
+                continue
+
+            _rlfl = _rlfls[0]
+            _rlfl.open()
+
+            for _section in mirror.get("sections"):
+                for _arch in (mirror.get("architectures") or list()) + ["all"]:
+                    try:
+                        _pkgs = _rlfl.get_packages_file(_section, _arch)
+                    except ValueError as _e:
+                        logging.warning(str(_e))
+                        continue
+
+                    if _pkgs and _pkgs.get_local_paths():
+                        _packages.append(_pkgs)
+
+            _rlfl.close()
+
+        with self._lock:
+            _fetching = set(map(lambda x: x.path, self._fetches.values()))
+
+        _packages = list(filter(lambda x: not set(x.get_local_paths()) & _fetching, _packages))
+        _signature = sorted(map(lambda x: (x, os.stat(x).st_mtime_ns),
+            sum(map(lambda x: x.get_local_paths(), _packages), list())))
+        _key = mirror.get("destination")
+
+        with self._indices_lock:
+            _cached = self._indices.get(_key)
+
+            if _cached and _cached[0] == _signature:
+                return _cached[1]
+
+            _result = dict()
+
+            for _pkgs in _packages:
+                try:
+                    _result.update(map(lambda x: (x.get("Filename"), x), _pkgs.load_pool_records(
+                        PackagesIndexCache(MirrorState(mirror.get("destination")).get_path("indices")))))
+                except Exception as _e:
+                    logging.warning("Unable to read '%s': %s" % (_pkgs.get_local_path(), _e))
+                finally:
+                    _pkgs.forget()
+
+            logging.info("%d pool files are known for '%s'" % (len(_result), _key))
+            self._indices[_key] = (_signature, _result)
+            return _result
+
+    def _get_repofile(self, mirror, relpath):
+        """
+        Create file to be synchronized for a path requested
+        :return: tuple (RepoFile, expected size) or (None, None) if the path is not listed anywhere
+        """
+        _distr, _distr_relpath = self._get_distributive(mirror, relpath)
+
+        if _distr and _distr_relpath in self._release_files:
+            _class = RepoFileInRelease if _distr_relpath == "InRelease" else RepoFileRelease
+            _sub = ["dists", _distr, "InRelease" if _distr_relpath == "InRelease" else "Release"]
+            return _class(local=mirror.get("destination"), remote=mirror.get("source"), sub=_sub,
+                    cache=self._config.get_release_cache()), None
+
+        if _distr:
+            _fdict = self._get_release_index(mirror, _distr).get(relpath)
+        else:
+            _fdict = self._get_pool_index(mirror).get(relpath)
+
+        if not _fdict:
+            return None, None
+
+        _size = int(_fdict.get("Size", "0") or "0") or None
+        return RepoFileWithCheckSum(local=mirror.get("destination"), remote=mirror.get("source"),
+                fdict=_fdict, size=_size), _size
+
+    def _get_file(self, mirror, relpath):
+        """
+        Return local file or upstream fetch in progress for a path requested.
+        Fetch is started if the file is absent or broken.
+        :return: tuple (local path, _Fetch or None) or (None, None) if the path is unknown
+        """
+        _local = os.path.join(mirror.get("destination"), relpath.replace(posixpath.sep, os.path.sep))
+        _state = MirrorState(mirror.get("destination")).get_path()
+
+        # mirror state is private: journal, manifests, files verified
+        if (os.path.normpath(os.path.abspath(_local)) + os.path.sep).startswith(_state + os.path.sep):
+            logging.warning("'%s' is in mirror state folder, refused" % relpath)
+            return None, None
+
+        with self._lock:
+            _fetch = self._fetches.get(_local)
+
+        if _fetch:
+            return _local, _fetch
+
+        if os.path.isfile(_local) and relpath.split(posixpath.sep)[-1] in self._release_files:
+            return _local, None
+
+        _repofile, _size = self._get_repofile(mirror, relpath)
+
+        if not _repofile:
+            return (_local, None) if os.path.isfile(_local) else (None, None)
+
+        # 'by-hash' link requested: the file it points to is fetched
+        _target = _repofile.get_local_path()
+
+        # index itself may be absent while its 'by-hash' object is there
+        if os.path.isfile(_local) and (_size is None or os.path.isfile(_target) and os.path.getsize(_target) == _size):
+            return _local, None
+
+        with self._lock:
+            _fetch = self._fetches.get(_target)
+
+            if _fetch:
+                return _local, _fetch
+
+            _fetch = _Fetch(_target, _size)
+            self._fetches[_target] = _fetch
+
+        if _size is not None and os.path.exists(_target):
+            # broken or partial, removed to be streamed from the very beginning
+            os.remove(_target)
+
+        self._executor.submit(self._fetch, _fetch, _repofile)
+
+        if _target == _local:
+            return _local, _fetch
+
+        # links are created when fetch is done, no streaming
+        _fetch.done.wait()
+        return (_local, None) if _fetch.ok else (None, None)
+
+    def _fetch(self, fetch, repofile):
+        """
+        Synchronize a file from upstream, in worker thread
+        """
+        try:
+            fetch.ok = repofile.synchronize()
+        except Exception as _e:
+            logging.error("Fetching '%s' failed: %s" % (fetch.path, _e))
+            fetch.ok = False
+
+        if not fetch.ok and fetch.size is not None and os.path.exists(fetch.path):
+            os.remove(fetch.path)
+
+        with self._lock:
+            del(self._fetches[fetch.path])
+
+        fetch.done.set()
+
+    def handle(self, request, head=False):
+        """
+        Serve HTTP request
+        :param request: request handler
+        :type request: BaseHTTPRequestHandler
+        :param head: do not send body
+        :type head: bool
+        """
+        _mirror, _relpath = self.resolve(request.path)
+
+        if not _mirror:
+            request.send_error(404)
+            return
+
+        _local, _fetch = self._get_file(_mirror, _relpath)
+
+        if not _local:
+            request.send_error(404)
+            return
+
+        if not _fetch:
+            self._send_local(request, _local, head)
+            return
+
+        # wait for upstream to answer
+        while not os.path.exists(_fetch.path) and not _fetch.done.wait(0.05):
+            pass
+
+        if _fetch.size is None or head or not os.path.exists(_fetch.path):
+            _fetch.done.wait()
+
+            if not _fetch.ok:
+                request.send_error(404)
+                return
+
+            self._send_local(request, _local, head)
+            return
+
+        self._send_following(request, _fetch)
+
+    def _send_headers(self, request, size):
+        request.send_response(200)
+        request.send_header("Content-Type", "application/octet-stream")
+        request.send_header("Content-Length", str(size))
+        request.end_headers()
+
+    def _send_local(self, request, path, head):
+        """
+        Send a file from disk
+        """
+        try:
+            _fd = open(path, "rb")
+        except OSError:
+            request.send_error(404)
+            return
+
+        with _fd:
+            self._send_headers(request, os.fstat(_fd.fileno()).st_size)
+
+            if not head:
+                shutil.copyfileobj(_fd, request.wfile, self._chunk)
+
+    def _send_following(self, request, fetch):
+        """
+        Send a file while it is being written by upstream fetch
+        """
+        self._send_headers(request, fetch.size)
+        _sent = 0
+
+        with open(fetch.path, "rb") as _fd:
+            while _sent < fetch.size:
+                # checked before reading: nothing is written after fetch is done
+                _done = fetch.done.is_set()
+
+                if _done and not fetch.ok:
+                    break
+
+                _chunk = _fd.read(self._chunk)
+
+                if _chunk:
+                    request.wfile.write(_chunk)
+                    _sent += len(_chunk)
+                    continue
+
+                if _done:
+                    break
+
+                fetch.done.wait(0.05)
+
+        if _sent < fetch.size:
+            logging.error("Streaming '%s' interrupted at %d of %d bytes" % (fetch.path, _sent, fetch.size))
+            request.close_connection = True
+
+    def serve(self, address="", port=8080):
+        """
+        Serve until interrupted
+        :param address: address to listen on
+        :type address: str
+        :param port: port to listen on
+        :type port: int
+        """
+        _httpd = _ThreadingHTTPServer((address, port), _RequestHandler)
+        _httpd.mirror_server = self
+        logging.info("Listening on '%s:%d'" % (address, port))
+
+        try:
+            _httpd.serve_forever()
+        finally:
+            _httpd.server_close()
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,453 @@
+import glob
+import json
+import logging
+import os
+import shutil
+import zlib
+from tempfile import NamedTemporaryFile
+from .mirror_processor import MirrorProcessor
+from .mirror_state import MirrorState
+from .repofile_checksum import RepoFileWithCheckSum
+from .seed_index import SeedIndex
+from .trash_remover import TrashRemover
+
+class ShardError(Exception):
+    pass
+
+def get_shard(filename, shards):
+    """
+    Stable shard number for a pool file, the same in every process and on every host
+    :param filename: 'Filename' field of the file
+    :type filename: str
+    :param shards: number of shards
+    :type shards: int
+    """
+    return zlib.crc32(filename.encode("utf-8")) % shards
+
+def _save_json(path, data):
+    """
+    Store JSON data atomically, so a reader never sees a partial file
+    :param path: file path
+    :type path: str
+    :param data: data to store
+    """
+    with NamedTemporaryFile(mode='w', dir=os.path.dirname(path),
+            prefix=".%s." % os.path.basename(path), delete=False) as _fl_out:
+        json.dump(data, _fl_out)
+
+    os.replace(_fl_out.name, path)
+
+def publish_distributives(staging, destination):
+    """
+    Replace distributives metadata in mirror with staged one, a distributive folder at a time
+    :param staging: folder with 'dists' staged
+    :type staging: str
+    :param destination: mirror root
+    :type destination: str
+    """
+    _staged_dists = os.path.join(staging, "dists")
+
+    if not os.path.isdir(_staged_dists):
+        return
+
+    os.makedirs(os.path.join(destination, "dists"), exist_ok=True)
+
+    for _distr in os.listdir(_staged_dists):
+        _target = os.path.join(destination, "dists", _distr)
+        _old = None
+
+        if os.path.lexists(_target):
+            _old = os.path.join(destination, "dists", ".%s.old" % _distr)
+            os.rename(_target, _old)
+
+        logging.info("Publishing '%s'" % _target)
+        shutil.move(os.path.join(_staged_dists, _distr), _target)
+
+        if _old:
+            shutil.rmtree(_old)
+
+class ShardsWorkDir(object):
+    """
+    Layout of the folder shared by coordinator and workers:
+        plan.json - number of shards and mirrors planned,
+        shard-NNNN.jsonl - pool files of a shard, one JSON record per line,
+        manifest-NNNN.json - result of a shard synchronization,
+        legal-NNNN.txt - metadata files of a mirror, relative to its root,
+        staging/NNNN - metadata of a mirror downloaded, not yet published.
+    """
+    def __init__(self, path):
+        """
+        Initialization
+        :param path: work folder
+        :type path: str
+        """
+        self._path = os.path.abspath(path)
+
+    def get_path(self, name=None):
+        if not name:
+            return self._path
+
+        return os.path.join(self._path, name)
+
+    def get_plan_path(self):
+        return self.get_path("plan.json")
+
+    def get_shard_path(self, shard):
+        return self.get_path("shard-%04d.jsonl" % shard)
+
+    def get_manifest_path(self, shard):
+        return self.get_path("manifest-%04d.json" % shard)
+
+    def get_legal_path(self, mirror):
+        return self.get_path("legal-%04d.txt" % mirror)
+
+    def get_staging_path(self, mirror=None):
+        if mirror is None:
+            return self.get_path("staging")
+
+        return os.path.join(self.get_path("staging"), "%04d" % mirror)
+
+    def load_plan(self):
+        """
+        Return plan stored by coordinator
+        """
+        if not os.path.exists(self.get_plan_path()):
+            raise ShardError("No plan found in '%s'" % self._path)
+
+        with open(self.get_plan_path()) as _fl_in:
+            return json.load(_fl_in)
+
+    def save_plan(self, plan):
+        _save_json(self.get_plan_path(), plan)
+
+    def load_manifest(self, shard):
+        """
+        Return manifest of a shard
+        :param shard: shard number
+        :type shard: int
+        """
+        if not os.path.exists(self.get_manifest_path(shard)):
+            raise ShardError("Shard %d has not been synchronized: no manifest in '%s'" % (shard, self._path))
+
+        with open(self.get_manifest_path(shard)) as _fl_in:
+            return json.load(_fl_in)
+
+    def save_manifest(self, shard, manifest):
+        _save_json(self.get_manifest_path(shard), manifest)
+
+    def clean(self):
+        """
+        Remove everything left from previous plan
+        """
+        os.makedirs(self._path, exist_ok=True)
+
+        for _pattern in ["plan.json", "shard-*.jsonl", "manifest-*.json", "legal-*.txt"]:
+            for _path in glob.glob(self.get_path(_pattern)):
+                os.remove(_path)
+
+        if os.path.isdir(self.get_staging_path()):
+            shutil.rmtree(self.get_staging_path())
+
+class ShardPlanner(MirrorProcessor):
+    """
+    Coordinator: synchronizes metadata of all mirrors to staging folders
+    and splits pool files listed there into shards instead of synchronizing them
+    """
+    def __init__(self, args, work_dir, shards):
+        """
+        Initialization
+        :param args: arguments for processing, as for MirrorProcessor
+        :type args: argparse.Namespace
+        :param work_dir: folder shared with workers
+        :type work_dir: str
+        :param shards: number of shards
+        :type shards: int
+        """
+        super().__init__(args)
+
+        if shards < 1:
+            raise ValueError("Number of shards should be positive, not %d" % shards)
+
+        self._work_dir = ShardsWorkDir(work_dir)
+        self._shards = shards
+        self._shard_files = list()
+        self._mirror_index = None
+        self._seen = set()
+
+    def plan(self):
+        """
+        Synchronize metadata and write shards
+        :return: plan stored
+        """
+        self._work_dir.clean()
+        self._mirror_index = None
+        _plan = {"shards": self._shards, "mirrors": list()}
+        _selection = list()
+
+        for _mirror in self._config.get_mirrors():
+            if not _mirror.get("enabled", True):
+                logging.info("Mirroring '%s' is disabled" % _mirror.get("source"))
+                continue
+
+            _index = len(_plan.get("mirrors"))
+            _staging = self._work_dir.get_staging_path(_index)
+            _plan.get("mirrors").append({
+                "source": _mirror.get("source"),
+                "destination": os.path.abspath(_mirror.get("destination")),
+                "staging": _staging,
+                "seeds": _mirror.get("seeds")})
+            self._prepare_staging(_mirror.get("destination"), _staging)
+            _staged = dict(_mirror)
+            _staged["destination"] = _staging
+            _selection.append((_staged, None))
+
+        self._shard_files = list(map(lambda x: open(self._work_dir.get_shard_path(x), 'w'), range(self._shards)))
+
+        try:
+            self.process(selection=_selection)
+        finally:
+            for _fl in self._shard_files:
+                _fl.close()
+
+            self._shard_files = list()
+
+        self._work_dir.save_plan(_plan)
+        logging.info("Plan of %d shards is ready in '%s'" % (self._shards, self._work_dir.get_path()))
+        return _plan
+
+    def _prepare_staging(self, destination, staging):
+        """
+        Copy metadata published already to staging folder, so unchanged indices are not downloaded again.
+        Files are copied, not linked: indices are rewritten in place while synchronizing
+        :param destination: mirror root
+        :type destination: str
+        :param staging: staging folder of the mirror
+        :type staging: str
+        """
+        _dists = os.path.join(destination, "dists")
+
+        if not os.path.isdir(_dists):
+            os.makedirs(staging)
+            return
+
+        shutil.copytree(_dists, os.path.join(staging, "dists"), symlinks=True)
+
+    def _process_single_mirror(self, mirror, distributives=None):
+        """
+        Override to number mirrors in the order of plan
+        """
+        self._mirror_index = 0 if self._mirror_index is None else self._mirror_index + 1
+        self._seen = set()
+        super()._process_single_mirror(mirror, distributives)
+
+    def _get_verification_policy(self, mirror):
+        """
+        Override: staging is not a mirror root, nothing is to be kept there
+        """
+        return None
+
+    def _load_pool_state(self, mirror, distr):
+        """
+        Override: pool passes are done by workers, nothing is skipped or remembered
+        """
+        return None
+
+    def _get_journal(self, mirror):
+        """
+        Override: plan is made from scratch every time, nothing is to be resumed
+        """
+        return None
+
+    def _get_by_hash_retention(self, mirror):
+        """
+        Override: metadata is published by distributive at once by the merge step, nothing is retained
+        """
+        return None
+
+    def _remove_trash(self, root, exclude=None):
+        """
+        Override: store legal metadata files list for the merge step instead of removing anything
+        """
+        _root = os.path.abspath(root)
+        self._files.seek(0, 0)
+
+        with open(self._work_dir.get_legal_path(self._mirror_index), 'w') as _fl_out:
+            for _line in self._files:
+                _line = _line.strip()
+
+                if _line:
+                    _fl_out.write(os.path.relpath(_line, _root) + '\n')
+
+    def _process_section_architecture(self, mirror, distr, section, arch, rlfl):
+        """
+        Override: put pool files to shards
+        """
+        rlfl.open()
+        _pkgs = rlfl.get_packages_file(section, arch)
+        rlfl.close()
+
+        if not _pkgs:
+            logging.warning("Not found 'Packages' file for section '%s', architecture '%s'" % (section, arch))
+            return
+
+        with self._phase("pool_plan", mirror, distr):
+            _records = self._pool_records.pop(_pkgs.get_index_path(), None)
+
+            if _records is None:
+                _records = _pkgs.load_pool_records(self._index_cache)
+
+            for _fl in _records:
+                _filename = _fl.get("Filename")
+
+                # 'all' packages are listed for every architecture
+                if _filename in self._seen:
+                    continue
+
+                self._seen.add(_filename)
+                _record = {"mirror": self._mirror_index, "file": _fl}
+                self._shard_files[get_shard(_filename, self._shards)].write(json.dumps(_record) + '\n')
+
+            _pkgs.close()
+
+class ShardWorker(object):
+    """
+    Synchronizes pool files of a single shard and writes its manifest
+    """
+    def __init__(self, work_dir, shard):
+        """
+        Initialization
+        :param work_dir: folder shared with coordinator
+        :type work_dir: str
+        :param shard: shard number
+        :type shard: int
+        """
+        self._work_dir = ShardsWorkDir(work_dir)
+        self._shard = shard
+
+    def work(self):
+        """
+        Do synchronize the shard
+        :return: manifest
+        """
+        _plan = self._work_dir.load_plan()
+
+        if self._shard < 0 or self._shard >= _plan.get("shards"):
+            raise ShardError("Shard %d is out of plan of %d shards" % (self._shard, _plan.get("shards")))
+
+        _mirrors = _plan.get("mirrors")
+        _result = dict(map(lambda x: (str(x), {"files": list(), "failed": list()}), range(len(_mirrors))))
+        _seeds = dict()
+
+        with open(self._work_dir.get_shard_path(self._shard)) as _fl_in:
+            for _line in _fl_in:
+                if not _line.strip():
+                    continue
+
+                _record = json.loads(_line)
+                _mirror = _mirrors[_record.get("mirror")]
+                _fdict = _record.get("file")
+                _mirror_result = _result.get(str(_record.get("mirror")))
+
+                if _record.get("mirror") not in _seeds:
+                    _seeds[_record.get("mirror")] = SeedIndex(
+                            _mirror.get("seeds").get("directories"),
+                            _mirror.get("seeds").get("methods")) if _mirror.get("seeds") else None
+
+                _subfl = RepoFileWithCheckSum(
+                    local=_mirror.get("destination"),
+                    remote=_mirror.get("source"),
+                    fdict=_fdict,
+                    size=int(_fdict.get("Size", "0") or "0") or None,
+                    seeds=_seeds.get(_record.get("mirror")))
+                _subfl.check_create_local_path()
+
+                if not _subfl.check_before() and not _subfl.download():
+                    logging.error("Failed to synchronize '%s'" % _fdict.get("Filename"))
+                    _mirror_result.get("failed").append(_fdict.get("Filename"))
+                    continue
+
+                _mirror_result.get("files").extend(map(
+                    lambda x: os.path.relpath(x, _mirror.get("destination")), _subfl.get_local_paths()))
+
+        _manifest = {"shard": self._shard, "mirrors": _result}
+        self._work_dir.save_manifest(self._shard, _manifest)
+        logging.info("Shard %d is done: %d files, %d failed" % (self._shard,
+            sum(map(lambda x: len(x.get("files")), _result.values())),
+            sum(map(lambda x: len(x.get("failed")), _result.values()))))
+        return _manifest
+
+class ShardMerger(object):
+    """
+    Final step: checks all shards are done, publishes staged metadata and removes trash.
+    Metadata is published after all pool files are in place and trash is removed after that,
+    so clients always see indices consistent with the pool
+    """
+    def __init__(self, work_dir):
+        """
+        Initialization
+        :param work_dir: folder shared with coordinator and workers
+        :type work_dir: str
+        """
+        self._work_dir = ShardsWorkDir(work_dir)
+
+    def merge(self):
+        """
+        Do merge
+        :return: number of pool files failed to synchronize
+        """
+        _plan = self._work_dir.load_plan()
+        _manifests = list(map(lambda x: self._work_dir.load_manifest(x), range(_plan.get("shards"))))
+        _failed = 0
+
+        for _index, _mirror in enumerate(_plan.get("mirrors")):
+            _results = list(map(lambda x: x.get("mirrors").get(str(_index)), _manifests))
+            _failed += sum(map(lambda x: len(x.get("failed")), _results))
+            self._publish(_mirror.get("staging"), _mirror.get("destination"))
+            self._remove_trash(_index, _mirror.get("destination"), _results)
+
+        shutil.rmtree(self._work_dir.get_staging_path(), ignore_errors=True)
+
+        if _failed:
+            logging.warning("%d pool files have not been synchronized" % _failed)
+
+        return _failed
+
+    def _publish(self, staging, destination):
+        """
+        Replace distributives metadata in mirror with staged one
+        :param staging: staging folder of the mirror
+        :type staging: str
+        :param destination: mirror root
+        :type destination: str
+        """
+        publish_distributives(staging, destination)
+
+    def _remove_trash(self, index, destination, results):
+        """
+        Remove files neither listed in metadata nor synchronized by shards
+        :param index: mirror number in plan
+        :type index: int
+        :param destination: mirror root
+        :type destination: str
+        :param results: results of the mirror from all manifests
+        :type results: list(dict)
+        """
+        if not os.path.exists(self._work_dir.get_legal_path(index)):
+            raise ShardError("No metadata files list for '%s', plan is incomplete" % destination)
+
+        _files = NamedTemporaryFile(mode='w+')
+
+        with open(self._work_dir.get_legal_path(index)) as _fl_in:
+            for _line in _fl_in:
+                if _line.strip():
+                    _files.write(os.path.join(destination, _line.strip()) + '\n')
+
+        for _result in results:
+            for _path in _result.get("files"):
+                _files.write(os.path.join(destination, _path) + '\n')
+
+        _files.flush()
+        _tr = TrashRemover(_files, destination, exclude=[MirrorState(destination).get_path()])
+        _tr.remove_trash()
+        _tr.get_temp().close()
+        logging.info("%d obsolete files removed from '%s'" % (_tr.get_removed_count(), destination))
@@ -0,0 +1,65 @@
+import json
+import logging
+import os
+from tempfile import NamedTemporaryFile
+
+class MirrorState(object):
+    """
+    Persistent state of a mirror kept between runs in a folder inside its destination.
+    The folder is never considered as trash.
+    """
+    dirname = ".debian_local_mirror"
+
+    def __init__(self, destination):
+        """
+        Initialization
+        :param destination: mirror root
+        :type destination: str
+        """
+        self._path = os.path.join(os.path.abspath(destination), self.dirname)
+
+    def get_path(self, name=None):
+        """
+        Return path of the state folder or of a file in it
+        :param name: file name
+        :type name: str
+        """
+        if not name:
+            return self._path
+
+        return os.path.join(self._path, name)
+
+    def load(self, name, default=None):
+        """
+        Load JSON data stored
+        :param name: file name
+        :type name: str
+        :param default: value returned if nothing stored or data is unreadable
+        """
+        _path = self.get_path(name)
+
+        if not os.path.exists(_path):
+            return default
+
+        try:
+            with open(_path) as _fl_in:
+                return json.load(_fl_in)
+        except ValueError as _e:
+            logging.warning("State file '%s' is broken, ignored: %s" % (_path, _e))
+            return default
+
+    def save(self, name, data):
+        """
+        Store JSON data atomically
+        :param name: file name
+        :type name: str
+        :param data: data to store
+        """
+        os.makedirs(self._path, exist_ok=True)
+        _path = self.get_path(name)
+
+        with NamedTemporaryFile(mode='w', dir=self._path, prefix=".%s." % name, delete=False) as _fl_out:
+            json.dump(data, _fl_out)
+
+        os.replace(_fl_out.name, _path)
+        logging.debug("State saved: '%s'" % _path)
@@ -0,0 +1,242 @@
+import logging
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from .repofile_checksum import RepoFileWithCheckSum
+from .metadata_filter import MetadataFilter
+from .mirror_state import MirrorState
+from .packages_index import PackagesIndexCache
+from .by_hash_retention import ByHashRetention
+
+def _verify_file(item):
+    """
+    Worker: verify single local file
+    :param item: tuple (destination, file data dictionary)
+    :type item: tuple
+    :return: tuple (local path, 'ok' / 'missing' / 'corrupt')
+    """
+    _destination, _fdict = item
+    _fl = RepoFileWithCheckSum(
+            remote="",
+            local=_destination,
+            fdict=_fdict,
+            size=int(_fdict.get("Size", "0") or "0") or None)
+
+    return _fl.get_local_path(), _fl.verify()
+
+def get_default_workers(path):
+    """
+    Number of verification processes for a folder: one per core,
+    twice as much for non-rotational disk with queue deep enough to keep reads overlapped
+    :param path: folder to be verified
+    :type path: str
+    """
+    _cpus = os.cpu_count() or 1
+    _st = os.stat(path)
+    _queue = None
+
+    for _dev in ["%d:%d" % (os.major(_st.st_dev), os.minor(_st.st_dev)),
+            "%d:%d/.." % (os.major(_st.st_dev), os.minor(_st.st_dev))]:
+        _queue_dir = os.path.join("/sys/dev/block", _dev, "queue")
+
+        if not os.path.isdir(_queue_dir):
+            continue
+
+        try:
+            with open(os.path.join(_queue_dir, "rotational")) as _fl_in:
+                _rotational = _fl_in.read().strip() == "1"
+
+            with open(os.path.join(_queue_dir, "nr_requests")) as _fl_in:
+                _queue = int(_fl_in.read().strip())
+        except (OSError, ValueError) as _e:
+            logging.debug("Unable to read queue parameters from '%s': %s" % (_queue_dir, _e))
+            break
+
+        if not _rotational and _queue >= 2 * _cpus:
+            return 2 * _cpus
+
+        break
+
+    return _cpus
+
+class MirrorVerifier(object):
+    """
+    Offline verification of local mirrors: every file referenced by local Release / InRelease
+    and Packages is re-hashed in a pool of processes.
+    Reports missing, corrupt and orphaned (not referenced) files.
+    """
+    def __init__(self, config, workers=None, quarantine=None, chunk=64):
+        """
+        Initialization
+        :param config: mirrors configuration
+        :type config: MirrorsConfig
+        :param workers: number of processes, detected by destination disk if not given
+        :type workers: int
+        :param quarantine: folder to move corrupt and orphaned files to, nothing is moved if not given
+        :type quarantine: str
+        :param chunk: files per task sent to a process
+        :type chunk: int
+        """
+        self._config = config
+        self._workers = workers
+        self._quarantine = os.path.abspath(quarantine) if quarantine else None
+        self._chunk = chunk
+
+    def _get_files(self, mirror):
+        """
+        Collect files referenced by local metadata of a mirror
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :return: tuple (list of file data dictionaries, set of other legal local paths)
+        """
+        _files = list()
+        # superseded 'by-hash' objects retained
+        _legal = set(ByHashRetention(mirror.get("destination")).get_retained())
+        _metadata_filter = MetadataFilter(mirror.get("metadata")) if mirror.get("metadata") else None
+        _index_cache = PackagesIndexCache(MirrorState(mirror.get("destination")).get_path("indices"))
+
+        for _distr in mirror.get("distributives"):
+            _rlfls = self._config.get_local_release_files(mirror, _distr)
+
+            if not _rlfls:
+                logging.error("No local Release / InRelease for '%s' distributive '%s'" %
+                        (mirror.get("destination"), _distr))
+                continue
+
+            for _rlfl in _rlfls:
+                _legal.update(_rlfl.get_local_paths())
+
+            _rlfl = _rlfls[0]
+            _rlfl.open()
+
+            for _fdict in _rlfl.get_subfiles(metadata_filter=_metadata_filter).values():
+                _subfl = RepoFileWithCheckSum(remote="", local=mirror.get("destination"), fdict=_fdict)
+
+                # metadata may be absent upstream also, it is not an error
+                if not os.path.exists(_subfl.get_local_path()):
+                    continue
+
+                _files.append(_fdict)
+                _legal.update(_subfl.get_link_paths())
+
+            _archs = list(mirror.get("architectures") or list())
+
+            if "all" not in _archs and not _rlfl.skip_all_architecture():
+                _archs.append("all")
+
+            for _section in mirror.get("sections"):
+                for _arch in _archs:
+                    _pkgs = None
+
+                    # corrupt index itself is reported with other metadata
+                    try:
+                        _pkgs = _rlfl.get_packages_file(_section, _arch)
+
+                        if not _pkgs:
+                            continue
+
+                        _files += _pkgs.load_pool_records(_index_cache)
+                    except Exception as _e:
+                        logging.error("Unable to read 'Packages' for '%s' distributive '%s' section '%s' "
+                                "architecture '%s', its pool files are not verified: %s" %
+                                (mirror.get("destination"), _distr, _section, _arch, _e))
+
+                    if _pkgs:
+                        _pkgs.forget()
+
+            _rlfl.close()
+
+        return _files, _legal
+
+    def _get_orphaned(self, destination, legal):
+        """
+        Walk destination and return files not referenced
+        :param destination: mirror root
+        :type destination: str
+        :param legal: all legal local paths
+        :type legal: set
+        """
+        _result = list()
+
+        _exclude = [MirrorState(destination).get_path()]
+
+        if self._quarantine:
+            _exclude.append(self._quarantine)
+
+        for _root, _dirs, _files in os.walk(destination):
+            _dirs[:] = list(filter(lambda x: os.path.abspath(os.path.join(_root, x)) not in _exclude, _dirs))
+
+            for _name in _files:
+                _path = os.path.abspath(os.path.join(_root, _name))
+
+                if _path not in legal:
+                    _result.append(_path)
+
+        _result.sort()
+        return _result
+
+    def _quarantine_file(self, destination, path):
+        """
+        Move a file to quarantine keeping its path relative to destination
+        """
+        _target = os.path.join(self._quarantine, os.path.relpath(path, destination))
+        os.makedirs(os.path.dirname(_target), exist_ok=True)
+        logging.info("Quarantine: '%s' ==> '%s'" % (path, _target))
+        shutil.move(path, _target)
+        return _target
+
+    def verify_mirror(self, mirror):
+        """
+        Verify single mirror
+        :param mirror: mirror configuration
+        :type mirror: dict
+        :return: report dictionary
+        """
+        _destination = mirror.get("destination")
+        logging.info("Verifying '%s'" % _destination)
+        _files, _legal = self._get_files(mirror)
+
+        # the same pool file may be referenced from several indices
+        _unique = dict()
+
+        for _fdict in _files:
+            _unique[os.path.sep.join(_fdict.get("sub"))] = _fdict
+
+        _workers = self._workers or get_default_workers(_destination)
+        logging.info("Verifying %d files with %d processes" % (len(_unique), _workers))
+        _result = {"destination": _destination, "checked": len(_unique), "missing": list(), "corrupt": list()}
+
+        with ProcessPoolExecutor(max_workers=_workers) as _executor:
+            for _path, _status in _executor.map(_verify_file,
+                    map(lambda x: (_destination, x), _unique.values()), chunksize=self._chunk):
+                _legal.add(_path)
+
+                if _status != "ok":
+                    logging.warning("%s: '%s'" % (_status.capitalize(), _path))
+                    _result[_status].append(_path)
+
+        _result["missing"].sort()
+        _result["corrupt"].sort()
+        _result["orphaned"] = self._get_orphaned(_destination, _legal)
+
+        if self._quarantine:
+            _result["quarantined"] = list(map(lambda x: self._quarantine_file(_destination, x),
+                _result["corrupt"] + _result["orphaned"]))
+
+        return _result
+
+    def verify(self):
+        """
+        Verify all enabled mirrors
+        :return: list of report dictionaries
+        """
+        _result = list()
+
+        for _mirror in self._config.get_mirrors():
+            if not _mirror.get("enabled", True):
+                logging.info("Mirror '%s' is disabled" % _mirror.get("source"))
+                continue
+
+            _result.append(self.verify_mirror(_mirror))
+
+        return _result
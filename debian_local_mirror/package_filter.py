@@ -0,0 +1,185 @@
+import fnmatch
+import logging
+import re
+
+class PackageFilter(object):
+    """
+    Select packages by include / exclude rules and resolve
+    dependencies closure of the selection over all 'Packages' indices given.
+    Packages are selected by name, so every architecture of a package selected is kept.
+    """
+    _rule_keys = ["names", "sections", "priorities"]
+    _dep_split_re = re.compile('[\\s(\\[<]')
+
+    def __init__(self, cfg):
+        """
+        Initialization
+        :param cfg: filter configuration:
+            {"include": rules, "exclude": rules, "recommends": bool},
+            rules: {"names": [globs], "sections": [sections], "priorities": [priorities]}
+        :type cfg: dict
+        """
+        self._include = cfg.get("include") or dict()
+        self._exclude = cfg.get("exclude") or dict()
+        self._dep_fields = ["Pre-Depends", "Depends"]
+
+        if cfg.get("recommends", True):
+            self._dep_fields.append("Recommends")
+
+        self._names_re = dict()
+
+        for _key, _rules in [("include", self._include), ("exclude", self._exclude)]:
+            if _rules.get("names"):
+                self._names_re[_key] = re.compile(
+                        '|'.join(map(lambda x: "(?:%s)" % fnmatch.translate(x), _rules.get("names"))))
+
+        self._deps = dict()
+        self._provides = dict()
+        self._seeds = set()
+        self._excluded = set()
+        self._not_excluded = set()
+        self._selected = None
+
+    def _match(self, key, record):
+        """
+        Check if a record matches rules
+        :param key: 'include' or 'exclude'
+        :type key: str
+        :param record: 'Packages' record
+        :type record: dict
+        """
+        _rules = self._include if key == "include" else self._exclude
+        _names_re = self._names_re.get(key)
+
+        if _names_re and _names_re.match(record.get("Package", "")):
+            return True
+
+        _section = record.get("Section") or ""
+
+        # sections are given with component sometimes: 'contrib/net'
+        if _rules.get("sections") and (
+                _section in _rules.get("sections") or _section.split('/')[-1] in _rules.get("sections")):
+            return True
+
+        if _rules.get("priorities") and record.get("Priority") in _rules.get("priorities"):
+            return True
+
+        return False
+
+    def _parse_relations(self, value):
+        """
+        Parse relationship field value: 'a (>= 1), b:any | c [amd64]'
+        :return: list of alternatives lists: [['a'], ['b', 'c']]
+        """
+        if isinstance(value, list):
+            value = ' '.join(value)
+
+        _result = list()
+
+        for _group in value.split(','):
+            _alternatives = list()
+
+            for _alternative in _group.split('|'):
+                _name = self._dep_split_re.split(_alternative.strip(), 1)[0].split(':')[0]
+
+                if _name:
+                    _alternatives.append(_name)
+
+            if _alternatives:
+                _result.append(_alternatives)
+
+        return _result
+
+    def add_index(self, records):
+        """
+        Collect data needed for resolution from single 'Packages' index
+        :param records: parsed 'Packages' records
+        :type records: list(dict)
+        """
+        self._selected = None
+
+        for _record in records:
+            _name = _record.get("Package")
+
+            if not _name:
+                continue
+
+            if self._match("exclude", _record):
+                self._excluded.add(_name)
+                continue
+
+            self._not_excluded.add(_name)
+
+            if self._match("include", _record):
+                self._seeds.add(_name)
+
+            _deps = self._deps.setdefault(_name, list())
+
+            for _field in self._dep_fields:
+                if _record.get(_field):
+                    _deps += self._parse_relations(_record.get(_field))
+
+            if _record.get("Provides"):
+                for _alternatives in self._parse_relations(_record.get("Provides")):
+                    for _virtual in _alternatives:
+                        self._provides.setdefault(_virtual, set()).add(_name)
+
+    def _is_available(self, name):
+        """
+        Package is present in some index and has at least one record not excluded
+        """
+        return name in self._not_excluded
+
+    def resolve(self):
+        """
+        Resolve dependencies closure of packages included
+        :return: set of packages names selected
+        """
+        self._selected = set()
+        _queue = list(sorted(filter(self._is_available, self._seeds)))
+        self._selected.update(_queue)
+
+        while _queue:
+            _name = _queue.pop()
+
+            for _alternatives in self._deps.get(_name, list()):
+                if any(map(lambda x: x in self._selected, _alternatives)):
+                    continue
+
+                # the first real alternative available, as apt does
+                _real = list(filter(self._is_available, _alternatives))
+
+                if _real:
+                    _new = [_real[0]]
+                else:
+                    # virtual packages: every provider, since we do not know which one will be installed
+                    _new = list()
+
+                    for _alternative in _alternatives:
+                        _new += sorted(filter(self._is_available, self._provides.get(_alternative, set())))
+
+                if not _new:
+                    logging.debug("Dependency '%s' of '%s' can not be satisfied" % (' | '.join(_alternatives), _name))
+                    continue
+
+                for _package in _new:
+                    if _package in self._selected:
+                        continue
+
+                    self._selected.add(_package)
+                    _queue.append(_package)
+
+        logging.info("Packages selected: %d of %d (%d explicitly included)" %
+                (len(self._selected), len(self._not_excluded | self._excluded), len(self._seeds)))
+        return self._selected
+
+    def is_selected(self, record):
+        """
+        Check if a record is to be kept
+        :param record: 'Packages' record
+        :type record: dict
+        """
+        if self._selected is None:
+            raise ValueError("Packages filter has not been resolved yet")
+
+        return record.get("Package") in self._selected and not self._match("exclude", record)
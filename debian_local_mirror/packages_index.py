@@ -0,0 +1,276 @@
+import binascii
+import json
+import logging
+import mmap
+import os
+import posixpath
+import struct
+import sys
+import time
+from array import array
+from tempfile import NamedTemporaryFile
+
+class PackagesIndex(object):
+    """
+    Compact binary index of parsed 'Packages' file, memory-mapped read-only.
+    Records are kept column by column: sizes, string tables with offsets for
+    'Package', 'Version' and 'Filename', raw digest bytes for every checksum type,
+    so a record is decoded only when accessed.
+    Layout: magic, JSON header length, JSON header, columns aligned to 8 bytes.
+    """
+    magic = b"DLMPIDX1"
+    strings = ["Package", "Version", "Filename"]
+    digests = {"MD5sum": 16, "MD5Sum": 16, "SHA1": 20, "SHA256": 32, "SHA512": 64}
+
+    # size is optional in records
+    _no_size = 2 ** 64 - 1
+
+    @classmethod
+    def write(cls, path, key, records):
+        """
+        Write index of records atomically
+        :param path: index file path
+        :type path: str
+        :param key: SHA256 of 'Packages' file the records are parsed from
+        :type key: str
+        :param records: parsed records
+        :type records: list(dict)
+        """
+        _count = len(records)
+        _columns = list()
+        _sizes = array('Q', map(lambda x: int(x.get("Size")) if x.get("Size") else cls._no_size, records))
+        _columns.append(("Size", _sizes.tobytes()))
+
+        for _field in cls.strings:
+            _offsets = array('Q', [0])
+            _data = bytearray()
+
+            for _record in records:
+                _data += (_record.get(_field) or "").encode("utf-8")
+                _offsets.append(len(_data))
+
+            _columns.append(("%s.offsets" % _field, _offsets.tobytes()))
+            _columns.append(("%s.data" % _field, bytes(_data)))
+
+        # digest column is kept only if every record has it
+        _digests = list(filter(lambda x: _count and all(map(lambda y: y.get(x), records)), cls.digests.keys()))
+
+        for _field in _digests:
+            _columns.append((_field, b''.join(map(lambda x: binascii.unhexlify(x.get(_field)), records))))
+
+        _offset = 0
+        _layout = dict()
+
+        for _name, _data in _columns:
+            _layout[_name] = [_offset, len(_data)]
+            _offset += cls._padded(len(_data))
+
+        _header = json.dumps({"key": key, "count": _count, "byteorder": sys.byteorder,
+            "digests": _digests, "columns": _layout}).encode("utf-8")
+        _header += b' ' * (cls._padded(len(cls.magic) + 8 + len(_header)) - len(cls.magic) - 8 - len(_header))
+        _dirpath = os.path.dirname(path)
+        os.makedirs(_dirpath, exist_ok=True)
+
+        with NamedTemporaryFile(mode='wb', dir=_dirpath, prefix=".%s." % os.path.basename(path),
+                delete=False) as _fl_out:
+            _fl_out.write(cls.magic)
+            _fl_out.write(struct.pack("<Q", len(_header)))
+            _fl_out.write(_header)
+
+            for _name, _data in _columns:
+                _fl_out.write(_data)
+                _fl_out.write(b'\0' * (cls._padded(len(_data)) - len(_data)))
+
+        os.replace(_fl_out.name, path)
+        logging.debug("Index of %d records written: '%s'" % (_count, path))
+
+    @classmethod
+    def _padded(cls, length):
+        return (length + 7) // 8 * 8
+
+    def __init__(self, path):
+        """
+        Map index file
+        :param path: index file path
+        :type path: str
+        """
+        self._path = path
+        self._mmap = None
+        self._views = dict()
+
+        with open(path, "rb") as _fl_in:
+            if os.fstat(_fl_in.fileno()).st_size < len(self.magic) + 8:
+                raise ValueError("Index '%s' is truncated" % path)
+
+            self._mmap = mmap.mmap(_fl_in.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(self.magic)] != self.magic:
+            self.close()
+            raise ValueError("Index '%s' has wrong format" % path)
+
+        _length = struct.unpack("<Q", self._mmap[len(self.magic):len(self.magic) + 8])[0]
+        _start = len(self.magic) + 8
+        self._header = json.loads(self._mmap[_start:_start + _length].decode("utf-8"))
+        self._base = _start + _length
+
+        if self._header.get("byteorder") != sys.byteorder:
+            self.close()
+            raise ValueError("Index '%s' has been written on another platform" % path)
+
+        self._count = self._header.get("count")
+        self._digests = self._header.get("digests")
+
+    def _column(self, name, fmt='B'):
+        """
+        Return memory view of a column
+        :param name: column name
+        :type name: str
+        :param fmt: format of items
+        :type fmt: str
+        """
+        _view = self._views.get(name)
+
+        if _view is None:
+            _offset, _length = self._header.get("columns").get(name)
+            _view = memoryview(self._mmap)[self._base + _offset:self._base + _offset + _length]
+
+            if fmt != 'B':
+                _view = _view.cast(fmt)
+
+            self._views[name] = _view
+
+        return _view
+
+    def get_key(self):
+        """
+        Return SHA256 of 'Packages' file the index is built from
+        """
+        return self._header.get("key")
+
+    def get_record(self, number):
+        """
+        Decode single record with fields necessary for pool synchronization
+        :param number: record number
+        :type number: int
+        """
+        _result = dict()
+
+        for _field in self.strings:
+            _offsets = self._column("%s.offsets" % _field, 'Q')
+            _result[_field] = str(self._column("%s.data" % _field)[_offsets[number]:_offsets[number + 1]],
+                    "utf-8")
+
+        _size = self._column("Size", 'Q')[number]
+
+        if _size != self._no_size:
+            _result["Size"] = str(_size)
+
+        for _field in self._digests:
+            _length = self.digests.get(_field)
+            _result[_field] = self._column(_field)[number * _length:(number + 1) * _length].hex()
+
+        _result["sub"] = _result.get("Filename").split(posixpath.sep)
+        return _result
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for _number in range(self._count):
+            yield self.get_record(_number)
+
+    def close(self):
+        """
+        Unmap index file
+        """
+        for _view in self._views.values():
+            _view.release()
+
+        self._views = dict()
+
+        if self._mmap:
+            self._mmap.close()
+            self._mmap = None
+
+    def __del__(self):
+        self.close()
+
+class PackagesIndexCache(object):
+    """
+    Folder with binary indices of 'Packages' files, named by SHA256 of the file indexed,
+    so the same index is never parsed twice while it has not been changed.
+    Indices not used for a while are pruned.
+    """
+    def __init__(self, directory, max_age=7 * 24 * 3600):
+        """
+        Initialization
+        :param directory: cache folder
+        :type directory: str
+        :param max_age: seconds an unused index is kept for
+        :type max_age: int
+        """
+        self._directory = directory
+        self._max_age = max_age
+
+    def _get_path(self, key):
+        return os.path.join(self._directory, "%s.pidx" % key)
+
+    def get(self, key):
+        """
+        Return index for a 'Packages' checksum
+        :param key: SHA256 of 'Packages' file
+        :type key: str
+        :return: PackagesIndex or None if not cached
+        """
+        _path = self._get_path(key)
+
+        if not os.path.exists(_path):
+            return None
+
+        try:
+            _index = PackagesIndex(_path)
+        except (OSError, ValueError) as _e:
+            logging.warning("Cached index '%s' is broken, ignored: %s" % (_path, _e))
+            return None
+
+        if _index.get_key() != key:
+            logging.warning("Cached index '%s' is for another file, ignored" % _path)
+            _index.close()
+            return None
+
+        # mark as used for pruning, read-only mirror is served as is
+        try:
+            os.utime(_path)
+        except OSError as _e:
+            logging.debug("Unable to mark '%s' as used: %s" % (_path, _e))
+
+        return _index
+
+    def put(self, key, records):
+        """
+        Build index for a 'Packages' checksum
+        :param key: SHA256 of 'Packages' file
+        :type key: str
+        :param records: parsed records
+        :type records: list(dict)
+        :return: PackagesIndex
+        """
+        _path = self._get_path(key)
+        PackagesIndex.write(_path, key, records)
+        return PackagesIndex(_path)
+
+    def prune(self):
+        """
+        Remove indices not used for longer than allowed
+        """
+        if not os.path.isdir(self._directory):
+            return
+
+        _limit = time.time() - self._max_age
+
+        for _name in os.listdir(self._directory):
+            _path = os.path.join(self._directory, _name)
+
+            if os.path.isfile(_path) and os.path.getmtime(_path) < _limit:
+                logging.debug("Removing unused index '%s'" % _path)
+                os.remove(_path)
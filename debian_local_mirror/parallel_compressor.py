@@ -0,0 +1,235 @@
+import bz2
+import gzip
+import logging
+import lzma
+import multiprocessing
+import os
+from .repofile_checksum import new_checksum
+
+class _HashingWriter(object):
+    """
+    File-like object calculating size and checksums of data written through it
+    """
+    def __init__(self, fd, cs_types):
+        """
+        Initialization
+        :param fd: binary file object to write to
+        :param cs_types: checksums fields names, as in metadata
+        :type cs_types: list(str)
+        """
+        self._fd = fd
+        self._size = 0
+        self._hashes = dict()
+
+        # there are "MD5Sum" and "MD5sum" for example, calculate once
+        for _cs_type in cs_types:
+            if _cs_type.lower() not in self._hashes:
+                self._hashes[_cs_type.lower()] = new_checksum(_cs_type)
+
+        self._cs_types = cs_types
+
+    def write(self, data):
+        self._fd.write(data)
+        self._size += len(data)
+
+        for _hashobj in self._hashes.values():
+            _hashobj.update(data)
+
+        return len(data)
+
+    def flush(self):
+        self._fd.flush()
+
+    def get_result(self):
+        """
+        Return dictionary with 'Size' and all checksums types requested
+        """
+        _result = {"Size": self._size}
+
+        for _cs_type in self._cs_types:
+            _result[_cs_type] = self._hashes.get(_cs_type.lower()).hexdigest()
+
+        return _result
+
+def _open_compressor(ext, path, fd):
+    """
+    Open compressor for an extension over file object given
+    :param ext: file extension
+    :type ext: str
+    :param path: final path of the file (used for gzip header)
+    :type path: str
+    :param fd: binary file object to write compressed data to
+    """
+    if ext == "":
+        return fd
+
+    if ext == ".gz":
+        return gzip.GzipFile(filename=path, mode="wb", fileobj=fd)
+
+    if ext == ".bz2":
+        return bz2.BZ2File(fd, mode="wb")
+
+    if ext in [".xz", ".lzma"]:
+        return lzma.LZMAFile(fd, mode="wb")
+
+    raise NotImplementedError("Can not compress to '%s'" % ext)
+
+def _compress_worker(conn, ext, path, tmp_path, cs_types):
+    """
+    Worker process: read chunks from connection, compress them to temporary file
+    :param conn: connection to read chunks from, empty chunk means end of data
+    :param ext: file extension
+    :type ext: str
+    :param path: final path of the file
+    :type path: str
+    :param tmp_path: temporary path to write to
+    :type tmp_path: str
+    :param cs_types: checksums fields to calculate for compressed data
+    :type cs_types: list(str)
+    """
+    try:
+        with open(tmp_path, mode="wb") as _fl_out:
+            _hashing = _HashingWriter(_fl_out, cs_types)
+            _compressor = _open_compressor(ext, path, _hashing)
+
+            while True:
+                _chunk = conn.recv_bytes()
+
+                if not _chunk:
+                    break
+
+                _compressor.write(_chunk)
+
+            if _compressor is not _hashing:
+                _compressor.close()
+
+            _hashing.flush()
+
+        conn.send(("ok", _hashing.get_result()))
+    except Exception as _e:
+        conn.send(("error", "%s: %s" % (type(_e).__name__, _e)))
+    finally:
+        conn.close()
+
+class ParallelCompressor(object):
+    """
+    File-like object streaming data written once into several files
+    with different compression at once, every one in its own worker process.
+    Size and checksums of every resulting file are calculated on the fly.
+    Files are replaced at 'close' only, so readers never get partial content.
+    """
+    def __init__(self, outputs, cs_types, chunk=1 * 1024 * 1024, encoding="utf-8"):
+        """
+        Initialization
+        :param outputs: map file extension => path to write to
+        :type outputs: dict
+        :param cs_types: checksums fields to calculate, as in metadata ('MD5Sum', 'SHA256' etc.)
+        :type cs_types: list(str)
+        :param chunk: size of chunk to send to workers, in characters
+        :type chunk: int
+        :param encoding: encoding of the text written, None if bytes are written
+        :type encoding: str
+        """
+        self._chunk = chunk
+        self._encoding = encoding
+        self._buffer = list()
+        self._buffered = 0
+        self._workers = dict()
+
+        for _ext, _path in outputs.items():
+            _tmp_path = "%s.%d.tmp" % (_path, os.getpid())
+            _conn_parent, _conn_child = multiprocessing.Pipe()
+            _proc = multiprocessing.Process(
+                    target=_compress_worker,
+                    args=(_conn_child, _ext, _path, _tmp_path, cs_types))
+            _proc.daemon = True
+            _proc.start()
+            _conn_child.close()
+            logging.debug("Compression worker %d started for '%s'" % (_proc.pid, _path))
+            self._workers[_ext] = {"path": _path, "tmp_path": _tmp_path, "conn": _conn_parent, "proc": _proc}
+
+    def _send(self, data):
+        """
+        Send data chunk to all workers
+        """
+        for _worker in self._workers.values():
+            _worker["conn"].send_bytes(data)
+
+    def _flush_buffer(self):
+        """
+        Send buffered data to workers
+        """
+        if not self._buffered:
+            return
+
+        if self._encoding is None:
+            self._send(b''.join(self._buffer))
+        else:
+            self._send(''.join(self._buffer).encode(self._encoding))
+
+        self._buffer = list()
+        self._buffered = 0
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+
+        if self._buffered >= self._chunk:
+            self._flush_buffer()
+
+        return len(data)
+
+    def flush(self):
+        self._flush_buffer()
+
+    def _stop_workers(self):
+        """
+        Send end-of-data to all workers and collect results
+        :return: map extension => (status, result)
+        """
+        _results = dict()
+
+        for _ext, _worker in self._workers.items():
+            try:
+                _worker["conn"].send_bytes(b"")
+                _results[_ext] = _worker["conn"].recv()
+            except (EOFError, OSError) as _e:
+                _results[_ext] = ("error", "worker died: %s" % _e)
+
+            _worker["conn"].close()
+            _worker["proc"].join()
+
+        return _results
+
+    def _remove_temporary(self):
+        for _worker in self._workers.values():
+            if os.path.exists(_worker["tmp_path"]):
+                os.remove(_worker["tmp_path"])
+
+    def abort(self):
+        """
+        Stop all workers and remove partial results
+        """
+        self._buffer = list()
+        self._buffered = 0
+        self._stop_workers()
+        self._remove_temporary()
+
+    def close(self):
+        """
+        Finish writing and replace all files
+        :return: map extension => {'Size': size, checksum type: hex digest}
+        """
+        self._flush_buffer()
+        _results = self._stop_workers()
+        _errors = list(filter(lambda x: x[1][0] != "ok", _results.items()))
+
+        if _errors:
+            self._remove_temporary()
+            raise RuntimeError("Compression failed: %s" %
+                    '; '.join(map(lambda x: "'%s': %s" % (self._workers[x[0]]["path"], x[1][1]), _errors)))
+
+        for _worker in self._workers.values():
+            os.replace(_worker["tmp_path"], _worker["path"])
+
+        return dict(map(lambda x: (x[0], x[1][1]), _results.items()))
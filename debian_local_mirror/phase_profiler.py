@@ -0,0 +1,192 @@
+import cProfile
+import json
+import logging
+import os
+import re
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+class PhaseProfiler(object):
+    """
+    Wall and CPU time accounting for mirroring phases.
+    Phases may be nested, time is attributed to the innermost phase only.
+    Optionally collects cProfile statistics and top tracemalloc allocation sites per phase.
+    """
+
+    def __init__(self, out_dir=None, top=25):
+        """
+        Initialization
+        :param out_dir: directory to dump cProfile and tracemalloc data to, nothing is dumped if not given
+        :type out_dir: str
+        :param top: number of tracemalloc allocation sites to dump per phase entry
+        :type top: int
+        """
+        self._out_dir = os.path.abspath(out_dir) if out_dir else None
+        self._top = top
+        self._phases = dict()
+        self._profiles = dict()
+        self._stack = list()
+
+        if not self._out_dir:
+            return
+
+        if not os.path.isdir(self._out_dir):
+            logging.debug("Creating profile output folder: '%s'" % self._out_dir)
+            os.makedirs(self._out_dir)
+
+        if not tracemalloc.is_tracing():
+            logging.info("Starting tracemalloc for per-phase allocation statistics")
+            tracemalloc.start()
+
+    def _get_record(self, key):
+        """
+        Return accounting record for a phase key, create if not exist
+        :param key: (mirror, distributive, phase)
+        :type key: tuple
+        """
+        if key not in self._phases:
+            self._phases[key] = {"calls": 0, "wall": 0.0, "cpu": 0.0}
+
+        return self._phases[key]
+
+    def _suspend(self, frame):
+        """
+        Stop time accounting for a stack frame
+        """
+        _record = self._get_record(frame["key"])
+        _record["wall"] += time.perf_counter() - frame["wall"]
+        _record["cpu"] += time.process_time() - frame["cpu"]
+
+        if frame["profile"]:
+            frame["profile"].disable()
+
+    def _resume(self, frame):
+        """
+        (Re-)start time accounting for a stack frame
+        """
+        if frame["profile"]:
+            frame["profile"].enable()
+
+        frame["wall"] = time.perf_counter()
+        frame["cpu"] = time.process_time()
+
+    def _get_file_prefix(self, key):
+        """
+        Make filesystem-safe file name prefix for a phase key
+        """
+        return os.path.join(self._out_dir,
+                re.sub("[^0-9A-Za-z._-]+", "_", "_".join(map(lambda x: str(x) if x else "-", key))))
+
+    def _take_snapshot(self):
+        """
+        Take tracemalloc snapshot without our own allocations
+        """
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__)])
+
+    def _dump_allocations(self, key, snapshot_before):
+        """
+        Append top allocation sites for single phase entry
+        """
+        _stats = self._take_snapshot().compare_to(snapshot_before, "lineno")
+
+        with open(self._get_file_prefix(key) + ".tracemalloc.txt", mode="at") as _fl_out:
+            _fl_out.write("# entry %d, top %d allocation sites by size difference\n" %
+                    (self._get_record(key)["calls"], self._top))
+
+            for _stat in _stats[:self._top]:
+                _fl_out.write("%s\n" % _stat)
+
+            _fl_out.write("\n")
+
+    @contextmanager
+    def phase(self, name, mirror=None, distr=None):
+        """
+        Context manager to account a phase
+        :param name: phase name
+        :type name: str
+        :param mirror: mirror source
+        :type mirror: str
+        :param distr: distributive name
+        :type distr: str
+        """
+        _key = (mirror, distr, name)
+        _frame = {"key": _key, "profile": None}
+
+        if self._out_dir:
+            if _key not in self._profiles:
+                self._profiles[_key] = cProfile.Profile()
+
+            _frame["profile"] = self._profiles[_key]
+
+        if self._stack:
+            self._suspend(self._stack[-1])
+
+        _snapshot = self._take_snapshot() if self._out_dir else None
+        self._stack.append(_frame)
+        self._get_record(_key)["calls"] += 1
+        self._resume(_frame)
+
+        try:
+            yield
+        finally:
+            self._suspend(_frame)
+            self._stack.pop()
+
+            if _snapshot:
+                self._dump_allocations(_key, _snapshot)
+
+            if self._stack:
+                self._resume(self._stack[-1])
+
+    def get_report(self):
+        """
+        Return list of phase records in order of first entry
+        """
+        _result = list()
+
+        for _key, _record in self._phases.items():
+            _result.append({
+                "mirror": _key[0],
+                "distributive": _key[1],
+                "phase": _key[2],
+                "calls": _record.get("calls"),
+                "wall": _record.get("wall"),
+                "cpu": _record.get("cpu")})
+
+        return _result
+
+    def format_report(self):
+        """
+        Make human-readable table of phases
+        """
+        _lines = ["%-40s %-20s %-15s %8s %12s %12s" % ("mirror", "distributive", "phase", "calls", "wall, s", "cpu, s")]
+        _wall = 0.0
+        _cpu = 0.0
+
+        for _record in self.get_report():
+            _lines.append("%-40s %-20s %-15s %8d %12.3f %12.3f" % (
+                _record["mirror"] or "-", _record["distributive"] or "-", _record["phase"],
+                _record["calls"], _record["wall"], _record["cpu"]))
+            _wall += _record["wall"]
+            _cpu += _record["cpu"]
+
+        _lines.append("%-40s %-20s %-15s %8s %12.3f %12.3f" % ("total", "", "", "", _wall, _cpu))
+        return '\n'.join(_lines)
+
+    def dump(self):
+        """
+        Write phase report and cProfile statistics to output folder
+        """
+        if not self._out_dir:
+            return
+
+        with open(os.path.join(self._out_dir, "phases.json"), mode="wt") as _fl_out:
+            json.dump(self.get_report(), _fl_out, indent=4)
+
+        for _key, _profile in self._profiles.items():
+            _path = self._get_file_prefix(_key) + ".prof"
+            logging.debug("Writing cProfile statistics to '%s'" % _path)
+            _profile.dump_stats(_path)
@@ -0,0 +1,77 @@
+import logging
+import os
+
+class ReleaseCache(object):
+    """
+    Parsed Release / InRelease files cache.
+    Entries are keyed by local path and invalidated when file stat signature changes.
+    Cached data is shared between all readers and must not be modified.
+    """
+    def __init__(self):
+        """
+        Initialization
+        """
+        self._items = dict()
+
+    def signature(self, path):
+        """
+        Get stat signature of a file
+        :param path: local path
+        :type path: str
+        :return: tuple or None if file does not exist
+        """
+        try:
+            _st = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        return (_st.st_ino, _st.st_size, _st.st_mtime_ns, _st.st_ctime_ns)
+
+    def get(self, path, signature):
+        """
+        Get cached parsed data
+        :param path: local path
+        :type path: str
+        :param signature: stat signature taken by 'signature' method
+        :type signature: tuple
+        :return: cached data or None if absent or outdated
+        """
+        if signature is None:
+            return None
+
+        _item = self._items.get(path)
+
+        if not _item:
+            return None
+
+        if _item[0] != signature:
+            logging.debug("Cached data for '%s' is outdated" % path)
+            del(self._items[path])
+            return None
+
+        logging.debug("Using cached data for '%s'" % path)
+        return _item[1]
+
+    def put(self, path, signature, data):
+        """
+        Store parsed data
+        :param path: local path
+        :type path: str
+        :param signature: stat signature taken by 'signature' method before parsing
+        :type signature: tuple
+        :param data: parsed data
+        """
+        if signature is None:
+            return
+
+        self._items[path] = (signature, data)
+
+    def invalidate(self, path):
+        """
+        Remove cached data for a path
+        :param path: local path
+        :type path: str
+        """
+        if path in self._items:
+            logging.debug("Invalidating cached data for '%s'" % path)
+            del(self._items[path])
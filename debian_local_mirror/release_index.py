@@ -0,0 +1,281 @@
+import logging
+import posixpath
+import re
+
+class ReleaseIndexField(object):
+    """
+    Read-only view of a single checksum field of ReleaseIndex.
+    Iterates over records in the format parser writes them: {'hash', 'Size', 'Filename'}
+    """
+    def __init__(self, index, field):
+        self._index = index
+        self._field = field
+
+    def __iter__(self):
+        for _filename, _entry in self._index.items():
+            _hash = _entry.get("hashes").get(self._field)
+
+            if _hash is None:
+                continue
+
+            yield {"hash": _hash, "Size": _entry.get("Size"), "Filename": _filename}
+
+    def __len__(self):
+        return len(list(filter(lambda x: self._field in x.get("hashes"), self._index.entries())))
+
+    def __bool__(self):
+        return any(map(lambda x: self._field in x.get("hashes"), self._index.entries()))
+
+class ReleaseIndex(object):
+    """
+    Files listed in Release with all their checksums.
+    Filename => {'Size': size, 'hashes': {field: hash}}, in order of appearance,
+    plus secondary index by component, architecture and kind of file built on demand.
+    """
+    _special_dirs = ["debian-installer", "dep11", "cnf"]
+
+    def __init__(self, fields, architectures=None):
+        """
+        Initialization
+        :param fields: checksums fields in order of appearance, as named in Release
+        :type fields: list(str)
+        :param architectures: architectures known, to recognize them in file names
+        :type architectures: list(str)
+        """
+        self._fields = list(fields)
+        self._architectures = list(architectures or [])
+        self._entries = dict()
+        self._keys = None
+        self._arch_re = None
+
+    def copy(self):
+        """
+        Return independent copy
+        """
+        _result = ReleaseIndex(self._fields, self._architectures)
+
+        for _filename, _entry in self._entries.items():
+            _result._entries[_filename] = {"Size": _entry.get("Size"), "hashes": dict(_entry.get("hashes"))}
+
+        return _result
+
+    def fields(self):
+        """
+        Return checksums fields list
+        """
+        return list(self._fields)
+
+    def get_field(self, field):
+        """
+        Return iterable view for a checksum field
+        :param field: checksum field name
+        :type field: str
+        """
+        return ReleaseIndexField(self, field)
+
+    def items(self):
+        return self._entries.items()
+
+    def entries(self):
+        return self._entries.values()
+
+    def filenames(self):
+        return list(self._entries.keys())
+
+    def get(self, filename):
+        """
+        Return entry for a file
+        :param filename: path relative to Release
+        :type filename: str
+        :return: {'Size': size, 'hashes': {field: hash}} or None
+        """
+        return self._entries.get(filename)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, filename):
+        return filename in self._entries
+
+    def add(self, filename, size, field, hash_value):
+        """
+        Add single checksum record as it is listed in Release
+        :param filename: path relative to Release
+        :type filename: str
+        :param size: file size
+        :type size: int
+        :param field: checksum field name
+        :type field: str
+        :param hash_value: checksum
+        :type hash_value: str
+        """
+        if field not in self._fields:
+            self._fields.append(field)
+
+        _entry = self._entries.get(filename)
+
+        if not _entry:
+            self._add_entry(filename, {"Size": size, "hashes": dict()})
+            _entry = self._entries.get(filename)
+        elif _entry.get("Size") != size:
+            raise ValueError("Sizes not match for '%s': %d and %d" % (filename, _entry.get("Size"), size))
+
+        _entry["hashes"][field] = hash_value
+
+    def update(self, filename, size, hashes):
+        """
+        Replace size and checksums of a file, add it if absent
+        :param filename: path relative to Release
+        :type filename: str
+        :param size: file size
+        :type size: int
+        :param hashes: checksum field => checksum
+        :type hashes: dict
+        """
+        for _field in hashes.keys():
+            if _field not in self._fields:
+                self._fields.append(_field)
+
+        _entry = self._entries.get(filename)
+
+        if not _entry:
+            self._add_entry(filename, {"Size": size, "hashes": dict(hashes)})
+            return
+
+        _entry["Size"] = size
+        _entry["hashes"].update(hashes)
+
+    def remove(self, filename):
+        """
+        Remove a file
+        :param filename: path relative to Release
+        :type filename: str
+        """
+        if filename not in self._entries:
+            return
+
+        logging.debug("Removing record for '%s'" % filename)
+        del(self._entries[filename])
+
+        if self._keys is None:
+            return
+
+        for _name, _values in zip(["component", "arch", "kind"], self._classify(filename)):
+            if not isinstance(_values, list):
+                _values = [_values]
+
+            for _value in _values:
+                _index = self._keys[_name].get(_value)
+
+                if _index is not None:
+                    _index.pop(filename, None)
+
+    def _add_entry(self, filename, entry):
+        """
+        Add new entry and index it if secondary index is built
+        """
+        self._entries[filename] = entry
+
+        if self._keys is None:
+            return
+
+        self._index_file(filename)
+
+    def _get_arch_re(self):
+        """
+        Regular expression to find architectures in file names,
+        an architecture is preceded by '-' and followed by '.', '/' or end of name
+        """
+        if not self._architectures:
+            return None
+
+        return re.compile('-(%s)(?=\\.|$|%s)' % (
+            '|'.join(map(re.escape, sorted(self._architectures, key=len, reverse=True))), posixpath.sep))
+
+    def _classify(self, filename):
+        """
+        Return component, list of architectures and kind of file
+        :param filename: path relative to Release
+        :type filename: str
+        :return: tuple (str or None, list(str), str)
+        """
+        _parts = filename.split(posixpath.sep)
+        _component = _parts[0] if len(_parts) > 1 else None
+        _archs = list()
+
+        if self._arch_re:
+            _archs = list(map(lambda x: x.group(1), self._arch_re.finditer(filename)))
+
+        if any(map(lambda x: x.endswith(".diff"), _parts)):
+            return _component, _archs, "diff"
+
+        for _dir in self._special_dirs:
+            if _dir in _parts[:-1]:
+                return _component, _archs, _dir
+
+        # 'Contents-udeb-amd64.gz' => 'Contents', 'Translation-en.bz2' => 'Translation'
+        return _component, _archs, _parts[-1].split('.')[0].split('-')[0]
+
+    def _index_file(self, filename):
+        """
+        Add file to secondary index
+        """
+        _component, _archs, _kind = self._classify(filename)
+        self._keys["component"].setdefault(_component, dict())[filename] = None
+        self._keys["kind"].setdefault(_kind, dict())[filename] = None
+
+        for _arch in _archs:
+            self._keys["arch"].setdefault(_arch, dict())[filename] = None
+
+    def _build_keys(self):
+        """
+        Build secondary index
+        """
+        if self._keys is not None:
+            return
+
+        logging.debug("Building secondary index for %d files" % len(self._entries))
+        self._arch_re = self._get_arch_re()
+        self._keys = {"component": dict(), "arch": dict(), "kind": dict()}
+
+        for _filename in self._entries.keys():
+            self._index_file(_filename)
+
+    def select(self, component=None, arch=None, kind=None):
+        """
+        Return files matching all conditions given
+        :param component: first path component ('main', 'contrib' etc.)
+        :type component: str
+        :param arch: architecture found in file name
+        :type arch: str
+        :param kind: file kind: 'Packages', 'Contents', 'Translation', 'diff', 'dep11' etc.
+        :type kind: str
+        :return: list of filenames in order of appearance
+        """
+        self._build_keys()
+        _sets = list()
+
+        for _name, _value in [("component", component), ("arch", arch), ("kind", kind)]:
+            if _value is None:
+                continue
+
+            _sets.append(self._keys[_name].get(_value, dict()))
+
+        if not _sets:
+            return self.filenames()
+
+        # index is kept in order of appearance, so the result is ordered also
+        _sets.sort(key=len)
+        return list(filter(lambda x: all(map(lambda y: x in y, _sets[1:])), _sets[0].keys()))
+
+    def remove_selected(self, component=None, arch=None, kind=None):
+        """
+        Remove all files matching all conditions given
+        :return: number of files removed
+        """
+        _filenames = self.select(component=component, arch=arch, kind=kind)
+
+        for _filename in _filenames:
+            self.remove(_filename)
+
+        return len(_filenames)
@@ -3,7 +3,12 @@ import os
 import posixpath
 import requests
 import shutil
+import threading
+import time
 import urllib3
+from .host_controller import HostController
+from .local_transfer import transfer
+from urllib.parse import unquote
 
 class HttpError(Exception):
     def __init__(self, code=0, url='', resp=None, text=''):
@@ -16,7 +21,134 @@ class HttpError(Exception):
         return self.text + ': Code ' + str(self.code) + ' ' + self.url
 
 
+class _RetryableStatus(Exception):
+    """
+    Upstream answered with status meaning it is overloaded or broken
+    """
+    def __init__(self, rsp):
+        super().__init__("Code %d %s" % (rsp.status_code, rsp.url))
+        self.rsp = rsp
+        self.retry_after = rsp.headers.get("Retry-After")
+
+def _get_retry_conf():
+    """
+    Retries configuration for HTTP layer: quick reconnects only,
+    retrying on server errors and throttling is done by HostController
+    """
+    return urllib3.util.retry.Retry(
+        total=2,
+        status=0,
+        respect_retry_after_header=False,
+        raise_on_status=False,
+        allowed_methods=["GET", "POST", "PUT", "HEAD", "DELETE"],
+        backoff_factor=0.5
+    )
+
+def get_local_source(remote):
+    """
+    Return filesystem path of upstream given as 'file://' URL or plain path
+    :param remote: upstream URL or path
+    :type remote: str
+    :return: path or None if upstream is to be downloaded from
+    """
+    _url = urllib3.util.parse_url(remote)
+
+    if _url.scheme == "file":
+        return unquote(_url.path or "")
+
+    if not _url.scheme:
+        return remote
+
+    return None
+
 class RepoFile(object):
+    _metrics = None
+    _attempts = 5
+    _buffer_size = 1024 * 1024
+    _buffers = threading.local()
+    _sessions = dict()
+    _sessions_lock = threading.Lock()
+
+    @classmethod
+    def get_session(cls, remote):
+        """
+        Return HTTP session for remote host.
+        Sessions are shared by all files downloaded from the same host in the same thread,
+        so connections are kept alive between files.
+        :param remote: remote URL
+        :type remote: str
+        """
+        _url = urllib3.util.parse_url(remote)
+        _key = (_url.scheme, _url.host, _url.port, threading.get_ident())
+
+        with RepoFile._sessions_lock:
+            _web = RepoFile._sessions.get(_key)
+
+            if not _web:
+                logging.debug("New HTTP session for '%s://%s'" % (_url.scheme, _url.host))
+                _web = requests.Session()
+                _adapter = requests.adapters.HTTPAdapter(max_retries=_get_retry_conf())
+                _web.mount("http://", _adapter)
+                _web.mount("https://", _adapter)
+                RepoFile._sessions[_key] = _web
+
+        return _web
+
+    @classmethod
+    def close_sessions(cls, threads=None):
+        """
+        Close HTTP sessions
+        :param threads: identifiers of threads to close sessions of, all by default
+        :type threads: set(int)
+        """
+        with RepoFile._sessions_lock:
+            _closed = list(filter(lambda x: threads is None or x[3] in threads, RepoFile._sessions.keys()))
+
+            for _key in _closed:
+                RepoFile._sessions.pop(_key).close()
+
+    @classmethod
+    def set_download_buffer(cls, size):
+        """
+        Set size of buffer downloaded data is received to and written from
+        :param size: size in bytes, rounded up to a multiple of 4096
+        :type size: int
+        """
+        if size <= 0:
+            raise ValueError("Download buffer size should be positive, not %d" % size)
+
+        RepoFile._buffer_size = (size + 4095) // 4096 * 4096
+
+    def _get_buffer(self):
+        """
+        Return download buffer of current thread, it is allocated once and reused for every file
+        """
+        _buffer = getattr(RepoFile._buffers, "buffer", None)
+
+        if _buffer is None or len(_buffer) != RepoFile._buffer_size:
+            _buffer = bytearray(RepoFile._buffer_size)
+            RepoFile._buffers.buffer = _buffer
+
+        return memoryview(_buffer)
+
+    @classmethod
+    def set_metrics(cls, metrics):
+        """
+        Set metrics collector for all files
+        :param metrics: metrics collector, None to disable
+        :type metrics: RunMetrics
+        """
+        RepoFile._metrics = metrics
+
+    def _count(self, name, value=1, **labels):
+        """
+        Increase a counter in metrics collector if set
+        """
+        if not self._metrics:
+            return
+
+        self._metrics.inc(name, value, **labels)
+
     def __init__(self, remote, local, sub, extensions=list(), absent_ok=False, size=None):
         """
         Synchronization of single file - basics
@@ -82,7 +214,7 @@ class RepoFile(object):
             return
 
         logging.debug("Creating folder: '%s'" % _dirpath)
-        os.makedirs(_dirpath)
+        os.makedirs(_dirpath, exist_ok=True)
 
     def check_before(self):
         """
@@ -121,28 +253,90 @@ class RepoFile(object):
         :param absent_ok: do not raise an exception of file is absent in remote
         :type absent_ok: bool
         """
-            
-        _web = requests.Session()
-
-        _retry_conf = urllib3.util.retry.Retry(
-            total=5,
-            status_forcelist=[
-                requests.codes.server_error,
-                requests.codes.not_implemented,
-                requests.codes.bad_gateway,
-                requests.codes.service_unavailable,
-                requests.codes.gateway_timeout,
-                requests.codes.http_version_not_supported,
-                requests.codes.variant_also_negotiates,
-                requests.codes.insufficient_storage,
-                requests.codes.bandwidth_limit_exceeded,
-                requests.codes.not_extended
-                ],
-            allowed_methods=["GET", "POST", "PUT", "HEAD", "DELETE"],
-            backoff_factor=2
-        )
-        _adapter = requests.adapters.HTTPAdapter(max_retries=_retry_conf)
-        _web.mount(remote, _adapter)
+        _source = get_local_source(remote)
+
+        if _source is not None:
+            self._copy_local(_source, local, absent_ok)
+            return
+
+        _host = urllib3.util.parse_url(remote).host or ""
+        _controller = HostController.get(_host)
+
+        for _attempt in range(1, self._attempts + 1):
+            _controller.acquire()
+
+            try:
+                self._try_download_remote(remote, local, absent_ok, _host, _controller)
+                return
+            except _RetryableStatus as _e:
+                _error = _e
+                _delay = _controller.on_failure(_e.retry_after)
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as _e:
+                _error = _e
+                _delay = _controller.on_failure()
+            finally:
+                _controller.release()
+
+            if _attempt == self._attempts:
+                break
+
+            logging.warning("Downloading '%s' failed (%s), attempt %d of %d in %.1f seconds" %
+                    (remote, _error, _attempt + 1, self._attempts, _delay))
+            self._count("download_retries", host=_host)
+
+        if isinstance(_error, _RetryableStatus):
+            _error.rsp.raise_for_status()
+
+        raise _error
+
+    def _copy_local(self, source, local, absent_ok):
+        """
+        Take a file from upstream on local or network filesystem: reflink or copy in kernel
+        :param source: upstream file path
+        :type source: str
+        :param local: local path
+        :type local: str
+        :param absent_ok: do not raise an exception of file is absent in upstream
+        :type absent_ok: bool
+        """
+        _start = time.perf_counter()
+
+        if os.path.lexists(local):
+            os.remove(local)
+
+        if not os.path.isfile(source):
+            if not absent_ok:
+                raise FileNotFoundError(source)
+
+            logging.debug("File '%s' not found, removing local copy also" % source)
+            self._count("download_not_found", host="file")
+            return
+
+        logging.info("'%s' ==> '%s'" % (source, local))
+
+        if not transfer(source, local, allowed=["reflink", "copy"]):
+            raise OSError("Unable to copy '%s' to '%s'" % (source, local))
+
+        self._account_download("file", os.path.getsize(local), time.perf_counter() - _start)
+
+    def _try_download_remote(self, remote, local, absent_ok, host, controller):
+        """
+        Single attempt to download a remote file
+        :param remote: remote URL
+        :type remote: str
+        :param local: local path
+        :type local: str
+        :param absent_ok: do not raise an exception of file is absent in remote
+        :type absent_ok: bool
+        :param host: remote host
+        :type host: str
+        :param controller: remote host controller
+        :type controller: HostController
+        """
+        _web = self.get_session(remote)
+        _timeouts = controller.get_timeouts()
+        _start = time.perf_counter()
 
         _mode = 'wb'
         _headers = dict()
@@ -153,7 +347,11 @@ class RepoFile(object):
             if _downloaded <= self._size:
                 logging.debug("Try to restart download from %d" % _downloaded)
                 _headers = {"Range": "bytes=%d-%d" % (_downloaded, self._size - 1)}
-                _rsp = _web.head(remote, timeout=(30.0, 30.0), allow_redirects=True, headers=_headers)
+                _rsp = _web.head(remote, timeout=_timeouts, allow_redirects=True, headers=_headers)
+                self._count_retries(_rsp, host)
+
+                if _rsp.status_code in HostController.retry_statuses:
+                    raise _RetryableStatus(_rsp)
 
                 if _rsp.status_code != requests.codes.partial:
                     logging.debug("Servers does not support restart downloading: %d" % _rsp.status_code)
@@ -162,7 +360,12 @@ class RepoFile(object):
                     _mode = 'ab'
                     logging.info("Restart downloading from %d" % _downloaded)
 
-        _rsp = _web.get(remote, stream=True, timeout=(30.0, 30.0), allow_redirects=True, headers=_headers)
+        _rsp = _web.get(remote, stream=True, timeout=_timeouts, allow_redirects=True, headers=_headers)
+        self._count_retries(_rsp, host)
+
+        if _rsp.status_code in HostController.retry_statuses:
+            _rsp.close()
+            raise _RetryableStatus(_rsp)
 
         if os.path.exists(local) and _mode=='wb':
             # no need to continue download or server does not support it
@@ -173,20 +376,129 @@ class RepoFile(object):
             if absent_ok:
                 # remove local file
                 logging.debug("File '%s' not found, removing local copy also" % self._remote)
+                self._count("download_not_found", host=host)
+                controller.on_success(_rsp.elapsed.total_seconds())
                 return
 
             _rsp.raise_for_status()
 
         logging.info("'%s' ==> '%s'" % (remote, local))
 
-        with open(local, _mode) as _fl:
-            for chunk in _rsp.iter_content(8192):
-                _fl.write(chunk)
+        _body_start = time.perf_counter()
+        _deadline = controller.get_deadline(self._size)
+
+        try:
+            # not buffered: data is written by whole blocks of download buffer
+            with open(local, _mode, buffering=0) as _fl:
+                _bytes = self._receive(_rsp, _fl, _deadline)
+        finally:
+            # connection is returned to the shared session pool
+            _rsp.close()
+
+        controller.on_success(_rsp.elapsed.total_seconds(), _bytes, time.perf_counter() - _body_start)
+        self._account_download(host, _bytes, time.perf_counter() - _start)
+
+    def _write_all(self, fl, data):
+        """
+        Write data to unbuffered file, which may accept a part of it at once
+        """
+        _written = 0
+
+        while _written < len(data):
+            _written += fl.write(data[_written:])
+
+    def _receive(self, rsp, fl, deadline=None):
+        """
+        Copy response body to a file through download buffer:
+        the buffer is filled up completely before writing, so writes are large and aligned
+        :param rsp: response with body not consumed
+        :type rsp: requests.Response
+        :param fl: file open in binary unbuffered mode
+        :param deadline: the longest acceptable duration, in seconds
+        :type deadline: float
+        :return: number of bytes received
+        """
+        _start = time.perf_counter()
+        _view = self._get_buffer()
+        _size = len(_view)
+        _bytes = 0
+
+        if rsp.headers.get("Content-Encoding", "identity").lower() != "identity":
+            # body is to be decoded, it can not be read into the buffer directly
+            for _chunk in rsp.iter_content(_size):
+                self._write_all(fl, _chunk)
+                _bytes += len(_chunk)
+
+                if deadline and time.perf_counter() - _start > deadline:
+                    raise requests.exceptions.Timeout("Not received in %.1f seconds" % deadline)
 
-            _fl.flush()
+            return _bytes
 
-        _rsp.close()
-        _web.close()
+        while True:
+            _filled = 0
+
+            while _filled < _size:
+                _read = self._readinto(rsp, _view[_filled:])
+
+                if not _read:
+                    break
+
+                _filled += _read
+
+            self._write_all(fl, _view[:_filled])
+            _bytes += _filled
+
+            if _filled < _size:
+                return _bytes
+
+            if deadline and time.perf_counter() - _start > deadline:
+                raise requests.exceptions.Timeout("Not received in %.1f seconds" % deadline)
+
+    def _readinto(self, rsp, view):
+        """
+        Read response body into a buffer, errors are translated as 'iter_content' does,
+        so broken and stalled downloads are retried
+        :param rsp: response with body not consumed
+        :type rsp: requests.Response
+        :param view: buffer to fill
+        :type view: memoryview
+        :return: number of bytes read
+        """
+        try:
+            return rsp.raw.readinto(view)
+        except urllib3.exceptions.ProtocolError as _e:
+            raise requests.exceptions.ChunkedEncodingError(_e)
+        except urllib3.exceptions.ReadTimeoutError as _e:
+            raise requests.exceptions.ConnectionError(_e)
+
+    def _count_retries(self, rsp, host):
+        """
+        Account retries made by HTTP layer for a response
+        """
+        _retries = getattr(rsp.raw, "retries", None)
+
+        if _retries and _retries.history:
+            self._count("download_retries", len(_retries.history), host=host)
+
+    def _account_download(self, host, size, duration):
+        """
+        Account single download in metrics collector
+        :param host: upstream host
+        :type host: str
+        :param size: bytes downloaded
+        :type size: int
+        :param duration: download duration in seconds
+        :type duration: float
+        """
+        if not self._metrics:
+            return
+
+        self._metrics.inc("downloaded_files", host=host)
+        self._metrics.inc("downloaded_bytes", size, host=host)
+        self._metrics.observe("download_duration_seconds", duration, host=host)
+
+        if duration > 0:
+            self._metrics.observe("download_throughput_bytes_per_second", size / duration, host=host)
 
     def unpack_if_needed(self):
         """
@@ -202,8 +514,17 @@ class RepoFile(object):
 
         if self.check_before():
             logging.debug("File data is OK, no need to donwload")
+            self._count("skipped_files")
             return True
 
+        return self.download()
+
+    def download(self):
+        """
+        Download from remote without checking local data before
+        """
+        self.check_create_local_path()
+
         for _ext in self._ext:
             _fullpth_remote = self._remote + _ext
             _fullpth_local = self._local + _ext
@@ -223,6 +544,12 @@ class RepoFile(object):
         self.close()
         self._fd = open(self._local, mode)
 
+    def get_local_path(self):
+        """
+        Get local path without extensions
+        """
+        return self._local
+
     def get_local_paths(self):
         """
         Get full local paths list
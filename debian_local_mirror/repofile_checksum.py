@@ -3,13 +3,62 @@ import os
 import posixpath
 import logging
 import hashlib
+import filecmp
+
+def new_checksum(cs_type):
+    """
+    Create hash object for a checksum type given
+    :param cs_type: type of checksum as named in metadata, case-insensitive
+    :type cs_type: str
+    """
+    _cs_type = cs_type.lower()
+
+    if _cs_type == "md5sum":
+        return hashlib.md5()
+
+    if _cs_type == "sha1":
+        return hashlib.sha1()
+
+    if _cs_type == "sha256":
+        return hashlib.sha256()
+
+    if _cs_type == "sha512":
+        return hashlib.sha512()
+
+    raise ValueError("Checksum of type '%s' is not (yet?) supported" % cs_type)
 
 class RepoFileWithCheckSum(RepoFile):
     """
     General file with checksum
     """
-    def __init__(self, remote, local, fdict, absent_ok=True, size=None):
+    _checksum_cache = None
+
+    # in order of preference for 'strongest' verification mode
+    _strength_order = ["SHA512", "SHA256", "SHA1", "MD5Sum", "MD5sum"]
+
+    @classmethod
+    def set_checksum_cache(cls, cache):
+        """
+        Set verified checksums cache for all files
+        :param cache: checksums cache, None to disable
+        :type cache: ChecksumCache
+        """
+        RepoFileWithCheckSum._checksum_cache = cache
+
+    def __init__(self, remote, local, fdict, absent_ok=True, size=None, policy=None, kind="pool", seeds=None):
+        """
+        Initialization
+        :param policy: verification policy, all checksums are verified if not given
+        :type policy: VerificationPolicy
+        :param kind: kind of file for verification policy: 'pool' or 'indices'
+        :type kind: str
+        :param seeds: local files to take the file from instead of downloading
+        :type seeds: SeedIndex
+        """
         self._data = None
+        self._policy = policy
+        self._kind = kind
+        self._seeds = seeds
         super().__init__(
                 remote=remote,
                 local=local,
@@ -22,6 +71,13 @@ class RepoFileWithCheckSum(RepoFile):
         self._links = list()
         self._set_checksums_fields()
 
+    def get_link_paths(self):
+        """
+        Return local paths of all 'by-hash' links for the file, nothing is created
+        """
+        return list(map(lambda x: os.path.join(self._base_local, os.path.sep.join(x)),
+            self._fdict.get("by-hash") or list()))
+
     def _check_create_links(self):
         """
         Do create all links for the file
@@ -37,20 +93,68 @@ class RepoFileWithCheckSum(RepoFile):
         if "by-hash" not in self._fdict:
             return True
 
-        for _link_list in self._fdict.get("by-hash"):
-            _link_path = os.path.join(self._base_local, os.path.sep.join(_link_list))
-            logging.debug("Link components: '%s', '%s'" % (self._base_local, os.path.sep.join(_link_list)))
-            logging.debug("Checking symlink: '%s' ==> '%s'" % (_link_path, self._local))
+        _stat = os.stat(self._local)
+
+        for _link_path in self.get_link_paths():
+            self._links.append(_link_path)
+
+            if self._is_linked(_link_path, _stat):
+                continue
+
+            logging.debug("Linking: '%s' ==> '%s'" % (_link_path, self._local))
             self._check_create_local_path(_link_path)
 
-            if os.path.exists(_link_path) or os.path.islink(_link_path):
+            if os.path.lexists(_link_path):
                 os.remove(_link_path)
 
-            os.symlink(os.path.relpath(self._local, os.path.dirname(_link_path)), _link_path)
-            self._links.append(_link_path)
+            # hard link keeps content of superseded index when the file itself is replaced
+            try:
+                os.link(self._local, _link_path)
+            except OSError as _e:
+                logging.debug("Hard link is not possible, symbolic one is used: %s" % _e)
+                os.symlink(os.path.relpath(self._local, os.path.dirname(_link_path)), _link_path)
+
+            self._count("by_hash_updates")
 
         return True
 
+    def _is_linked(self, path, stat):
+        """
+        Check if 'by-hash' object is the file itself already
+        :param path: 'by-hash' object path
+        :type path: str
+        :param stat: file status
+        :type stat: os.stat_result
+        """
+        # symbolic link is made where hard link has failed, it is kept while pointing to the file
+        try:
+            if os.path.islink(path) and os.readlink(path) == os.path.relpath(self._local, os.path.dirname(path)):
+                return True
+
+            _stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+
+        if os.path.samestat(_stat, stat):
+            return True
+
+        # indices of the same content share an object, it is linked to any of them
+        return _stat.st_size == stat.st_size and filecmp.cmp(path, self._local, shallow=False)
+
+    def verify(self):
+        """
+        Verify local file without any modification, links are not checked
+        :return: 'ok', 'missing' or 'corrupt'
+        """
+        if not os.path.exists(self._local):
+            return "missing"
+
+        if self._size is not None and os.path.getsize(self._local) != self._size:
+            logging.debug("Size comparison failed for '%s'" % self._local)
+            return "corrupt"
+
+        return "ok" if self._compare_checksums() else "corrupt"
+
     def _calculate_checksum(self, cs_type):
         """
         Calculate a checksum of a type given
@@ -59,19 +163,7 @@ class RepoFileWithCheckSum(RepoFile):
         :type cs_type: str
         """
         self._fd.seek(0, 0)
-        
-        _hashobj = None
-        if cs_type == "md5sum":
-            _hashobj = hashlib.md5()
-        elif cs_type == "sha1":
-            _hashobj = hashlib.sha1()
-        elif cs_type == "sha256":
-            _hashobj = hashlib.sha256()
-        elif cs_type == "sha512":
-            _hashobj = hashlib.sha512()
-        
-        if not _hashobj:
-            raise ValueError("Checksum of type '%s' is not (yet?) supported" % cs_type)
+        _hashobj = new_checksum(cs_type)
 
         while True:
             _chunk = self._fd.read(1 * 1024 * 1024) # read in 1M chunks, 16M was too much
@@ -105,6 +197,54 @@ class RepoFileWithCheckSum(RepoFile):
 
         return _result
 
+    def _get_strongest_digest(self):
+        """
+        Return the strongest checksum given for the file, None if no checksum given
+        """
+        _fields = self._get_fields_to_verify("strongest")
+        return self._fdict.get(_fields[0]) if _fields else None
+
+    def _check_by_policy(self, mode):
+        """
+        Check file without reading it, if verification mode allows
+        :param mode: verification mode
+        :type mode: str
+        :return: result or None if checksums are to be verified
+        """
+        _size = self._size if self._size is not None else self._fdict.get("Size")
+
+        if mode not in ["size", "size+mtime"] or _size is None:
+            return None
+
+        if os.path.getsize(self._local) != int(_size):
+            logging.debug("Size comparison failed for '%s'" % self._local)
+            return False
+
+        if mode == "size":
+            self._count("cache_hits", cache="verification")
+            return True
+
+        if self._policy.is_unchanged(self._local, self._get_strongest_digest()):
+            logging.debug("'%s' has not been changed since verified" % self._local)
+            self._count("cache_hits", cache="verification")
+            return True
+
+        return None
+
+    def _get_fields_to_verify(self, mode):
+        """
+        Return checksums fields to verify
+        :param mode: verification mode
+        :type mode: str
+        """
+        _result = list(filter(lambda x: x in self._fdict, self._checksums_fields))
+
+        if mode == "full" or not _result:
+            return _result
+
+        # all but 'full' verify the strongest checksum when checksums have to be read
+        return list(filter(lambda x: x in _result, self._strength_order))[:1]
+
     def _compare_checksums(self):
         """
         Compare all checksums given
@@ -113,16 +253,32 @@ class RepoFileWithCheckSum(RepoFile):
             logging.debug("File '%s' does not exist, checksum verification failed" % self._local)
             return False
 
+        _mode = self._policy.get_mode(self._kind) if self._policy else "full"
+        _by_policy = self._check_by_policy(_mode)
+
+        if _by_policy is not None:
+            return _by_policy
+
+        _fields = self._get_fields_to_verify(_mode)
+        _signature = None
+        _verified = dict()
+
+        if self._checksum_cache:
+            _signature = self._checksum_cache.signature(self._local)
+            _expected = dict(map(lambda x: (x.lower(), self._fdict.get(x)), _fields))
+
+            if self._checksum_cache.is_verified(self._local, _signature, _expected):
+                logging.debug("Checksums have been verified already for '%s'" % self._local)
+                self._count("cache_hits", cache="checksum")
+                return True
+
         _opened = bool(self._fd)
+        self._count("verified_files")
 
         if not _opened:
             self.open(mode="rb")
 
-        for _field in self._checksums_fields:
-            if _field not in self._fdict:
-                logging.debug("Checksum type %s not found for '%s'" % (_field, self._local))
-                continue
-
+        for _field in _fields:
             _type = _field.lower()
             _hash = self._fdict.get(_field)
             
@@ -142,18 +298,62 @@ class RepoFileWithCheckSum(RepoFile):
 
                 return False
 
+            _verified[_type] = _hash
+
         if not _opened:
             self.close()
 
         logging.debug("All hashes match for '%s'" % self._local)
 
+        if self._checksum_cache:
+            self._checksum_cache.put(self._local, _signature, _verified)
+
+        if self._policy:
+            self._policy.set_verified(self._local, self._get_strongest_digest())
+
         return True
 
+    def _take_seed(self):
+        """
+        Take the file from seed directories
+        :return: True if taken
+        """
+        _size = self._size if self._size is not None else self._fdict.get("Size")
+
+        if not self._seeds or _size is None:
+            return False
+
+        # partial file is kept for download to be restarted, unless a seed is found
+        self.check_create_local_path()
+        _method = self._seeds.take(os.path.basename(self._local), int(_size), self._fdict, self._local)
+
+        if not _method:
+            return False
+
+        logging.info("'%s' taken from seeds: %s" % (self._local, _method))
+        self._count("seeded_files", method=_method)
+
+        # checksums have been verified by seeds index already
+        if self._policy:
+            self._policy.set_verified(self._local, self._get_strongest_digest())
+
+        return self._check_create_links()
+
+    def download(self):
+        """
+        Override to take the file from seed directories if possible
+        """
+        if self._take_seed():
+            return True
+
+        return super().download()
+
     def check_before(self):
         """
         Override to see if local file is OK
         """
-        return self._check_create_links() and self._compare_checksums()
+        # links are made for the file verified only, they may keep its content
+        return self._compare_checksums() and self._check_create_links()
 
     def check_after(self):
         """
@@ -8,11 +8,11 @@ import logging
 import posixpath
 from copy import deepcopy
 from packaging import version
-from tempfile import NamedTemporaryFile
 
 from .repofile import RepoFile
 from .repofile_checksum import RepoFileWithCheckSum
 from .metadata_parser import DebianMetaParser, FormatError
+from .parallel_compressor import ParallelCompressor
 
 class DebianizedVersion:
     """
@@ -68,6 +68,7 @@ class RepoFilePackages(RepoFile, DebianMetaParser):
         self._list_fields = list()
         self._checksums = checksums
         self._checksums_u = dict()
+        self._written = dict()
         super().__init__(
                 remote = remote,
                 local = local,
@@ -109,6 +110,8 @@ class RepoFilePackages(RepoFile, DebianMetaParser):
             _sub[-1] = _sub[-1] + _cs_ext
             _cs = deepcopy(self._checksums.get(_cs_ext))
             _cs['sub'] = _sub
+            # check only: 'by-hash' objects are maintained with indices listed in Release
+            _cs.pop('by-hash', None)
 
             _fl = RepoFileWithCheckSum(
                     remote=self._base_remote,
@@ -133,9 +136,24 @@ class RepoFilePackages(RepoFile, DebianMetaParser):
 
         return dst_d
 
+    def _get_written_checksums_fields(self):
+        """
+        Return list of checksums fields to be calculated while writing
+        """
+        if not self._checksums:
+            return list()
+
+        _result = list()
+
+        for _cs in self._checksums.values():
+            _result += list(filter(lambda x: x.lower() in ["md5sum", "sha1", "sha256", "sha512"] and x not in _result,
+                _cs.keys()))
+
+        return _result
+
     def _update_checksums(self):
         """
-        Update checksums given from original
+        Update checksums given from original with ones calculated while writing
         """
         if not self._checksums:
             logging.debug("Checksums not updated since not given prior")
@@ -145,28 +163,24 @@ class RepoFilePackages(RepoFile, DebianMetaParser):
 
         for _cs_ext in self._checksums.keys():
             logging.debug("Updating checksums for '%s'" % (self._local + _cs_ext))
-            _sub = deepcopy(self._sub)
-            _sub[-1] = _sub[-1] + _cs_ext
+            _written = self._written.get(_cs_ext)
+
+            if not _written:
+                raise ValueError("Updating '%s' failed, it has not been written" % (self._local + _cs_ext))
+
             _cs = deepcopy(self._checksums.get(_cs_ext))
-            _cs['sub'] = _sub
+            _filename = posixpath.sep.join(self._sub[:-1] + [self._sub[-1] + _cs_ext])
+            _checksums_dict = dict()
 
-            _fl = RepoFileWithCheckSum(
-                    remote=self._base_remote,
-                    local=self._base_local,
-                    fdict=_cs)
+            for _field in filter(lambda x: x in self._checksums_fields, _cs.keys()):
+                _checksums_dict[_field] = {"Filename": _filename, "Size": _written.get("Size"),
+                        "hash": _written.get(_field)}
 
-            _checksums_fields = list(filter(lambda x: x in self._checksums_fields, _cs.keys()))
-            logging.debug("Filtered checksums fields: '%s' of '%s'" % (_checksums_fields, self._checksums_fields))
-            _fl.open()
-            _checksums_dict = _fl.get_path_checksum_size(_checksums_fields)
-            _fl.close()
             self._checksums_u[_cs_ext] = _checksums_dict
             self._checksums[_cs_ext] = self._convert_cs_format(_checksums_dict, _cs)
 
-        self._checksums_fields = None
-
-        if not self._check_checksums():
-            raise ValueError("Updating '%s' failed, checksums not equal" % self._local)
+        # these are not checksums fields for 'Packages' content itself
+        self._checksums_fields = list()
 
     def check_before(self):
         """
@@ -288,6 +302,17 @@ class RepoFilePackages(RepoFile, DebianMetaParser):
         :param versions: latest versions to leave
         :type versions: int
         """
+        self.open()
+        self.prune_versions(versions)
+        self.close()
+        self.save()
+
+    def prune_versions(self, versions):
+        """
+        Strip old packages versions from data opened, nothing is written
+        :param versions: latest versions to leave
+        :type versions: int
+        """
 
         if not isinstance(versions, int):
             raise TypeError("Versions is not a number")
@@ -295,47 +320,170 @@ class RepoFilePackages(RepoFile, DebianMetaParser):
         if versions <= 0:
             raise ValueError("Illegal versions value: %d" % versions)
 
-        self.open()
         logging.debug("Number of packages before stripping: %d" % len(self._data))
-        _packages = list(set(list(map(lambda x: x.get("Package"), self._data))))
-
-        for _package in _packages:
-            logging.debug("Stripping package: '%s'" % _package)
-            _all_package_records = list(filter(lambda x: x.get("Package") == _package, self._data))
-            logging.debug("Type of _all_package_records: '%s'" % type(_all_package_records))
-            _versions = list(map(lambda x: x.get("Version"), _all_package_records))
-            logging.debug("Versions in source: '%s'" % _versions)
+        _packages = dict()
+
+        # single pass to group records, then single pass to filter
+        for _record in self._data:
+            _packages.setdefault(_record.get("Package"), set()).add(_record.get("Version"))
+
+        _to_leave = set()
+
+        for _package, _versions in _packages.items():
+            if len(_versions) <= versions:
+                _to_leave.update(map(lambda x: (_package, x), _versions))
+                continue
+
             _versions = list(map(lambda x: DebianizedVersion(x), _versions))
             _versions.sort(reverse=True)
-            _versions = _versions[:versions]
-            _versions = list(map(lambda x: str(x), _versions))
-            logging.debug("Versions to leave: '%s'" % _versions)
-            self._data = list(filter(lambda x: x.get("Package") != _package or 
-                        (x.get("Package") == _package and x.get("Version")) in _versions, self._data))
+            _to_leave.update(map(lambda x: (_package, str(x)), _versions[:versions]))
 
+        self._data = list(filter(lambda x: (x.get("Package"), x.get("Version")) in _to_leave, self._data))
         logging.debug("Number of packages after stripping: %d" % len(self._data))
+
+    def filter_packages(self, selector):
+        """
+        Leave records selected only in data opened, nothing is written
+        :param selector: function returning True for a record to leave
+        :type selector: callable
+        """
+        logging.debug("Number of packages before filtering: %d" % len(self._data))
+        self._data = list(filter(selector, self._data))
+        logging.debug("Number of packages after filtering: %d" % len(self._data))
+
+    def get_index_path(self):
+        """
+        Return local path of the index without extension
+        """
+        return self._local
+
+    def get_index_signature(self):
+        """
+        Return the strongest checksums of all index variants as listed in Release
+        :return: list of [extension, checksum] or None if checksums are not given
+        """
+        if not self._checksums:
+            return None
+
+        _result = list()
+
+        for _ext, _cs in sorted(self._checksums.items()):
+            _fields = list(filter(lambda x: _cs.get(x), ["SHA512", "SHA256", "SHA1", "MD5Sum", "MD5sum"]))
+
+            if not _fields:
+                return None
+
+            _result.append([_ext, _cs.get(_fields[0])])
+
+        return _result
+
+    def get_pool_records(self):
+        """
+        Return files list for pool synchronization with necessary fields only,
+        suitable to keep in memory for a while
+        """
+        self._set_checksums_fields()
+        _fields = ["Package", "Version", "Filename", "Size", "sub"] + self._checksums_fields
+        self._checksums_fields = list()
+
+        return list(map(lambda x: dict(filter(lambda y: y[0] in _fields, x.items())), self.get_subfiles()))
+
+    def get_index_key(self):
+        """
+        Return SHA256 of the index as listed in Release, the same for all variants
+        :return: checksum of uncompressed variant if listed, of any other otherwise, None if not given
+        """
+        if not self._checksums:
+            return None
+
+        for _ext in sorted(self._checksums.keys()):
+            if self._checksums.get(_ext).get("SHA256"):
+                return self._checksums.get(_ext).get("SHA256")
+
+        return None
+
+    def load_pool_records(self, cache=None):
+        """
+        Return files list for pool synchronization, from binary index cached if possible.
+        Index is built from parse result if it is not cached yet.
+        :param cache: indices cache, the index is parsed every time if not given
+        :type cache: PackagesIndexCache
+        :return: iterable of records
+        """
+        _key = self.get_index_key() if cache else None
+
+        if _key:
+            _index = cache.get(_key)
+
+            if _index is not None:
+                logging.debug("Records for '%s' are taken from index cached" % self._local)
+                self._count("cache_hits", cache="packages_index")
+                return _index
+
+        self.open()
+        _records = self.get_pool_records()
+        self.forget()
+
+        # local file may be not the one listed in Release yet
+        if not _key or not self.check_before():
+            return _records
+
+        return self.cache_pool_records(cache, _records)
+
+    def cache_pool_records(self, cache, records):
+        """
+        Build binary index of records parsed from the index
+        :param cache: indices cache
+        :type cache: PackagesIndexCache
+        :param records: pool records of the local index, as listed in Release
+        :type records: list(dict)
+        :return: PackagesIndex or records given if the index can not be cached
+        """
+        _key = self.get_index_key()
+
+        if not _key:
+            return records
+
+        try:
+            return cache.put(_key, records)
+        except (OSError, ValueError) as _e:
+            logging.warning("Unable to cache index of '%s': %s" % (self._local, _e))
+            return records
+
+    def forget(self):
+        """
+        Drop parsed data to free memory
+        """
         self.close()
+        self._data = None
+
+    def save(self):
+        """
+        Write data and update checksums for Release
+        """
         self.write()
         self._update_checksums()
 
     def write(self):
         """
-        Save changed data to all local files
+        Save changed data to all local files.
+        Serialized data is streamed once to all compressors working in parallel,
+        sizes and checksums of results are calculated on the fly.
         """
-        # write first to temporary file, then copy everything in by-extension mode
-        _tmpf = NamedTemporaryFile(mode='w+t')
-        logging.debug("Writing temporary file to '%s'" % _tmpf.name)
-        self.unparse_and_write(self._data, _tmpf)
+        self.close()
+        self.check_create_local_path()
+        _compressor = ParallelCompressor(
+                outputs=dict(map(lambda x: (x, self._local + x), self._ext)),
+                cs_types=self._get_written_checksums_fields())
 
-        for _ext in self._ext:
-            self.close()
-            self.__open(mode='wt', ext=_ext)
-            logging.debug("Writing ext: '%s'" % _ext)
-            _tmpf.seek(0, 0)
-            self._fd.write(_tmpf.read())
-            self.close()
+        try:
+            self.unparse_and_write(self._data, _compressor)
+        except:
+            _compressor.abort()
+            raise
 
-        _tmpf.close()
+        self._written = _compressor.close()
+        logging.debug("Written: '%s'" % self._written)
 
     def get_updated_checksums_sizes(self):
         """
@@ -343,3 +491,44 @@ class RepoFilePackages(RepoFile, DebianMetaParser):
         """
         return deepcopy(self._checksums_u)
 
+
+def rewrite_packages(packages, versions=None, package_filter=None):
+    """
+    Strip old versions and filter packages in all 'Packages' files given, then write them.
+    Packages filter needs all indices to resolve dependencies, so they are read twice
+    in that case: to collect dependencies and to rewrite, keeping single parsed index in memory only.
+    Pool files lists are taken from the same parse the index is rewritten from.
+    :param packages: 'Packages' files synchronized
+    :type packages: list(RepoFilePackages)
+    :param versions: latest versions to leave
+    :type versions: int
+    :param package_filter: packages filter
+    :type package_filter: PackageFilter
+    :return: map index local path (no extension) => pool files list
+    :rtype: dict
+    """
+    if package_filter:
+        for _pkg_file in packages:
+            _pkg_file.open()
+            package_filter.add_index(_pkg_file.get_subfiles())
+            _pkg_file.forget()
+
+        package_filter.resolve()
+
+    _result = dict()
+
+    for _pkg_file in packages:
+        _pkg_file.open()
+
+        if versions:
+            _pkg_file.prune_versions(versions)
+
+        if package_filter:
+            _pkg_file.filter_packages(package_filter.is_selected)
+
+        _pkg_file.close()
+        _pkg_file.save()
+        _result[_pkg_file.get_index_path()] = _pkg_file.get_pool_records()
+        _pkg_file.forget()
+
+    return _result
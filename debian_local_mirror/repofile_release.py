@@ -1,7 +1,8 @@
 from .repofile import RepoFile
 from .repofile_checksum import RepoFileWithCheckSum
-from .repofile_packages import RepoFilePackages
+from .repofile_packages import RepoFilePackages, rewrite_packages
 from .metadata_parser import DebianMetaParser, FormatError
+from .release_index import ReleaseIndex
 from tempfile import TemporaryFile
 import logging
 import re
@@ -14,8 +15,11 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
     """
     Specific release file processor
     """
-    def __init__(self, remote, local, sub):
+    def __init__(self, remote, local, sub, cache=None):
         self._data = None
+        self._headers_only = False
+        self._index = None
+        self._cache = cache
         super().__init__(
                 remote = remote,
                 local = local,
@@ -25,11 +29,30 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
 
         self._set_list_field()
 
+    @property
+    def _index(self):
+        """
+        Files index, checksums are parsed on first access if header fields have been parsed only
+        """
+        if self._index_value is None and self._headers_only:
+            logging.debug("Checksums requested for '%s', parsing it fully" % self._local)
+            self.open()
+
+        return self._index_value
+
+    @_index.setter
+    def _index(self, value):
+        self._index_value = value
+
     def get_pure_fd(self):
         """
         Return file descriptor for copying data part
         File have to be opened prior to call this
         """
+        if not self._fd:
+            # parsed data was taken from cache
+            self._open_pure()
+
         return self._fd
 
     def get_signature(self):
@@ -58,7 +81,8 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
 
     def _convert_checksums(self, data):
         """
-        Release-specific parsing of checksums list
+        Release-specific parsing of checksums list: all fields are converted to single index,
+        values of fields are replaced with views of it
         :param data: intermediate parsing result
         :type data: dict
         :return: modified data
@@ -69,28 +93,39 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
 
         _split_re = re.compile('\s+')
         logging.debug("Converting checksums fields: %s" % ', '.join(self._checksums_fields))
+        _index = ReleaseIndex(
+                fields=list(filter(lambda x: data.get(x), self._checksums_fields)),
+                architectures=data.get("Architectures"))
 
-        for _key in self._checksums_fields:
-            _value = data.get(_key)
-
-            if not _value:
-                continue
-
-            _nval = list()
-
-            for _tval in _value:
+        for _key in _index.fields():
+            for _tval in data.get(_key):
                 (_hash, _size, _path) = _split_re.split(_tval, 2)
 
                 if _path in ["Release", "Release.gpg", "InRelease"]:
                     logging.warning("File '%s' includes checksums for itself, and it will be skipped" % self._local)
                     continue
 
-                _nval.append({"hash": _hash, "Size": int(_size), "Filename": _path})
+                try:
+                    _index.add(_path, int(_size), _key, _hash)
+                except ValueError as _e:
+                    raise ValueError("%s in '%s'" % (_e, self._local))
 
-            data[_key] = _nval
-        
+        self._attach_index(data, _index)
         return data
 
+    def _attach_index(self, data, index):
+        """
+        Set checksums fields values to views of index given
+        :param data: parsed data
+        :type data: dict
+        :param index: files index
+        :type index: ReleaseIndex
+        """
+        for _field in index.fields():
+            data[_field] = index.get_field(_field)
+
+        self._index = index
+
     def _convert_components(self, data_d):
         """
         Remove subpaths from 'Components' section list (provided by some security servers'
@@ -103,26 +138,113 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
         data_d["Components"] = list(filter(lambda x: isinstance(x, str) and len(x)>0, data_d.get("Components")))
         return data_d
 
-    def parse(self):
+    def parse(self, stop_keys=None):
         """
         Overrides general 'parse'
         to convert list of files to processable something.
+        :param stop_keys: stop parsing at any of these keys, checksums are not converted then
+        :type stop_keys: list(str)
         """
-        _data = self._convert_checksums(super().parse())
-        _data = self._convert_components(_data)
+        _data = self._convert_components(super().parse(stop_keys=stop_keys))
+
+        if stop_keys:
+            return _data
+
+        _data = self._convert_checksums(_data)
         return _data
 
-    def open(self, mode="rt"):
+    def _open_headers(self, mode="rt"):
         """
-        Open file
+        Open file descriptor suitable for reading header fields
         :param mode: open mode
         :type mode: str
         """
+        self._open_pure(mode)
+
+    def _open_pure(self, mode="rt"):
+        """
+        Open file descriptor with data part only
+        :param mode: open mode
+        :type mode: str
+        """
+        self._fd = open(self._local, mode)
+
+    def _get_parsed(self):
+        """
+        Return parsed data to be cached
+        """
+        return {"data": self._data, "index": self._index}
+
+    def _set_parsed(self, parsed):
+        """
+        Set parsed data taken from cache
+        """
+        self._data = parsed.get("data")
+        self._index = parsed.get("index")
+
+    def _invalidate_cache(self):
+        """
+        Drop our cached data after the file has been changed
+        """
+        if self._cache is not None:
+            self._cache.invalidate(self._local)
+
+    def open(self, mode="rt", lazy=False):
+        """
+        Open file. Parsed data may be shared with other instances via cache,
+        so it must not be modified. Use '_open_for_update' to get a private copy.
+        :param mode: open mode
+        :type mode: str
+        :param lazy: parse header fields only, checksums are parsed when requested
+        :type lazy: bool
+        """
         self.close()
         self._data = None
-        self._fd = open(self._local, mode)
+        self._headers_only = False
+        _signature = None
+
+        if self._cache is not None:
+            _signature = self._cache.signature(self._local)
+            _parsed = self._cache.get(self._local, _signature)
+
+            if _parsed:
+                self._set_parsed(_parsed)
+                self._count("cache_hits", cache="release")
+                return
+
+        if lazy:
+            self._open_headers(mode)
+            self._data = self.parse(stop_keys=self._checksums_fields)
+            self._index = None
+            self._headers_only = True
+            self.close()
+            return
+
+        self._open_pure(mode)
+        self._data = self.parse()
+
+        if self._cache is not None:
+            self._cache.put(self._local, _signature, self._get_parsed())
+
+    def _open_for_update(self):
+        """
+        Open file and parse it bypassing cache, so data may be modified
+        """
+        self.close()
+        self._data = None
+        self._headers_only = False
+        self._open_pure()
         self._data = self.parse()
 
+    def download(self):
+        """
+        Override to drop cached data for the file replaced
+        """
+        self._invalidate_cache()
+        _result = super().download()
+        self._invalidate_cache()
+        return _result
+
     def is_by_hash(self):
         """
         Return by-has acquiring, boolean
@@ -141,52 +263,61 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
         """
         return list(map(lambda x: posixpath.basename(x), self._data.get('Components')))
 
-    def get_subfiles(self):
+    def _get_subfile(self, filename):
         """
-        Return dictionary with files list
+        Make file data dictionary for a file listed
+        :param filename: path relative to Release
+        :type filename: str
+        :return: {'Size': size, field: hash, 'sub': subpath, 'by-hash': list of link subpaths}
         """
-        _result = dict()
-        for _field in self._checksums_fields:
-            _list = self._data.get(_field)
+        _entry = self._index.get(filename)
+        _result = {"Size": _entry.get("Size"), "sub": self._sub[:-1] + filename.split(posixpath.sep)}
+        logging.debug("Adding %s as subpath" % posixpath.sep.join(_result["sub"]))
+        _by_hash = self.is_by_hash()
 
-            if not _list:
-                continue
+        if _by_hash:
+            _result["by-hash"] = list()
 
-            for _fl in _list:
-                _key = _fl.get("Filename")
-                _size = _fl.get("Size")
-                _hash = _fl.get("hash")
+        for _field in self._index.fields():
+            _hash = _entry.get("hashes").get(_field)
 
-                if _key not in _result.keys():
-                    _result[_key] = dict()
+            if _hash is None:
+                continue
 
-                if "Size" in _result[_key].keys() and _result[_key]["Size"] != _size:
-                    raise ValueError("Sizes not match for '%s' in '%s'" % (_key,self._local))
+            _result[_field] = _hash
 
-                _result[_key]["Size"] = _size
-                _result[_key][_field] = _hash
+            if not _by_hash:
+                continue
 
-                if "sub" not in _result[_key].keys():
-                    _result[_key]["sub"] = self._sub[:-1] + _key.split(posixpath.sep)
-                    logging.debug("Adding %s as subpath" % posixpath.sep.join(_result[_key]["sub"]))
+            _sub_hl = self._sub[:-1]
+            _ppth_dirname = posixpath.dirname(filename).strip(posixpath.sep)
 
-                if not self.is_by_hash():
-                    continue
+            if posixpath.sep in _ppth_dirname:
+                _sub_hl += _ppth_dirname.split(posixpath.sep)
 
-                if "by-hash" not in _result[_key].keys():
-                    _result[_key]["by-hash"] = list()
+            _sub_hl += ["by-hash", _field, _hash]
 
-                _sub_hl = self._sub[:-1]
-                _ppth_dirname = posixpath.dirname(_key).strip(posixpath.sep)
+            logging.debug("Adding %s as sublink" % posixpath.sep.join(_sub_hl))
 
-                if posixpath.sep in _ppth_dirname:
-                    _sub_hl += _ppth_dirname.split(posixpath.sep)
+            _result["by-hash"].append(_sub_hl)
 
-                _sub_hl += ["by-hash", _field, _hash]
+        return _result
+
+    def get_subfiles(self, metadata_filter=None):
+        """
+        Return dictionary with files list
+        :param metadata_filter: filter to skip files dropped by
+        :type metadata_filter: MetadataFilter
+        """
+        _result = dict()
+        _dropped = metadata_filter.get_dropped(self._index) if metadata_filter else set()
 
-                logging.debug("Adding %s as sublink" % posixpath.sep.join(_sub_hl))
+        for _filename in self._index.filenames():
+            if _filename in _dropped:
+                logging.debug("Skipping '%s' dropped by metadata filter" % _filename)
+                continue
 
-                _result[_key]["by-hash"].append(_sub_hl)
+            _result[_filename] = self._get_subfile(_filename)
 
         return _result
 
@@ -212,7 +343,7 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
         Remove 'Valid-Until' Tag
         Removes signature also
         """
-        self.open()
+        self._open_for_update()
         self.remove_signature()
 
         if "Valid-Until" in self._data.keys():
@@ -236,7 +367,7 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
 
         _packages = dict()
 
-        for _file, _fdata in self.get_subfiles().items():
+        for _file in self._index.select(component=section, kind="Packages"):
             _path, _ext = posixpath.splitext(_file)
             _filename = posixpath.basename(_path)
 
@@ -251,7 +382,7 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
             if _path not in _packages.keys():
                 _packages[_path] = dict()
 
-            _packages[_path][_ext] = _fdata
+            _packages[_path][_ext] = self._get_subfile(_file)
 
         if len(list(_packages.keys())) != 1:
 
@@ -275,9 +406,23 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
         Download all Packages specified here and modify them by trimming old versions of each package.
         Leave 'versions' versions only
         """
+        self.rewrite_packages(versions=versions)
 
-        logging.debug("versions: '%d' for '%s'" % (versions, self._local))
-        self.open()
+    def rewrite_packages(self, versions=None, package_filter=None):
+        """
+        Download all Packages specified here, trim old versions of each package
+        and / or leave packages selected by filter only.
+        :param versions: latest versions to leave
+        :type versions: int
+        :param package_filter: packages filter
+        :type package_filter: PackageFilter
+        :return: map 'Packages' local path (no extension) => pool files list
+        :rtype: dict
+        """
+
+        logging.debug("versions: '%s', filter: %s for '%s'" % (versions, bool(package_filter), self._local))
+        self._open_for_update()
+        _pkg_files = list()
 
         for _section in self._data.get("Components"):
             for _arch in self._data.get("Architectures"):
@@ -287,18 +432,21 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
                     logging.warning("Not found 'Packages' for section '%s', architecture '%s'" % (_section, _arch))
                     continue
 
-                _pkg_file.remove_from_disk()
-
+                # local index is kept if it is the same as remote one, downloaded otherwise
                 if not _pkg_file.synchronize():
-                    logging.error("Unable to synchronize '%s'" % _path)
+                    logging.error("Unable to synchronize '%s'" % ':'.join(_pkg_file.get_local_paths()))
                     continue
 
-                _pkg_file.strip_versions(versions=versions)
-                _checksums_dict = _pkg_file.get_updated_checksums_sizes()
-                self._update_checksums_pkg(_checksums_dict)
+                _pkg_files.append(_pkg_file)
+
+        _result = rewrite_packages(_pkg_files, versions=versions, package_filter=package_filter)
+
+        for _pkg_file in _pkg_files:
+            self._update_checksums_pkg(_pkg_file.get_updated_checksums_sizes())
 
         self.close()
         self.write()
+        return _result
 
     def _update_checksums_pkg(self, checksums_dict):
         """
@@ -314,30 +462,18 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
         update self._data with checksums_dict given - replace filename, size, hash
         This is general version
         """
+        # real key may be different case, thanks to format authors
+        _real_sumtypes = dict(map(lambda x: (x.lower(), x), self._index.fields()))
 
-        for _sumtype in checksums_dict.keys():
-            # real key may be different case, thanks to format authors
-            _real_sumtype = list(filter(lambda x: x.lower() == _sumtype.lower(), self._data.keys()))
+        for _sumtype, _record in checksums_dict.items():
+            _real_sumtype = _real_sumtypes.get(_sumtype.lower())
 
             if not _real_sumtype:
                 logging.debug("No field: '%s' - nothing to update" % (_sumtype)) 
                 continue
 
-            _real_sumtype = _real_sumtype.pop()
-            logging.debug("Real sumtype is '%s' for '%s'" % (_real_sumtype, _sumtype))
-
-            # here we are forced to use direct indexing instead of 'get' because we need an error if
-            # something goes wrong
-            _record = list(filter(lambda x: x.get('Filename') == checksums_dict.get(_sumtype).get('Filename'),
-                self._data.get(_real_sumtype)))
-
-            if _record:
-                logging.debug("Removing record: '%s'" % _record)
-                _record = _record.pop()
-                self._data[_real_sumtype].remove(_record)
-
-            logging.debug("Appending another record: '%s'" % checksums_dict.get(_sumtype))
-            self._data[_real_sumtype].append(checksums_dict.get(_sumtype))
+            logging.debug("Updating record for '%s': '%s'" % (_real_sumtype, _record))
+            self._index.update(_record.get('Filename'), _record.get('Size'), {_real_sumtype: _record.get('hash')})
 
     def write(self):
         """
@@ -348,6 +484,8 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
         with open(self._local, mode="wt") as _fl_out:
             self.unparse_and_write(self._data, _fl_out)
 
+        self._invalidate_cache()
+
     def sign(self, gpg):
         """
         Sign ourselves with gpg object given
@@ -362,6 +500,7 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
             _out = self._local + _ext
             gpg.sign_file(file_path=self._local, signature_output=_out)
 
+        self._invalidate_cache()
         self.open()
 
     def write_signature_footer(self, fd, signature):
@@ -393,6 +532,7 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
             _fd.write(_src_fd.read())
             self.write_signature_footer(_fd, rlfl.get_signature())
         rlfl.close()
+        self._invalidate_cache()
 
     def create(self, distr, mirror, packages):
         """
@@ -420,7 +560,9 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
                 continue
 
             _checksums_fields.append(_cs)
-            self._data[_cs] = list()
+
+        _index = ReleaseIndex(fields=_checksums_fields, architectures=self._data["Architectures"])
+        self._attach_index(self._data, _index)
 
         for _pkg in packages:
             # get relative path
@@ -436,7 +578,8 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
             _repo_file_cs.close()
 
             for _cs in _checksums_fields:
-                self._data[_cs].append(_checksums_dict.get(_cs))
+                _index.add(_checksums_dict.get(_cs).get("Filename"), _checksums_dict.get(_cs).get("Size"), _cs,
+                        _checksums_dict.get(_cs).get("hash"))
 
         self.write()
         self.open()
@@ -448,47 +591,52 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
         :type architectures: list(str)
         """
 
-        self.__strip_parameter(architectures, "Architectures", "all", '-%%s(\.|$|\%s)' % posixpath.sep)
+        self.__strip_parameter(architectures, "Architectures", "all", "arch")
 
     def strip_sections(self, sections):
         """
         Strip unused sections ("Components" key - thanks to authors for nice teminology)
         """
-        self.__strip_parameter(sections, "Components", None, '^%%s\%s' % posixpath.sep)
+        self.__strip_parameter(sections, "Components", None, "component")
 
-    def strip_diff_directories(self):
+    def strip_metadata(self, metadata_filter):
         """
-        Remove all .diff includes
+        Remove records for metadata files dropped by filter
+        :param metadata_filter: metadata filter
+        :type metadata_filter: MetadataFilter
         """
-        logging.debug("Stripping .diffs")
-        self.open()
-        _rg = re.compile('\.diff(\%s|\s|$)' % posixpath.sep)
+        logging.debug("Stripping metadata")
+        self._open_for_update()
+        _dropped = metadata_filter.get_dropped(self._index)
 
-        for _cs_field in self._checksums_fields:
-            logging.debug("Stripping .diff from field '%s'" % _cs_field)
+        for _filename in _dropped:
+            self._index.remove(_filename)
 
-            if not self._data.get(_cs_field):
-                logging.debug("No checksum of type '%s' in '%s' - skipping" % (_cs_field, self._local))
-                continue
-
-            _records_to_remove = list(filter(lambda x: _rg.search(x.get("Filename")), self._data.get(_cs_field)))
-
-            for _record in _records_to_remove:
-                logging.debug("Removing record for '%s' from '%s'" % (_record.get("Filename"), _cs_field))
-                self._data[_cs_field].remove(_record)
+        logging.debug("Removed %d records" % len(_dropped))
+        self.close()
+        self.write()
 
+    def strip_diff_directories(self):
+        """
+        Remove all .diff includes
+        """
+        logging.debug("Stripping .diffs")
+        self._open_for_update()
+        logging.debug("Removed %d records" % self._index.remove_selected(kind="diff"))
         self.close()
         self.write()
 
-    def __strip_parameter(self, args_ls, data_key, add_value, regexp_filter):
+    def __strip_parameter(self, args_ls, data_key, add_value, index_key):
         """
-        Filter self parameter with regular expression template
+        Filter self parameter with files index
+        :param index_key: key of files index to select files by: 'arch' or 'component'
+        :type index_key: str
         """
         if not data_key:
             raise ValueError("Data key not given")
 
-        if not regexp_filter:
-            raise ValueError("Regular expression filter template not specified")
+        if not index_key:
+            raise ValueError("Index key not specified")
 
         if not args_ls:
             raise ValueError("No filter list specified")
@@ -497,7 +645,7 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
             raise TypeError("Filter list arg should be a list of str")
 
         logging.debug("%s to leave: '%s'" % (data_key, args_ls))
-        self.open()
+        self._open_for_update()
         _current_ls = self._data.get(data_key)
 
         if not _current_ls:
@@ -520,32 +668,81 @@ class RepoFileRelease(RepoFile, DebianMetaParser):
 
         logging.debug("'%s' to remove: '%s'" % (data_key, _ls_to_remove))
 
-        for _cs_field in self._checksums_fields:
-            logging.debug("Stripping '%s' from field '%s'" % (data_key, _cs_field))
+        for _parm in _ls_to_remove:
+            logging.debug("Removing files for %s '%s'" % (data_key, _parm))
+            _removed = self._index.remove_selected(**{index_key: _parm})
+            logging.debug("Removed %d records" % _removed)
 
-            if not self._data.get(_cs_field):
-                logging.debug("No checksum of type '%s' in '%s' - skipping" % (_cs_field, self._local))
-                continue
+        # keep order and values added ('all' architecture) as in original
+        self._data[data_key] = list(filter(lambda x: x in _ls_flt, _current_ls))
+        self.close()
+        self.write()
 
-            for _parm in _ls_to_remove:
-                _rg = re.compile(regexp_filter % _parm)
-                logging.debug("Removing files for %s '%s'" % (data_key, _parm))
-                _records_to_remove = list(filter(lambda x: _rg.search(x.get("Filename")), self._data.get(_cs_field)))
+class _ClearsignedReader(object):
+    """
+    Line reader of data part of clear-signed file: armor headers are skipped,
+    reading stops at signature. Files without armor are read as is.
+    """
+    def __init__(self, fd, message_start, signature_start):
+        self._fd = fd
+        self._message_start = message_start
+        self._signature_start = signature_start
+        self._started = False
+        self._finished = False
 
-                for _record in _records_to_remove:
-                    logging.debug("Removing record for '%s' from '%s'" % (_record.get("Filename"), _cs_field))
-                    self._data[_cs_field].remove(_record)
+    def seek(self, offset, whence=0):
+        if offset != 0 or whence != 0:
+            raise NotImplementedError("Only rewinding is supported")
 
-        self._data[data_key] = args_ls
-        self.close()
-        self.write()
+        self._fd.seek(0, 0)
+        self._started = False
+        self._finished = False
+
+    def _start(self):
+        """
+        Skip armor and its headers till the first empty line
+        """
+        self._started = True
+        _line = self._fd.readline()
+
+        if not _line.startswith(self._message_start):
+            logging.debug("File without PGP signature - reading as is")
+            self._fd.seek(0, 0)
+            return
+
+        while True:
+            _line = self._fd.readline()
+
+            if not _line or not _line.strip():
+                return
+
+    def readline(self):
+        if self._finished:
+            return ""
+
+        if not self._started:
+            self._start()
+
+        _line = self._fd.readline()
+
+        if _line.startswith(self._signature_start):
+            self._finished = True
+            return ""
+
+        return _line
+
+    def close(self):
+        self._fd.close()
 
 class RepoFileInRelease(RepoFileRelease):
     """
     Helper to process InRelease file with PGP signature removed
     """
-    def __init__(self, remote, local, sub):
+    def __init__(self, remote, local, sub, cache=None):
         self._data = None
+        self._headers_only = False
+        self._index = None
+        self._cache = cache
         super(RepoFileRelease, self).__init__(
                 remote = remote,
                 local = local,
@@ -561,14 +758,36 @@ class RepoFileInRelease(RepoFileRelease):
     def get_signature(self):
         return self._signature
 
-    def open(self, mode="rt"):
+    def _get_parsed(self):
+        """
+        Override to cache signature along with data
+        """
+        _result = super()._get_parsed()
+        _result["signature"] = self._signature
+        return _result
+
+    def _set_parsed(self, parsed):
+        """
+        Override to take signature from cache also
+        """
+        super()._set_parsed(parsed)
+        self._signature = parsed.get("signature")
+
+    def _open_headers(self, mode="rt"):
+        """
+        Override: read data part of the original file directly, without temporary copy
+        :param mode: open mode (not mandatory for this case, leaved for compatibility)
+        :type mode: str
+        """
+        self._fd = _ClearsignedReader(open(self._local, "r"), self._message_start, self._signature_start)
+
+    def _open_pure(self, mode="rt"):
         """
-        Open file. This version creates a temfile from the original
+        Open file descriptor. This version creates a temfile from the original
         with GPG-related data removed
         :param mode: open mode (not mandatory for this case, leaved for compatibility)
         :type mode: str
         """
-        self._data = None
         self._fd = TemporaryFile(mode='w+')
 
         with open(self._local, "r") as _lfl:
@@ -632,7 +851,6 @@ class RepoFileInRelease(RepoFileRelease):
                 self._fd.write(_lfl.read())
 
         self._fd.seek(0, 0)
-        self._data = self.parse()
 
     def sign(self, gpg):
         """
@@ -642,6 +860,7 @@ class RepoFileInRelease(RepoFileRelease):
         """
         self.close()
         gpg.sign_file(file_path=self._local)
+        self._invalidate_cache()
         self.open()
 
     def write_signature_footer(self, fd, signature):
@@ -0,0 +1,96 @@
+import json
+import logging
+import os
+
+class RunJournal(object):
+    """
+    Append-only journal of tasks completed by a mirror run: Release, indices, pool files,
+    with local paths they have produced.
+    It is kept in mirror state folder until the run is finished, so an interrupted run
+    may be resumed. Every line is a JSON record, partial last line left by a crash is ignored.
+    """
+    def __init__(self, path):
+        """
+        Initialization
+        :param path: journal file path
+        :type path: str
+        """
+        self._path = path
+        self._fd = None
+
+    def load(self):
+        """
+        Read records of the run interrupted
+        :return: list of records, empty if there is no journal
+        """
+        _result = list()
+
+        if not os.path.exists(self._path):
+            return _result
+
+        with open(self._path) as _fl_in:
+            for _line in _fl_in:
+                try:
+                    _result.append(json.loads(_line))
+                except ValueError:
+                    logging.warning("Broken record in journal '%s' ignored" % self._path)
+
+        logging.info("%d records found in journal '%s'" % (len(_result), self._path))
+        return _result
+
+    def get_distributive(self, distr):
+        """
+        Records of a distributive since its last Release task
+        :param distr: distributive name
+        :type distr: str
+        :return: list of records, the first one is Release task, empty if Release has not been done
+        """
+        _result = list()
+
+        for _record in self.load():
+            if _record.get("distr") != distr:
+                continue
+
+            if _record.get("task") == "release":
+                _result = list()
+
+            _result.append(_record)
+
+        if _result and _result[0].get("task") != "release":
+            return list()
+
+        return _result
+
+    def append(self, record):
+        """
+        Record task completed
+        :param record: task record: 'distr', 'task', 'paths' and task-specific data
+        :type record: dict
+        """
+        if not self._fd:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            self._fd = open(self._path, mode='a+')
+
+            # partial record left by a crash is not to break the next one
+            if self._fd.tell():
+                self._fd.seek(self._fd.tell() - 1, os.SEEK_SET)
+
+                if self._fd.read(1) != '\n':
+                    self._fd.write('\n')
+
+        self._fd.write(json.dumps(record) + '\n')
+        self._fd.flush()
+
+    def close(self):
+        if self._fd:
+            self._fd.close()
+            self._fd = None
+
+    def remove(self):
+        """
+        Drop journal of the run finished
+        """
+        self.close()
+
+        if os.path.exists(self._path):
+            os.remove(self._path)
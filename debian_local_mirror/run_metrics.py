@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import threading
+import time
+from tempfile import NamedTemporaryFile
+
+class RunMetrics(object):
+    """
+    Counters, gauges and histograms collected during a single run.
+    Written as Prometheus node-exporter textfile and JSON report.
+    """
+    _prefix = "debian_local_mirror_"
+
+    _help = {
+        "downloaded_bytes": "Bytes downloaded from upstream",
+        "downloaded_files": "Files downloaded from upstream",
+        "download_retries": "Retries made by HTTP layer while downloading",
+        "download_not_found": "Files absent in upstream",
+        "verified_files": "Local files checksums have been verified for",
+        "skipped_files": "Files found valid locally, download skipped",
+        "seeded_files": "Files taken from seed directories instead of downloading",
+        "duplicate_pool_files": "Pool files listed more than once, processed once per run",
+        "resumed_tasks": "Tasks taken from journal of the run interrupted",
+        "skipped_pool_passes": "Pool passes skipped since their Packages index has not been changed",
+        "cache_hits": "Hits of internal caches",
+        "deleted_files": "Obsolete files removed",
+        "by_hash_updates": "'by-hash' objects created or replaced",
+        "upstream_polls": "Conditional requests for upstream Release files",
+        "download_duration_seconds": "Duration of single file download",
+        "download_throughput_bytes_per_second": "Throughput of single file download",
+        "phase_wall_seconds": "Wall time spent in a phase",
+        "phase_cpu_seconds": "CPU time spent in a phase",
+        "run_duration_seconds": "Wall time of the whole run",
+        "run_finish_timestamp_seconds": "Time the run finished at",
+        "run_success": "Whether the run has finished without errors"
+    }
+
+    _buckets = {
+        "download_duration_seconds": [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0],
+        "download_throughput_bytes_per_second": [1e4, 1e5, 1e6, 1e7, 1e8, 1e9]
+    }
+
+    def __init__(self):
+        """
+        Initialization
+        """
+        self._lock = threading.Lock()
+        self._counters = dict()
+        self._gauges = dict()
+        self._histograms = dict()
+        self._start = time.time()
+
+    def _key(self, name, labels):
+        """
+        Make hashable key for metric with labels
+        """
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increase a counter
+        :param name: counter name
+        :type name: str
+        :param value: value to add
+        :type value: int, float
+        """
+        _key = self._key(name, labels)
+
+        with self._lock:
+            self._counters[_key] = self._counters.get(_key, 0) + value
+
+    def set(self, name, value, **labels):
+        """
+        Set a gauge
+        :param name: gauge name
+        :type name: str
+        :param value: value to set
+        :type value: int, float
+        """
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        """
+        Add an observation to a histogram
+        :param name: histogram name
+        :type name: str
+        :param value: observed value
+        :type value: int, float
+        """
+        _key = self._key(name, labels)
+        _buckets = self._buckets.get(name)
+
+        if not _buckets:
+            raise ValueError("Histogram '%s' has no buckets defined" % name)
+
+        with self._lock:
+            if _key not in self._histograms:
+                self._histograms[_key] = {"buckets": [0] * len(_buckets), "count": 0, "sum": 0.0}
+
+            _hist = self._histograms[_key]
+            _hist["count"] += 1
+            _hist["sum"] += value
+
+            for _i, _bound in enumerate(_buckets):
+                if value <= _bound:
+                    _hist["buckets"][_i] += 1
+
+    def set_phases(self, phases):
+        """
+        Set phase durations gauges
+        :param phases: phase records as returned by PhaseProfiler.get_report
+        :type phases: list(dict)
+        """
+        for _phase in phases:
+            _labels = {"mirror": _phase.get("mirror") or "", "distributive": _phase.get("distributive") or "",
+                    "phase": _phase.get("phase")}
+            self.set("phase_wall_seconds", _phase.get("wall"), **_labels)
+            self.set("phase_cpu_seconds", _phase.get("cpu"), **_labels)
+
+    def start(self):
+        """
+        Mark start of a run, for processes doing several runs
+        """
+        self._start = time.time()
+
+    def finish(self, success):
+        """
+        Set run-wide gauges
+        :param success: run result
+        :type success: bool
+        """
+        _now = time.time()
+        self.set("run_duration_seconds", _now - self._start)
+        self.set("run_finish_timestamp_seconds", _now)
+        self.set("run_success", 1 if success else 0)
+
+    def _format_labels(self, labels, extra=None):
+        """
+        Format labels in Prometheus exposition format
+        """
+        _labels = list(labels)
+
+        if extra:
+            _labels.append(extra)
+
+        if not _labels:
+            return ""
+
+        return "{%s}" % ','.join(map(lambda x: '%s="%s"' % (x[0],
+            str(x[1]).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')), _labels))
+
+    def _format_number(self, value):
+        """
+        Format a value in Prometheus exposition format
+        """
+        if isinstance(value, float) and value == float("inf"):
+            return "+Inf"
+
+        return repr(value)
+
+    def _group(self, values):
+        """
+        Group metrics with labels by name
+        """
+        _result = dict()
+
+        for (_name, _labels), _value in sorted(values.items(), key=lambda x: (x[0][0], x[0][1])):
+            _result.setdefault(_name, list()).append((_labels, _value))
+
+        return _result
+
+    def get_textfile(self):
+        """
+        Return metrics in Prometheus exposition format
+        """
+        _lines = list()
+
+        with self._lock:
+            for _name, _values in self._group(self._counters).items():
+                _lines.append("# HELP %s%s_total %s" % (self._prefix, _name, self._help.get(_name, _name)))
+                _lines.append("# TYPE %s%s_total counter" % (self._prefix, _name))
+
+                for _labels, _value in _values:
+                    _lines.append("%s%s_total%s %s" % (self._prefix, _name, self._format_labels(_labels),
+                        self._format_number(_value)))
+
+            for _name, _values in self._group(self._gauges).items():
+                _lines.append("# HELP %s%s %s" % (self._prefix, _name, self._help.get(_name, _name)))
+                _lines.append("# TYPE %s%s gauge" % (self._prefix, _name))
+
+                for _labels, _value in _values:
+                    _lines.append("%s%s%s %s" % (self._prefix, _name, self._format_labels(_labels),
+                        self._format_number(_value)))
+
+            for _name, _values in self._group(self._histograms).items():
+                _lines.append("# HELP %s%s %s" % (self._prefix, _name, self._help.get(_name, _name)))
+                _lines.append("# TYPE %s%s histogram" % (self._prefix, _name))
+
+                for _labels, _hist in _values:
+                    for _bound, _count in zip(self._buckets.get(_name) + [float("inf")],
+                            _hist["buckets"] + [_hist["count"]]):
+                        _lines.append("%s%s_bucket%s %d" % (self._prefix, _name,
+                            self._format_labels(_labels, ("le", self._format_number(_bound))), _count))
+
+                    _lines.append("%s%s_sum%s %s" % (self._prefix, _name, self._format_labels(_labels),
+                        self._format_number(_hist["sum"])))
+                    _lines.append("%s%s_count%s %d" % (self._prefix, _name, self._format_labels(_labels),
+                        _hist["count"]))
+
+        return '\n'.join(_lines) + '\n'
+
+    def get_report(self):
+        """
+        Return metrics as JSON-serializable dictionary
+        """
+        _result = {"counters": list(), "gauges": list(), "histograms": list()}
+
+        with self._lock:
+            for (_name, _labels), _value in sorted(self._counters.items()):
+                _result["counters"].append({"name": _name, "labels": dict(_labels), "value": _value})
+
+            for (_name, _labels), _value in sorted(self._gauges.items()):
+                _result["gauges"].append({"name": _name, "labels": dict(_labels), "value": _value})
+
+            for (_name, _labels), _hist in sorted(self._histograms.items(), key=lambda x: x[0]):
+                _result["histograms"].append({"name": _name, "labels": dict(_labels),
+                    "buckets": dict(zip(map(str, self._buckets.get(_name)), _hist["buckets"])),
+                    "count": _hist["count"], "sum": _hist["sum"]})
+
+        return _result
+
+    def _write_atomic(self, path, content):
+        """
+        Write file via temporary one in the same folder, so readers never get partial content
+        """
+        path = os.path.abspath(path)
+        _tmpf = NamedTemporaryFile(mode='wt', dir=os.path.dirname(path), prefix=".metrics_", delete=False)
+
+        try:
+            _tmpf.write(content)
+            _tmpf.close()
+            os.chmod(_tmpf.name, 0o644)
+            os.replace(_tmpf.name, path)
+        except:
+            _tmpf.close()
+            os.remove(_tmpf.name)
+            raise
+
+        logging.info("Metrics written to '%s'" % path)
+
+    def write_textfile(self, path):
+        """
+        Write Prometheus node-exporter textfile
+        :param path: path to '.prom' file
+        :type path: str
+        """
+        self._write_atomic(path, self.get_textfile())
+
+    def write_json(self, path):
+        """
+        Write JSON report
+        :param path: path to JSON file
+        :type path: str
+        """
+        self._write_atomic(path, json.dumps(self.get_report(), indent=4))
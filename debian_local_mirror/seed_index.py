@@ -0,0 +1,142 @@
+import logging
+import os
+import threading
+from .repofile_checksum import new_checksum
+from .local_transfer import transfer
+
+class SeedIndex(object):
+    """
+    Files already present on local disks, to be taken instead of downloading:
+    other mirror trees, APT archives cache, old snapshots.
+    Directories are indexed by file name and size on first lookup, checksums
+    are calculated for candidates only and kept for the whole run.
+    """
+    _checksums_fields = ["MD5sum", "MD5Sum", "SHA1", "SHA256", "SHA512"]
+
+    def __init__(self, directories, methods=None):
+        """
+        Initialization
+        :param directories: seed directories, searched recursively
+        :type directories: list(str)
+        :param methods: ways to put seed files to mirror, in order of preference:
+            'hardlink', 'reflink', 'copy', all by default
+        :type methods: list(str)
+        """
+        self._directories = list(map(lambda x: os.path.abspath(x), directories))
+        self._methods = methods
+        self._files = None
+        self._checksums = dict()
+        self._lock = threading.Lock()
+
+    def _build(self):
+        """
+        Index all seed directories by (name, size)
+        """
+        _files = dict()
+
+        for _directory in self._directories:
+            if not os.path.isdir(_directory):
+                logging.warning("Seed directory '%s' does not exist" % _directory)
+                continue
+
+            for _root, _dirs, _names in os.walk(_directory):
+                for _name in _names:
+                    _path = os.path.join(_root, _name)
+
+                    if not os.path.isfile(_path):
+                        continue
+
+                    _files.setdefault((_name, os.path.getsize(_path)), list()).append(_path)
+
+        logging.info("%d files indexed in seed directories" % sum(map(len, _files.values())))
+        return _files
+
+    def _get_checksums(self, path, fields):
+        """
+        Calculate checksums of a file, all types at one read
+        :param path: file path
+        :type path: str
+        :param fields: checksums fields as named in metadata
+        :type fields: list(str)
+        :return: field => hex digest
+        """
+        with self._lock:
+            _cached = self._checksums.setdefault(path, dict())
+            _missing = list(filter(lambda x: x not in _cached, fields))
+
+        if _missing:
+            _hashobjs = dict(map(lambda x: (x, new_checksum(x)), _missing))
+
+            with open(path, "rb") as _fl_in:
+                while True:
+                    _chunk = _fl_in.read(1024 * 1024)
+
+                    if not _chunk:
+                        break
+
+                    for _hashobj in _hashobjs.values():
+                        _hashobj.update(_chunk)
+
+            with self._lock:
+                _cached.update(map(lambda x: (x[0], x[1].hexdigest()), _hashobjs.items()))
+
+        return dict(map(lambda x: (x, _cached.get(x)), fields))
+
+    def find(self, name, size, fdict):
+        """
+        Find a seed file matching all checksums given
+        :param name: file name
+        :type name: str
+        :param size: file size
+        :type size: int
+        :param fdict: file data dictionary with checksums fields
+        :type fdict: dict
+        :return: path or None
+        """
+        with self._lock:
+            if self._files is None:
+                self._files = self._build()
+
+            _candidates = list(self._files.get((name, size), list()))
+
+        _fields = list(filter(lambda x: fdict.get(x), self._checksums_fields))
+
+        if not _fields:
+            return None
+
+        for _path in _candidates:
+            try:
+                _checksums = self._get_checksums(_path, _fields)
+            except OSError as _e:
+                logging.debug("Seed '%s' is unreadable: %s" % (_path, _e))
+                continue
+
+            if all(map(lambda x: _checksums.get(x) == fdict.get(x), _fields)):
+                return _path
+
+            logging.debug("Seed '%s' has the same name and size, but checksums differ" % _path)
+
+        return None
+
+    def take(self, name, size, fdict, path):
+        """
+        Put a seed file matching all checksums given to the path
+        :param name: file name
+        :type name: str
+        :param size: file size
+        :type size: int
+        :param fdict: file data dictionary with checksums fields
+        :type fdict: dict
+        :param path: local path, file existing there is replaced only if a seed is found
+        :type path: str
+        :return: method used or None if no seed found
+        """
+        _seed = self.find(name, size, fdict)
+
+        if not _seed:
+            return None
+
+        if os.path.lexists(path):
+            os.remove(path)
+
+        return transfer(_seed, path, allowed=self._methods)
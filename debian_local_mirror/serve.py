@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+from .mirror_config import MirrorsConfig
+from .mirror_server import MirrorServer
+import argparse
+import logging
+import os
+import sys
+
+def main():
+    """
+    Serve local mirrors over HTTP, fetching files missing from upstream on demand
+    """
+    _ap = argparse.ArgumentParser(description="Serve local mirrors over HTTP as read-through cache of upstream")
+    _ap.add_argument("--log-level", dest="log_level", type=int, default=50)
+    _ap.add_argument("-c", "--config", dest="config_fl", required=True)
+    _ap.add_argument("-a", "--address", dest="address", default="", help="Address to listen on, all by default")
+    _ap.add_argument("-p", "--port", dest="port", type=int, default=8080, help="Port to listen on")
+    _ap.add_argument("-w", "--workers", dest="workers", type=int, default=4,
+            help="Number of files fetched from upstream in parallel")
+    _ag = _ap.parse_args()
+    _cfg = os.path.abspath(_ag.config_fl)
+
+    logging.basicConfig(
+        format="%(asctime)s: %(levelname)s: %(filename)s: %(funcName)s: %(lineno)d: %(message)s",
+        level=_ag.log_level)
+
+    logging.info("Log level is set to %d" % _ag.log_level)
+    logging.info("Loading configuration: '%s'" % _cfg)
+
+    try:
+        MirrorServer(MirrorsConfig(_cfg), workers=_ag.workers).serve(address=_ag.address, port=_ag.port)
+    except KeyboardInterrupt:
+        logging.info("Interrupted")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+from .mirror_shards import ShardPlanner, ShardWorker, ShardMerger
+from multiprocessing import Process
+import argparse
+import logging
+import sys
+
+def _work(work_dir, shard):
+    """
+    Worker process entry point
+    :return: exit code
+    """
+    ShardWorker(work_dir, shard).work()
+
+def _add_processor_arguments(parser):
+    """
+    Arguments necessary for planning, the same as for mirroring
+    :param parser: parser to add arguments to
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument("-c", "--config", dest="config_fl", required=True, help="JSON mirror configuration")
+    parser.add_argument("-n", "--shards", dest="shards", type=int, required=True, help="Number of shards")
+    parser.add_argument("--remove-valid-until", dest="remove_valid_until", default=False, action='store_true',
+            help="Remove Valid-Until limit for Release and InRelease files, resigning with GPG key is necessary")
+    parser.add_argument("--resign-key", dest="resign_key", default=None,
+            help="Path to private GPG key for resigning Release and InRelease files")
+    parser.add_argument("--key-passphrase", dest="key_passphrase", default=None,
+            help="Passphrase for GPG key for resigning Release and InRelease files")
+
+def _run_local(args):
+    """
+    Plan, synchronize all shards by local processes and merge
+    :param args: command line arguments
+    :type args: argparse.Namespace
+    :return: number of failed pool files
+    """
+    ShardPlanner(args, args.work_dir, args.shards).plan()
+    _workers = list(map(lambda x: Process(target=_work, args=(args.work_dir, x)), range(args.shards)))
+
+    for _worker in _workers:
+        _worker.start()
+
+    for _worker in _workers:
+        _worker.join()
+
+    for _shard, _worker in enumerate(_workers):
+        if _worker.exitcode:
+            logging.error("Worker of shard %d failed with exit code %d" % (_shard, _worker.exitcode))
+
+    return ShardMerger(args.work_dir).merge()
+
+def main():
+    """
+    Sharded mirroring: coordinator plans shards, workers synchronize them, final step merges and publishes
+    """
+    _ap = argparse.ArgumentParser(description="Create local debian mirror by several workers sharing destination")
+    _ap.add_argument("--log-level", dest="log_level", type=int, default=50, help="Logging level")
+    _ap.add_argument("-d", "--work-dir", dest="work_dir", required=True,
+            help="Folder shared by coordinator and workers, on the same filesystem as destinations preferably")
+    _sp = _ap.add_subparsers(dest="command")
+    _sp.required = True
+    _add_processor_arguments(_sp.add_parser("plan", help="Synchronize metadata to staging and split pool into shards"))
+    _sp.add_parser("work", help="Synchronize pool files of a shard").add_argument(
+            "-s", "--shard", dest="shard", type=int, required=True, help="Shard number, starting from 0")
+    _sp.add_parser("merge", help="Check all shards are done, publish metadata and remove trash")
+    _add_processor_arguments(_sp.add_parser("run-local", help="Plan, synchronize shards by local processes and merge"))
+    _ag = _ap.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s: %(levelname)s: %(filename)s: %(funcName)s: %(lineno)d: %(message)s",
+        level=_ag.log_level)
+
+    logging.info("Log level is set to %d" % _ag.log_level)
+
+    if getattr(_ag, "remove_valid_until", False) and not _ag.resign_key:
+        raise ValueError("'--resign-key' is necessary with '--remove-valid-until'")
+
+    if getattr(_ag, "resign_key", None) and not _ag.key_passphrase:
+        raise ValueError("--resign-key' is useless without '--key-passphrase'")
+
+    if _ag.command == "plan":
+        ShardPlanner(_ag, _ag.work_dir, _ag.shards).plan()
+        return 0
+
+    if _ag.command == "work":
+        _manifest = ShardWorker(_ag.work_dir, _ag.shard).work()
+        return 1 if any(map(lambda x: x.get("failed"), _manifest.get("mirrors").values())) else 0
+
+    if _ag.command == "merge":
+        return 1 if ShardMerger(_ag.work_dir).merge() else 0
+
+    return 1 if _run_local(_ag) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import shutil
+import sys
+import unittest
+from tempfile import TemporaryDirectory
+from unittest import mock
+from ..packages_index import PackagesIndex, PackagesIndexCache
+
+def _make_record(name, version, size="1234", digests=("MD5sum", "SHA256")):
+    """
+    Make parsed 'Packages' record
+    """
+    _data = ("%s_%s" % (name, version)).encode("utf-8")
+    _result = {
+            "Package": name,
+            "Version": version,
+            "Filename": "pool/main/%s/%s/%s_%s_amd64.deb" % (name[0], name, name, version)}
+
+    if size is not None:
+        _result["Size"] = size
+
+    if "MD5sum" in digests:
+        _result["MD5sum"] = hashlib.md5(_data).hexdigest()
+
+    if "SHA256" in digests:
+        _result["SHA256"] = hashlib.sha256(_data).hexdigest()
+
+    return _result
+
+class PackagesIndexTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self._path = os.path.join(self._tmp.name, "test.pidx")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _write_read(self, records):
+        PackagesIndex.write(self._path, "key", records)
+        _index = PackagesIndex(self._path)
+        _result = list(_index)
+        _index.close()
+        return _result
+
+    def test_round_trip(self):
+        _records = list(map(lambda x: _make_record("pkg%d" % x, "1.%d" % x, str(x * 100 + 1)), range(10)))
+        _records.append(_make_record("ünicode", "2:1.0~rc1-1"))
+        _result = self._write_read(_records)
+        self.assertEqual(len(_records), len(_result))
+
+        for _record, _read in zip(_records, _result):
+            _expected = dict(_record)
+            _expected["sub"] = _record.get("Filename").split("/")
+            self.assertEqual(_expected, _read)
+
+    def test_key_and_length(self):
+        PackagesIndex.write(self._path, "abc", [_make_record("a", "1"), _make_record("b", "1")])
+        _index = PackagesIndex(self._path)
+        self.assertEqual("abc", _index.get_key())
+        self.assertEqual(2, len(_index))
+        self.assertEqual("b", _index.get_record(1).get("Package"))
+        _index.close()
+
+    def test_empty(self):
+        self.assertEqual(list(), self._write_read(list()))
+
+    def test_no_size(self):
+        _result = self._write_read([_make_record("a", "1", size=None), _make_record("b", "1", size="0")])
+        self.assertNotIn("Size", _result[0])
+        self.assertEqual("0", _result[1].get("Size"))
+
+    def test_digest_dropped(self):
+        _result = self._write_read([_make_record("a", "1"), _make_record("b", "1", digests=("MD5sum",))])
+        self.assertTrue(all(map(lambda x: "SHA256" not in x, _result)))
+        self.assertTrue(all(map(lambda x: "MD5sum" in x, _result)))
+
+    def test_wrong_format(self):
+        with open(self._path, "wb") as _fl_out:
+            _fl_out.write(b"NOTANIDX" + b"\0" * 64)
+
+        self.assertRaises(ValueError, PackagesIndex, self._path)
+
+class PackagesIndexCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self._cache = PackagesIndexCache(self._tmp.name)
+        self._records = [_make_record("a", "1"), _make_record("b", "2")]
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_put_get(self):
+        self.assertIsNone(self._cache.get("key"))
+        self._cache.put("key", self._records).close()
+        _index = self._cache.get("key")
+        self.assertIsNotNone(_index)
+        self.assertEqual(["a", "b"], list(map(lambda x: x.get("Package"), _index)))
+        _index.close()
+
+    def test_wrong_key(self):
+        self._cache.put("key", self._records).close()
+        shutil.copy(self._cache._get_path("key"), self._cache._get_path("other"))
+        self.assertIsNone(self._cache.get("other"))
+
+    def test_truncated(self):
+        self._cache.put("key", self._records).close()
+
+        for _length in [4, 20]:
+            with open(self._cache._get_path("key"), "r+b") as _fl:
+                _fl.truncate(_length)
+
+            self.assertIsNone(self._cache.get("key"))
+
+    def test_foreign_byteorder(self):
+        _foreign = "big" if sys.byteorder == "little" else "little"
+
+        with mock.patch.object(sys, "byteorder", _foreign):
+            PackagesIndex.write(self._cache._get_path("key"), "key", self._records)
+
+        self.assertIsNone(self._cache.get("key"))
+
+    def test_read_only(self):
+        self._cache.put("key", self._records).close()
+
+        with mock.patch.object(os, "utime", side_effect=PermissionError("read-only")):
+            _index = self._cache.get("key")
+
+        self.assertEqual(2, len(_index))
+        _index.close()
+
+    def test_prune(self):
+        self._cache.put("old", self._records).close()
+        self._cache.put("new", self._records).close()
+        os.utime(self._cache._get_path("old"), (0, 0))
+        self._cache.prune()
+        self.assertFalse(os.path.exists(self._cache._get_path("old")))
+        self.assertTrue(os.path.exists(self._cache._get_path("new")))
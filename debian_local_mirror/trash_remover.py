@@ -11,18 +11,22 @@ class TrashRemover(object):
     Special processing of temporary files
     """
 
-    def __init__(self, fl_list, src_dir):
+    def __init__(self, fl_list, src_dir, exclude=None):
         """
         Initailization
         :param fl_list: temporary file list
         :type fl_list: file-like object open in read text mode
         :param src_dir: source directory to search files in
         :type src_dir: str
+        :param exclude: directories never considered as trash
+        :type exclude: list(str)
         """
 
         self._fl_should = fl_list
         self._fl_current = None
         self._src_dir = os.path.abspath(src_dir)
+        self._removed = 0
+        self._exclude = list(map(lambda x: os.path.abspath(x), exclude or list()))
 
     def _sort_compare_lines(self, lines, fl_out=None, compare=False, first_chunk=False):
         """
@@ -194,6 +198,7 @@ class TrashRemover(object):
 
             logging.info("Removing obsolete '%s'" % _pth_current)
             os.remove(_pth_current)
+            self._removed += 1
             _pth_current = None
 
         self._remove_empty_dirs(self._src_dir)
@@ -226,6 +231,8 @@ class TrashRemover(object):
         self._fl_current.seek(0, 0)
 
         for _root, _dirs, _files in os.walk(self._src_dir):
+            _dirs[:] = list(filter(lambda x: os.path.join(_root, x) not in self._exclude, _dirs))
+
             for _file in _files:
                 _fullpth = os.path.join(_root, _file)
                 logging.log(3, "Append current file: '%s'" % _fullpth)
@@ -242,3 +249,9 @@ class TrashRemover(object):
     def get_temp(self):
         return self._fl_should
 
+    def get_removed_count(self):
+        """
+        Return number of obsolete files removed
+        """
+        return self._removed
+
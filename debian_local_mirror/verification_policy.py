@@ -0,0 +1,121 @@
+import logging
+import os
+import random
+import threading
+
+class VerificationPolicy(object):
+    """
+    How local files are verified before deciding to download them, per kind of files:
+        'full': all checksums given,
+        'strongest': the strongest checksum given only,
+        'size': size only,
+        'size+mtime': size, and the file is not modified since it has been verified last time
+            (the strongest checksum is verified otherwise).
+    Pool files are immutable by name in Debian archive, so weaker modes are suitable for them.
+    Full verification is forced every 'full_every' run, and for random 'sample' part of pool files.
+    """
+    modes = ["full", "strongest", "size", "size+mtime"]
+    kinds = ["pool", "indices"]
+    _state_name = "verified.json"
+
+    def __init__(self, cfg, state):
+        """
+        Initialization
+        :param cfg: policy configuration:
+            {"pool": mode, "indices": mode, "full_every": number of runs, "sample": part of pool files}
+        :type cfg: dict
+        :param state: mirror state to keep runs counter and files verified in
+        :type state: MirrorState
+        """
+        self._modes = dict(map(lambda x: (x, cfg.get(x, "full")), self.kinds))
+        self._full_every = cfg.get("full_every")
+        self._sample = cfg.get("sample", 0)
+        self._state = state
+        self._lock = threading.Lock()
+        _data = self._state.load(self._state_name, dict())
+        self._run = _data.get("run", 0) + 1
+        self._verified = _data.get("files", dict())
+        self._touched = set()
+        self._full = bool(self._full_every) and self._run % self._full_every == 0
+
+        if self._full:
+            logging.info("Run %d: full verification forced" % self._run)
+
+    def is_full_run(self):
+        """
+        Whether full verification is forced for this run
+        """
+        return self._full
+
+    def is_sampled(self):
+        """
+        Whether a part of pool not verified at all otherwise is to be verified, chosen randomly as 'sample'
+        """
+        return bool(self._sample) and random.random() < self._sample
+
+    def get_mode(self, kind):
+        """
+        Return verification mode for a file
+        :param kind: 'pool' or 'indices'
+        :type kind: str
+        """
+        if self._full:
+            return "full"
+
+        _mode = self._modes.get(kind, "full")
+
+        if kind == "pool" and _mode != "full" and self._sample and random.random() < self._sample:
+            return "full"
+
+        return _mode
+
+    def _get_signature(self, path):
+        _st = os.stat(path)
+        return [_st.st_size, _st.st_mtime_ns]
+
+    def is_unchanged(self, path, digest=None):
+        """
+        Check if a file has not been modified since it has been verified
+        :param path: local path
+        :type path: str
+        :param digest: the strongest checksum expected, file is to be verified against it last time
+        :type digest: str
+        """
+        with self._lock:
+            _verified = self._verified.get(path)
+
+        if not _verified or _verified[:2] != self._get_signature(path):
+            return False
+
+        # content may be changed upstream keeping size, records of previous versions have no digest
+        if digest is not None and _verified[2:] != [digest]:
+            return False
+
+        with self._lock:
+            self._touched.add(path)
+
+        return True
+
+    def set_verified(self, path, digest=None):
+        """
+        Remember a file has been verified
+        :param path: local path
+        :type path: str
+        :param digest: the strongest checksum verified
+        :type digest: str
+        """
+        _signature = self._get_signature(path) + ([digest] if digest else list())
+
+        with self._lock:
+            self._verified[path] = _signature
+            self._touched.add(path)
+
+    def save(self):
+        """
+        Store runs counter and files verified.
+        Files not seen in this run are kept while they exist, since not all distributives may be processed
+        """
+        with self._lock:
+            _files = dict(filter(lambda x: x[0] in self._touched or os.path.exists(x[0]), self._verified.items()))
+
+        self._state.save(self._state_name, {"run": self._run, "files": _files})
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+from .mirror_config import MirrorsConfig
+from .mirror_verifier import MirrorVerifier
+import argparse
+import json
+import logging
+import os
+import sys
+
+def main():
+    """
+    Verify local mirrors offline
+    """
+    _ap = argparse.ArgumentParser(description="Verify local mirrors without network: missing, corrupt and orphaned files")
+    _ap.add_argument("--log-level", dest="log_level", type=int, default=50)
+    _ap.add_argument("-c", "--config", dest="config_fl", required=True)
+    _ap.add_argument("-w", "--workers", dest="workers", type=int, default=None,
+            help="Number of verification processes, detected by cores and destination disk by default")
+    _ap.add_argument("-q", "--quarantine", dest="quarantine", default=None,
+            help="Move corrupt and orphaned files to this folder")
+    _ap.add_argument("-o", "--output", dest="out_fl", default=None, help="Write JSON report to this file")
+    _ag = _ap.parse_args()
+    _cfg = os.path.abspath(_ag.config_fl)
+
+    logging.basicConfig(
+        format="%(asctime)s: %(levelname)s: %(filename)s: %(funcName)s: %(lineno)d: %(message)s",
+        level=_ag.log_level)
+
+    logging.info("Log level is set to %d" % _ag.log_level)
+    logging.info("Loading configuration: '%s'" % _cfg)
+
+    _report = MirrorVerifier(MirrorsConfig(_cfg), workers=_ag.workers, quarantine=_ag.quarantine).verify()
+    _problems = 0
+
+    for _mirror in _report:
+        sys.stdout.write("%s: checked %d, missing %d, corrupt %d, orphaned %d\n" % (
+            _mirror.get("destination"), _mirror.get("checked"),
+            len(_mirror.get("missing")), len(_mirror.get("corrupt")), len(_mirror.get("orphaned"))))
+        _problems += len(_mirror.get("missing")) + len(_mirror.get("corrupt")) + len(_mirror.get("orphaned"))
+
+    if _ag.out_fl:
+        with open(_ag.out_fl, 'w') as _fl_out:
+            json.dump(_report, _fl_out, indent=4)
+
+    return 1 if _problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())